@@ -1,7 +1,26 @@
+import os
+import sys
 import json
 import argparse
+import statistics
 import boto3
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tools'))
+from upload import upload_data_sources  # noqa: E402
+
+HISTORY_FILE = 'ingestion_history.jsonl'
+# 直近何回分の同期と比較するか
+HISTORY_WINDOW = 5
+# 過去の中央値からこの割合以上スループットが落ちたら警告する
+THROUGHPUT_DROP_THRESHOLD = 0.2
+# Agent と Alias の準備完了を待つ間隔と上限 (秒)
+READY_POLL_INTERVAL = 5
+READY_TIMEOUT = 600
+# 作成・更新中で、待てば PREPARED になる状態
+AGENT_PENDING_STATUSES = ['CREATING', 'PREPARING', 'UPDATING', 'VERSIONING']
+ALIAS_PENDING_STATUSES = ['CREATING', 'UPDATING']
 
 
 class AwsOperations:
@@ -23,6 +42,28 @@ class AwsOperations:
             required=True,
             help='region',
         )
+        parser.add_argument(
+            '--history',
+            default=HISTORY_FILE,
+            help='Ingestion job history file (JSON Lines)',
+        )
+        parser.add_argument(
+            '--max-workers',
+            type=int,
+            default=4,
+            help='Number of concurrent agent readiness checks and uploads',
+        )
+        parser.add_argument(
+            '--ready-timeout',
+            type=int,
+            default=READY_TIMEOUT,
+            help='Seconds to wait for each agent and alias to become PREPARED',
+        )
+        parser.add_argument(
+            '--upload',
+            action='store_true',
+            help='Upload changed data-source files before ingestion and only sync changed data sources',
+        )
         return parser.parse_args()
 
     def get_cloudformation_outputs(self, stack_name):
@@ -30,7 +71,7 @@ class AwsOperations:
         response = cfn.describe_stacks(StackName=stack_name)
         return response['Stacks'][0]['Outputs']
 
-    def start_ingestion_job(self, knowledge_base_id, data_source_id):
+    def start_ingestion_job(self, knowledge_base_id, data_source_id, agent_name=None):
         bra = self.session.client('bedrock-agent', region_name=self.region)
         response = bra.start_ingestion_job(
             knowledgeBaseId=knowledge_base_id,
@@ -40,6 +81,7 @@ class AwsOperations:
             'ingestionJobId': response['ingestionJob']['ingestionJobId'],
             'dataSourceId': data_source_id,
             'knowledgeBaseId': knowledge_base_id,
+            'agentName': agent_name,
         }
 
     def check_ingestion_job_status(self, job_info):
@@ -51,19 +93,103 @@ class AwsOperations:
                     dataSourceId=job_info['dataSourceId'],
                     ingestionJobId=job_info['ingestionJobId'],
                 )
-                status = response['ingestionJob']['status']
+                ingestion_job = response['ingestionJob']
+                status = ingestion_job['status']
 
                 if status in ['FAILED', 'COMPLETE']:
                     print(f"Ingestion Job {job_info['ingestionJobId']} is {status}")
-                    return status
+                    return ingestion_job
 
                 time.sleep(5)
 
             except Exception as e:
                 print(f"Error checking job status: {e}")
-                return 'ERROR'
+                return {'status': 'ERROR'}
+
+    def summarize_ingestion_job(self, job_info, ingestion_job):
+        """get_ingestion_job の結果から件数、所要時間、スループットを取り出す"""
+        stats = ingestion_job.get('statistics', {})
+        started_at = ingestion_job.get('startedAt')
+        # 終了時刻は返らないので、完了後の最終更新時刻を終了時刻とする
+        finished_at = ingestion_job.get('updatedAt')
+        duration = None
+        if started_at and finished_at:
+            duration = (finished_at - started_at).total_seconds()
+        scanned = stats.get('numberOfDocumentsScanned', 0)
+        return {
+            'recordedAt': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'agentName': job_info.get('agentName'),
+            'knowledgeBaseId': job_info['knowledgeBaseId'],
+            'dataSourceId': job_info['dataSourceId'],
+            'ingestionJobId': job_info['ingestionJobId'],
+            'status': ingestion_job['status'],
+            'startedAt': started_at.isoformat() if started_at else None,
+            'finishedAt': finished_at.isoformat() if finished_at else None,
+            'durationSec': round(duration, 1) if duration is not None else None,
+            'documentsPerSec': round(scanned / duration, 3) if duration else None,
+            'scanned': scanned,
+            'metadataScanned': stats.get('numberOfMetadataDocumentsScanned', 0),
+            'indexed': stats.get('numberOfNewDocumentsIndexed', 0),
+            'modified': stats.get('numberOfModifiedDocumentsIndexed', 0),
+            'deleted': stats.get('numberOfDocumentsDeleted', 0),
+            'failed': stats.get('numberOfDocumentsFailed', 0),
+            'failureReasons': ingestion_job.get('failureReasons', []),
+        }
+
+    def load_history(self, path):
+        if not os.path.exists(path):
+            return []
+        history = []
+        with open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    history.append(json.loads(line))
+        return history
+
+    def append_history(self, path, records):
+        with open(path, 'at', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def compare_with_history(self, records, history):
+        """データソースごとに直近の同期と比べ、スループットの低下と失敗件数の増加を表示する"""
+        print(
+            f"{'dataSource':<24} {'status':<9} {'scanned':>8} {'failed':>7} "
+            f"{'sec':>8} {'docs/s':>8} {'prev docs/s':>12} {'change':>8}"
+        )
+        for record in records:
+            previous = [
+                entry
+                for entry in history
+                if entry.get('dataSourceId') == record['dataSourceId'] and entry['status'] == 'COMPLETE'
+            ][-HISTORY_WINDOW:]
+            rates = [entry['documentsPerSec'] for entry in previous if entry.get('documentsPerSec')]
+            baseline = statistics.median(rates) if rates else None
+            change = ''
+            if baseline and record['documentsPerSec'] is not None:
+                change = f"{(record['documentsPerSec'] - baseline) / baseline:+.0%}"
 
-    def process_ingestion_jobs(self, ids):
+            name = record['agentName'] or record['dataSourceId']
+            print(
+                f"{name:<24} {record['status']:<9} {record['scanned']:>8} {record['failed']:>7} "
+                f"{record['durationSec'] if record['durationSec'] is not None else '-':>8} "
+                f"{record['documentsPerSec'] if record['documentsPerSec'] is not None else '-':>8} "
+                f"{round(baseline, 3) if baseline else '-':>12} {change:>8}"
+            )
+
+            if baseline and record['documentsPerSec'] is not None:
+                if record['documentsPerSec'] < baseline * (1 - THROUGHPUT_DROP_THRESHOLD):
+                    print(
+                        f"  WARNING: throughput dropped below the median of the last {len(rates)} runs"
+                    )
+            if previous and record['failed'] > previous[-1]['failed']:
+                print(
+                    f"  WARNING: failed documents increased from {previous[-1]['failed']} to {record['failed']}"
+                )
+            for reason in record['failureReasons']:
+                print(f"  {reason}")
+
+    def process_ingestion_jobs(self, ids, data_source_ids=None):
         ingestion_jobs = []
         for id_info in ids:
             # knowledgeBaseId が存在しない場合はスキップ
@@ -74,8 +200,12 @@ class AwsOperations:
                 continue
 
             for data_source_id in id_info.get('DataSourceId', []):
+                # --upload で変更がなかったデータソースは同期しない
+                if data_source_ids is not None and data_source_id not in data_source_ids:
+                    print(f"Skipping ingestion job as {id_info['agentName']} has no changes")
+                    continue
                 job = self.start_ingestion_job(
-                    id_info['knowledgeBaseId'], data_source_id
+                    id_info['knowledgeBaseId'], data_source_id, id_info.get('agentName')
                 )
                 ingestion_jobs.append(job)
 
@@ -84,10 +214,87 @@ class AwsOperations:
             print("No ingestion jobs to process")
             return []
 
+        records = []
         for job in ingestion_jobs:
-            self.check_ingestion_job_status(job)
+            ingestion_job = self.check_ingestion_job_status(job)
+            if ingestion_job['status'] != 'ERROR':
+                records.append(self.summarize_ingestion_job(job, ingestion_job))
+
+        return records
+
+    def wait_for_agent_ready(self, bra, id_info, timeout):
+        """Agent を必要なら prepare し、Agent と Alias (とその参照先のバージョン) が PREPARED になるまで待つ"""
+        agent_id = id_info['agentId']
+        alias_id = id_info['agentAliasId']
+        start = time.perf_counter()
+        deadline = time.monotonic() + timeout
+        prepared = False
+
+        def result(status, detail=''):
+            return {
+                'agentName': id_info['agentName'],
+                'status': status,
+                'detail': detail,
+                'readySec': round(time.perf_counter() - start, 1),
+            }
 
-        return ingestion_jobs
+        try:
+            while True:
+                agent_status = bra.get_agent(agentId=agent_id)['agent']['agentStatus']
+                if agent_status == 'NOT_PREPARED' and not prepared:
+                    print(f"Preparing agent {id_info['agentName']}")
+                    bra.prepare_agent(agentId=agent_id)
+                    prepared = True
+                elif agent_status == 'PREPARED':
+                    alias = bra.get_agent_alias(agentId=agent_id, agentAliasId=alias_id)['agentAlias']
+                    alias_status = alias['agentAliasStatus']
+                    if alias_status == 'PREPARED':
+                        versions = [
+                            routing['agentVersion']
+                            for routing in alias.get('routingConfiguration', [])
+                        ]
+                        version_statuses = [
+                            bra.get_agent_version(agentId=agent_id, agentVersion=version)[
+                                'agentVersion'
+                            ]['agentStatus']
+                            for version in versions
+                            if version != 'DRAFT'
+                        ]
+                        if all(status == 'PREPARED' for status in version_statuses):
+                            return result('PREPARED', f"version {', '.join(versions) or '-'}")
+                    elif alias_status not in ALIAS_PENDING_STATUSES:
+                        return result(alias_status, f"alias {alias_id} is {alias_status}")
+                elif agent_status not in AGENT_PENDING_STATUSES + ['NOT_PREPARED']:
+                    return result(agent_status, f"agent is {agent_status}")
+
+                if time.monotonic() > deadline:
+                    return result('TIMEOUT', f"agent is {agent_status}")
+                time.sleep(READY_POLL_INTERVAL)
+
+        except Exception as e:
+            return result('ERROR', str(e))
+
+    def wait_for_agents_ready(self, ids, max_workers, timeout):
+        """全 Agent の準備完了を並列に待ち、結果を履歴に残す形で返す"""
+        # boto3 のクライアントはスレッド間で共有できる (Session は共有できない)
+        bra = self.session.client('bedrock-agent', region_name=self.region)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(ids) or 1))) as executor:
+            results = list(
+                executor.map(lambda id_info: self.wait_for_agent_ready(bra, id_info, timeout), ids)
+            )
+        total = time.perf_counter() - start
+
+        for agent in results:
+            print(f"{agent['agentName']:<24} {agent['status']:<10} {agent['readySec']:>7}s  {agent['detail']}")
+        print(f"All agents checked in {total:.1f}s")
+        return {
+            'type': 'readiness',
+            'recordedAt': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'status': 'COMPLETE' if all(agent['status'] == 'PREPARED' for agent in results) else 'FAILED',
+            'totalSec': round(total, 1),
+            'agents': results,
+        }
 
     def save_agent_ids(self, ids):
         documents = [
@@ -95,6 +302,12 @@ class AwsOperations:
                 'agentName': id_info['agentName'],
                 'agentId': id_info['agentId'],
                 'agentAliasId': id_info['agentAliasId'],
+                # tools/retrieve_bench.py で使う
+                **(
+                    {'knowledgeBaseId': id_info['knowledgeBaseId']}
+                    if 'knowledgeBaseId' in id_info
+                    else {}
+                ),
             }
             for id_info in ids
         ]
@@ -125,14 +338,28 @@ class AwsOperations:
             if 'agentId' in data:
                 ids.append(json.loads(data))
 
-        self.process_ingestion_jobs(ids)
+        changed = None
+        if args.upload:
+            changed = upload_data_sources(self.session, self.region, ids, args.max_workers)
+
+        records = self.process_ingestion_jobs(ids, changed)
+        if records:
+            self.compare_with_history(records, self.load_history(args.history))
+
+        readiness = self.wait_for_agents_ready(ids, args.max_workers, args.ready_timeout)
+        self.append_history(args.history, records + [readiness])
+        if readiness['status'] != 'COMPLETE':
+            # 準備できていない Agent を 2_invoke.py などから呼び出さないよう、ID ファイルは更新しない
+            print("Some agents are not ready. agent_ids.json and genu.txt were not updated.")
+            return 1
 
         self.save_agent_ids(ids)
+        return 0
 
 
 def main():
-    AwsOperations().main()
+    return AwsOperations().main()
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
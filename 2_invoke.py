@@ -1,10 +1,356 @@
-import boto3
+import os
+import sys
 import json
+import time
 import argparse
+import contextlib
 from uuid import uuid4
 from time import sleep
 import pprint
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tools'))
+from capture import StreamRecorder, read_capture, capture_files, split_turns  # noqa: E402
+
+
+def print_trace(trace, raw=False):
+    """trace イベントの内容を出力する"""
+    print("\n===== TRACE INFORMATION =====")
+    print(f"Agent ID: {trace.get('agentId')}")
+    print(f"Agent Alias ID: {trace.get('agentAliasId')}")
+    print(f"Session ID: {trace.get('sessionId')}")
+
+    if "trace" in trace:
+        trace_details = trace["trace"]
+
+        # 生のトレースデータを表示する場合
+        if raw:
+            print("\nRaw Trace Data:")
+            pprint.pprint(trace_details)
+            return
+
+        # 前処理トレース
+        if "preProcessingTrace" in trace_details:
+            pre_trace = trace_details["preProcessingTrace"]
+            print("\n--- Pre-Processing Trace ---")
+            if "modelInvocationInput" in pre_trace:
+                input_data = pre_trace["modelInvocationInput"]
+                print(
+                    f"Foundation Model: {input_data.get('foundationModel')}"
+                )
+                print(f"Prompt Type: {input_data.get('type')}")
+
+            if "modelInvocationOutput" in pre_trace:
+                output_data = pre_trace["modelInvocationOutput"]
+                if (
+                    "metadata" in output_data
+                    and "usage" in output_data["metadata"]
+                ):
+                    usage = output_data["metadata"]["usage"]
+                    print(f"Input Tokens: {usage.get('inputTokens')}")
+                    print(f"Output Tokens: {usage.get('outputTokens')}")
+
+                if "parsedResponse" in output_data:
+                    parsed = output_data["parsedResponse"]
+                    print(f"Is Valid: {parsed.get('isValid')}")
+                    if "rationale" in parsed:
+                        print(f"Rationale: {parsed.get('rationale')}")
+
+        # オーケストレーショントレース
+        if "orchestrationTrace" in trace_details:
+            orch_trace = trace_details["orchestrationTrace"]
+            print("\n--- Orchestration Trace ---")
+
+            # 推論の根拠
+            if "rationale" in orch_trace:
+                print(f"Rationale: {orch_trace['rationale'].get('text')}")
+
+            # モデル呼び出し入力
+            if "modelInvocationInput" in orch_trace:
+                model_input = orch_trace["modelInvocationInput"]
+                print(f"Model: {model_input.get('foundationModel')}")
+                if "inferenceConfiguration" in model_input:
+                    inf_config = model_input["inferenceConfiguration"]
+                    print(f"Temperature: {inf_config.get('temperature')}")
+                    print(f"Top P: {inf_config.get('topP')}")
+                    print(f"Max Length: {inf_config.get('maximumLength')}")
+
+            # モデル呼び出し出力
+            if "modelInvocationOutput" in orch_trace:
+                model_output = orch_trace["modelInvocationOutput"]
+                if (
+                    "metadata" in model_output
+                    and "usage" in model_output["metadata"]
+                ):
+                    usage = model_output["metadata"]["usage"]
+                    print(f"Input Tokens: {usage.get('inputTokens')}")
+                    print(f"Output Tokens: {usage.get('outputTokens')}")
+
+            # 観察結果
+            if "observation" in orch_trace:
+                obs = orch_trace["observation"]
+                print(f"Observation Type: {obs.get('type')}")
+
+                # アクショングループ呼び出し結果
+                if "actionGroupInvocationOutput" in obs:
+                    print("Action Group Output Available")
+
+                # ナレッジベース検索結果
+                if "knowledgeBaseLookupOutput" in obs:
+                    kb_output = obs["knowledgeBaseLookupOutput"]
+                    if "retrievedReferences" in kb_output:
+                        refs = kb_output["retrievedReferences"]
+                        print(f"Retrieved {len(refs)} references")
+                        for i, ref in enumerate(refs):
+                            print(f"\nReference {i+1}:")
+                            if (
+                                "content" in ref
+                                and "text" in ref["content"]
+                            ):
+                                print(
+                                    f"Content: {ref['content']['text'][:100]}..."
+                                )
+                            if "location" in ref:
+                                loc = ref["location"]
+                                print(f"Location Type: {loc.get('type')}")
+
+                # 最終応答
+                if "finalResponse" in obs:
+                    print(
+                        f"Final Response: {obs['finalResponse'].get('text')[:100]}..."
+                    )
+
+        # 後処理トレース
+        if "postProcessingTrace" in trace_details:
+            post_trace = trace_details["postProcessingTrace"]
+            print("\n--- Post-Processing Trace ---")
+            if "modelInvocationInput" in post_trace:
+                input_data = post_trace["modelInvocationInput"]
+                print(
+                    f"Foundation Model: {input_data.get('foundationModel')}"
+                )
+
+            if "modelInvocationOutput" in post_trace:
+                output_data = post_trace["modelInvocationOutput"]
+                if (
+                    "metadata" in output_data
+                    and "usage" in output_data["metadata"]
+                ):
+                    usage = output_data["metadata"]["usage"]
+                    print(f"Input Tokens: {usage.get('inputTokens')}")
+                    print(f"Output Tokens: {usage.get('outputTokens')}")
+
+        # ガードレールトレース
+        if "guardrailTrace" in trace_details:
+            guard_trace = trace_details["guardrailTrace"]
+            print("\n--- Guardrail Trace ---")
+            print(f"Action: {guard_trace.get('action')}")
+            if "inputAssessments" in guard_trace:
+                print(
+                    f"Input Assessments: {len(guard_trace['inputAssessments'])}"
+                )
+            if "outputAssessments" in guard_trace:
+                print(
+                    f"Output Assessments: {len(guard_trace['outputAssessments'])}"
+                )
+
+        # 失敗トレース
+        if "failureTrace" in trace_details:
+            fail_trace = trace_details["failureTrace"]
+            print("\n--- Failure Trace ---")
+            print(f"Failure Reason: {fail_trace.get('failureReason')}")
+
+
+def process_stream(events, raw=False):
+    """completion のイベントを順に処理し、回答のテキストを返す
+
+    invoke_agent のレスポンスと記録ファイルの再生のどちらも同じ処理を通す。
+    """
+    completion = ""
+    for event in events:
+        if "chunk" in event:
+            chunk = event["chunk"]
+            completion = completion + chunk["bytes"].decode()
+        elif "trace" in event:
+            # trace 情報を出力
+            print_trace(event["trace"], raw)
+    return completion
+
+
+class TurnStats:
+    """1 ターン分のレイテンシとトークン数を集計する"""
+
+    def __init__(self):
+        self.latency = None
+        self.first_chunk = None
+        self.steps = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.first_step_input_tokens = None
+
+    def observe(self, event, elapsed):
+        if "chunk" in event and self.first_chunk is None:
+            self.first_chunk = elapsed
+        orch_trace = event.get("trace", {}).get("trace", {}).get("orchestrationTrace", {})
+        usage = orch_trace.get("modelInvocationOutput", {}).get("metadata", {}).get("usage")
+        if usage:
+            # オーケストレーションのモデル呼び出しごとに 1 ステップと数える
+            self.steps += 1
+            self.input_tokens += usage.get("inputTokens") or 0
+            self.output_tokens += usage.get("outputTokens") or 0
+            if self.first_step_input_tokens is None:
+                self.first_step_input_tokens = usage.get("inputTokens") or 0
+
+    def track(self, events, start):
+        """イベントを流しながら受信時刻を記録する"""
+        for event in events:
+            self.observe(event, time.perf_counter() - start)
+            yield event
+        self.latency = time.perf_counter() - start
+
+    def to_dict(self):
+        return {
+            'latencyMs': self.latency * 1000 if self.latency is not None else None,
+            'firstChunkMs': self.first_chunk * 1000 if self.first_chunk is not None else None,
+            'steps': self.steps,
+            'orchestrationInputTokens': self.input_tokens,
+            'firstStepInputTokens': self.first_step_input_tokens,
+            'outputTokens': self.output_tokens,
+        }
+
+
+@contextlib.contextmanager
+def suppress_output(enabled):
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def print_session_report(agent_name, session_id, turns):
+    """ターンごとのレイテンシとオーケストレーションの入力トークン数を表で出力する"""
+    print(f"\n===== SESSION {agent_name} ({session_id}) =====")
+    print(
+        f"{'turn':>4} {'latency[s]':>11} {'1st chunk[s]':>13} {'steps':>6}"
+        f" {'input tokens':>13} {'1st step input':>15} {'growth':>8} {'output':>7}"
+    )
+    base = None
+    for number, turn in enumerate(turns, 1):
+        first_step = turn['firstStepInputTokens']
+        if base is None and first_step:
+            base = first_step
+        growth = f"x{first_step / base:.2f}" if base and first_step else '-'
+        latency = f"{turn['latencyMs'] / 1000:.2f}" if turn['latencyMs'] is not None else '-'
+        first_chunk = f"{turn['firstChunkMs'] / 1000:.2f}" if turn['firstChunkMs'] is not None else '-'
+        print(
+            f"{number:>4} {latency:>11} {first_chunk:>13} {turn['steps']:>6}"
+            f" {turn['orchestrationInputTokens']:>13} {first_step or '-':>15} {growth:>8}"
+            f" {turn['outputTokens']:>7}"
+        )
+
+
+def replay(paths, raw=False, quiet=False):
+    """記録したイベントストリームを待ち時間なしで処理し、処理時間を計測する"""
+    files = capture_files(paths)
+    if not files:
+        print('No capture files found.')
+        return
+
+    total_events = 0
+    total_seconds = 0.0
+    for path in files:
+        turns = []
+        request = None
+        for turn in split_turns(read_capture(path)):
+            request = turn['request']
+            events = [record['event'] for record in turn['events']]
+            if not quiet:
+                print(f"user: {request.get('inputText')}")
+
+            start = time.perf_counter()
+            with suppress_output(quiet):
+                completion = process_stream(events, raw)
+            elapsed = time.perf_counter() - start
+
+            if not quiet:
+                print(f'AI: {completion}')
+            recorded = turn['end']['elapsed'] if turn['end'] else None
+            recorded_text = f"{recorded:.2f} s" if recorded is not None else "incomplete"
+            print(
+                f"[replay] {os.path.basename(path)} {request.get('agentName')}: "
+                f"{len(events)} events in {elapsed * 1000:.2f} ms (recorded {recorded_text})"
+            )
+            total_events += len(events)
+            total_seconds += elapsed
+
+            # 記録時のタイミングでターンの統計を作り直す
+            stats = TurnStats()
+            for record in turn['events']:
+                stats.observe(record['event'], record['elapsed'])
+            stats.latency = recorded
+            turns.append(stats.to_dict())
+
+        if len(turns) > 1:
+            print_session_report(request.get('agentName'), request.get('sessionId'), turns)
+
+    if total_seconds > 0:
+        print(
+            f"[replay] total {total_events} events in {total_seconds * 1000:.2f} ms "
+            f"({total_events / total_seconds:.0f} events/s)"
+        )
+
+
+def invoke_turn(brar, doc, session_id, prompt, args, session_state=None):
+    """エージェントを 1 回呼び出し、回答とそのターンの統計を返す"""
+    request = {
+        'agentId': doc['agentId'],
+        'agentAliasId': doc['agentAliasId'],
+        'sessionId': session_id,
+        'inputText': prompt,
+        'enableTrace': True,  # trace を有効化
+    }
+    if session_state:
+        request['sessionState'] = session_state
+    stats = TurnStats()
+    start = time.perf_counter()
+    response = brar.invoke_agent(**request)
+    events = response.get("completion")
+    if args.capture:
+        recorder = StreamRecorder(args.capture, doc['agentName'], session_id)
+        events = recorder.record(
+            events,
+            agentId=doc['agentId'],
+            agentAliasId=doc['agentAliasId'],
+            inputText=prompt,
+        )
+    with suppress_output(args.quiet):
+        completion = process_stream(stats.track(events, start), args.raw)
+    return completion, stats
+
+
+def run_sessions(brar, documents, scripts, args):
+    """エージェントごとのスクリプトを同じ sessionId で順に送り、ターンごとの推移を出力する"""
+    report = []
+    for doc in documents:
+        script = scripts.get(doc['agentName'])
+        if not script:
+            continue
+        session_id = str(uuid4())
+        turns = []
+        for turn in script:
+            if isinstance(turn, str):
+                turn = {'inputText': turn}
+            print(f"user: {turn['inputText']}")
+            completion, stats = invoke_turn(
+                brar, doc, session_id, turn['inputText'], args, turn.get('sessionState')
+            )
+            print(f'AI: {completion}')
+            turns.append({'inputText': turn['inputText'], **stats.to_dict()})
+        print_session_report(doc['agentName'], session_id, turns)
+        report.append({'agentName': doc['agentName'], 'sessionId': session_id, 'turns': turns})
+        sleep(10)
+    return report
+
 
 def main():
     # コマンドライン引数の設定
@@ -12,16 +358,56 @@ def main():
         description='Bedrock Agent Runtime client with region specification'
     )
     parser.add_argument(
-        '-r', '--region', required=True, help='AWS region name (e.g., us-west-2)'
+        '-r', '--region', help='AWS region name (e.g., us-west-2)'
     )
     parser.add_argument('--raw', action='store_true', help='Display raw trace data')
+    parser.add_argument(
+        '--capture',
+        metavar='DIR',
+        help='Record every event of each session to DIR as gzip compressed JSONL',
+    )
+    parser.add_argument(
+        '--replay',
+        nargs='+',
+        metavar='PATH',
+        help='Replay recorded sessions (files or directories) instead of invoking agents',
+    )
+    parser.add_argument(
+        '--sessions',
+        metavar='FILE',
+        help='Run multi-turn session scripts from FILE (e.g. sessions.json) and report each turn',
+    )
+    parser.add_argument(
+        '--report', metavar='FILE', help='With --sessions, write the per-turn report to FILE'
+    )
+    parser.add_argument(
+        '--quiet', action='store_true', help='Do not print traces, only answers and timings'
+    )
     args = parser.parse_args()
 
+    if args.replay:
+        replay(args.replay, args.raw, args.quiet)
+        return
+    if not args.region:
+        parser.error('the following arguments are required: -r/--region')
+
+    import boto3
+
     # 引数から受け取ったリージョン名を使用してクライアントを初期化
     brar = boto3.client('bedrock-agent-runtime', region_name=args.region)
 
     with open('agent_ids.json', 'rt', encoding='utf-8') as f:
         documents = json.load(f)
+
+    if args.sessions:
+        with open(args.sessions, 'rt', encoding='utf-8') as f:
+            scripts = json.load(f)
+        report = run_sessions(brar, documents, scripts, args)
+        if args.report:
+            with open(args.report, 'wt', encoding='utf-8') as f:
+                f.write(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
     prompts = {
         'dev-human-resource-agent': 'Kazuhito Go の今年度の年休付与日数は？',
         'dev-product-support-agent': 'E-03',
@@ -32,165 +418,7 @@ def main():
     for doc in documents:
         prompt = prompts[doc['agentName']]
         print(f'user: {prompt}')
-        response = brar.invoke_agent(
-            agentId=doc['agentId'],
-            agentAliasId=doc['agentAliasId'],
-            sessionId=str(uuid4()),
-            inputText=prompt,
-            enableTrace=True,  # trace を有効化
-        )
-        completion = ""
-        for event in response.get("completion"):
-            if "chunk" in event:
-                chunk = event["chunk"]
-                completion = completion + chunk["bytes"].decode()
-            elif "trace" in event:
-                # trace 情報を出力
-                trace = event["trace"]
-                print("\n===== TRACE INFORMATION =====")
-                print(f"Agent ID: {trace.get('agentId')}")
-                print(f"Agent Alias ID: {trace.get('agentAliasId')}")
-                print(f"Session ID: {trace.get('sessionId')}")
-
-                if "trace" in trace:
-                    trace_details = trace["trace"]
-
-                    # 生のトレースデータを表示する場合
-                    if args.raw:
-                        print("\nRaw Trace Data:")
-                        pprint.pprint(trace_details)
-                        continue
-
-                    # 前処理トレース
-                    if "preProcessingTrace" in trace_details:
-                        pre_trace = trace_details["preProcessingTrace"]
-                        print("\n--- Pre-Processing Trace ---")
-                        if "modelInvocationInput" in pre_trace:
-                            input_data = pre_trace["modelInvocationInput"]
-                            print(
-                                f"Foundation Model: {input_data.get('foundationModel')}"
-                            )
-                            print(f"Prompt Type: {input_data.get('type')}")
-
-                        if "modelInvocationOutput" in pre_trace:
-                            output_data = pre_trace["modelInvocationOutput"]
-                            if (
-                                "metadata" in output_data
-                                and "usage" in output_data["metadata"]
-                            ):
-                                usage = output_data["metadata"]["usage"]
-                                print(f"Input Tokens: {usage.get('inputTokens')}")
-                                print(f"Output Tokens: {usage.get('outputTokens')}")
-
-                            if "parsedResponse" in output_data:
-                                parsed = output_data["parsedResponse"]
-                                print(f"Is Valid: {parsed.get('isValid')}")
-                                if "rationale" in parsed:
-                                    print(f"Rationale: {parsed.get('rationale')}")
-
-                    # オーケストレーショントレース
-                    if "orchestrationTrace" in trace_details:
-                        orch_trace = trace_details["orchestrationTrace"]
-                        print("\n--- Orchestration Trace ---")
-
-                        # 推論の根拠
-                        if "rationale" in orch_trace:
-                            print(f"Rationale: {orch_trace['rationale'].get('text')}")
-
-                        # モデル呼び出し入力
-                        if "modelInvocationInput" in orch_trace:
-                            model_input = orch_trace["modelInvocationInput"]
-                            print(f"Model: {model_input.get('foundationModel')}")
-                            if "inferenceConfiguration" in model_input:
-                                inf_config = model_input["inferenceConfiguration"]
-                                print(f"Temperature: {inf_config.get('temperature')}")
-                                print(f"Top P: {inf_config.get('topP')}")
-                                print(f"Max Length: {inf_config.get('maximumLength')}")
-
-                        # モデル呼び出し出力
-                        if "modelInvocationOutput" in orch_trace:
-                            model_output = orch_trace["modelInvocationOutput"]
-                            if (
-                                "metadata" in model_output
-                                and "usage" in model_output["metadata"]
-                            ):
-                                usage = model_output["metadata"]["usage"]
-                                print(f"Input Tokens: {usage.get('inputTokens')}")
-                                print(f"Output Tokens: {usage.get('outputTokens')}")
-
-                        # 観察結果
-                        if "observation" in orch_trace:
-                            obs = orch_trace["observation"]
-                            print(f"Observation Type: {obs.get('type')}")
-
-                            # アクショングループ呼び出し結果
-                            if "actionGroupInvocationOutput" in obs:
-                                print("Action Group Output Available")
-
-                            # ナレッジベース検索結果
-                            if "knowledgeBaseLookupOutput" in obs:
-                                kb_output = obs["knowledgeBaseLookupOutput"]
-                                if "retrievedReferences" in kb_output:
-                                    refs = kb_output["retrievedReferences"]
-                                    print(f"Retrieved {len(refs)} references")
-                                    for i, ref in enumerate(refs):
-                                        print(f"\nReference {i+1}:")
-                                        if (
-                                            "content" in ref
-                                            and "text" in ref["content"]
-                                        ):
-                                            print(
-                                                f"Content: {ref['content']['text'][:100]}..."
-                                            )
-                                        if "location" in ref:
-                                            loc = ref["location"]
-                                            print(f"Location Type: {loc.get('type')}")
-
-                            # 最終応答
-                            if "finalResponse" in obs:
-                                print(
-                                    f"Final Response: {obs['finalResponse'].get('text')[:100]}..."
-                                )
-
-                    # 後処理トレース
-                    if "postProcessingTrace" in trace_details:
-                        post_trace = trace_details["postProcessingTrace"]
-                        print("\n--- Post-Processing Trace ---")
-                        if "modelInvocationInput" in post_trace:
-                            input_data = post_trace["modelInvocationInput"]
-                            print(
-                                f"Foundation Model: {input_data.get('foundationModel')}"
-                            )
-
-                        if "modelInvocationOutput" in post_trace:
-                            output_data = post_trace["modelInvocationOutput"]
-                            if (
-                                "metadata" in output_data
-                                and "usage" in output_data["metadata"]
-                            ):
-                                usage = output_data["metadata"]["usage"]
-                                print(f"Input Tokens: {usage.get('inputTokens')}")
-                                print(f"Output Tokens: {usage.get('outputTokens')}")
-
-                    # ガードレールトレース
-                    if "guardrailTrace" in trace_details:
-                        guard_trace = trace_details["guardrailTrace"]
-                        print("\n--- Guardrail Trace ---")
-                        print(f"Action: {guard_trace.get('action')}")
-                        if "inputAssessments" in guard_trace:
-                            print(
-                                f"Input Assessments: {len(guard_trace['inputAssessments'])}"
-                            )
-                        if "outputAssessments" in guard_trace:
-                            print(
-                                f"Output Assessments: {len(guard_trace['outputAssessments'])}"
-                            )
-
-                    # 失敗トレース
-                    if "failureTrace" in trace_details:
-                        fail_trace = trace_details["failureTrace"]
-                        print("\n--- Failure Trace ---")
-                        print(f"Failure Reason: {fail_trace.get('failureReason')}")
+        completion, _ = invoke_turn(brar, doc, str(uuid4()), prompt, args)
 
         print(f'AI: {completion}')
         sleep(10)
@@ -0,0 +1,368 @@
+"""長い期間を対象にした集計クエリを日付ごとに分割して並列に実行し、結果をまとめる
+
+数か月分のログを 1 つのクエリでスキャンすると Lambda や Agent のタイムアウトを超えることがあるため、
+timestamp の範囲が指定された集計クエリ (SUM / COUNT / MAX / MIN と GROUP BY、ORDER BY、LIMIT) は
+期間を分けたサブクエリを同時に実行し、部分的な集計結果を Lambda 側でまとめる。
+分割できない形のクエリ (AVG や DISTINCT、サブクエリ、JOIN など) はそのまま 1 つのクエリとして実行する。
+各サブクエリには日付のパーティション (PARTITION_COLUMN) の条件を付け、自分の期間のログだけをスキャンさせる。
+"""
+import os
+import re
+import time
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+# ログの日付 (yyyy/MM/dd) のパーティションの列。パーティションがないと各サブクエリが全体をスキャンするので分割しない
+PARTITION_COLUMN = os.environ.get('PARTITION_COLUMN', '')
+FANOUT_ENABLED = os.environ.get('FANOUT_ENABLED', 'true').lower() != 'false' and bool(PARTITION_COLUMN)
+# 同時に実行するサブクエリの数の上限
+FANOUT_MAX_CONCURRENCY = int(os.environ.get('FANOUT_MAX_CONCURRENCY', '4'))
+# この日数以上の範囲を対象にしたクエリだけを分割する
+FANOUT_MIN_RANGE_DAYS = int(os.environ.get('FANOUT_MIN_RANGE_DAYS', '14'))
+POLL_INTERVAL = 0.5
+
+# 分割すると結果が変わる、もしくは分割の判定ができない構文
+UNSUPPORTED = re.compile(
+    r'\b(JOIN|UNION|INTERSECT|EXCEPT|HAVING|DISTINCT|OVER|WITH|AVG|APPROX_\w+|ARBITRARY)\b|\(\s*SELECT\b',
+    re.IGNORECASE,
+)
+CLAUSES = re.compile(
+    r'^\s*SELECT\s+(?P<select>.+?)\s+FROM\s+(?P<from>\S+)'
+    r'(?:\s+WHERE\s+(?P<where>.+?))?'
+    r'(?:\s+GROUP\s+BY\s+(?P<group>.+?))?'
+    r'(?:\s+ORDER\s+BY\s+(?P<order>.+?))?'
+    r'(?:\s+LIMIT\s+(?P<limit>\d+))?\s*;?\s*$',
+    re.IGNORECASE | re.DOTALL,
+)
+AGGREGATE = re.compile(r'^(SUM|COUNT|MAX|MIN)\s*\((.*)\)$', re.IGNORECASE | re.DOTALL)
+ALIAS = re.compile(r'^(?P<expression>.+?)\s+(?:AS\s+)?(?P<alias>"[^"]+"|[A-Za-z_][A-Za-z0-9_]*)$', re.IGNORECASE | re.DOTALL)
+NOT_ALIASES = {'END', 'NULL', 'ASC', 'DESC', 'AND', 'OR', 'NOT', 'IS', 'THEN', 'ELSE'}
+TIMESTAMP_COLUMN = r'"?timestamp"?'
+LITERAL = r"(?:TIMESTAMP|DATE)?\s*'(?P<{name}>[^']+)'"
+LOWER_BOUND = re.compile(
+    TIMESTAMP_COLUMN + r'\s*>=?\s*' + LITERAL.format(name='value'), re.IGNORECASE
+)
+UPPER_BOUND = re.compile(
+    TIMESTAMP_COLUMN + r'\s*<=?\s*' + LITERAL.format(name='value'), re.IGNORECASE
+)
+BETWEEN = re.compile(
+    TIMESTAMP_COLUMN + r'\s+BETWEEN\s+' + LITERAL.format(name='lower') + r'\s+AND\s+' + LITERAL.format(name='upper'),
+    re.IGNORECASE,
+)
+
+
+def split_top_level(text: str, separator: str = ',') -> List[str]:
+    """括弧と文字列リテラルの外側にある区切り文字で分ける"""
+    parts = []
+    depth = 0
+    quote = None
+    current = ''
+    for char in text:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(current.strip())
+            current = ''
+            continue
+        current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def parse_timestamp(value: str) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00').replace(' UTC', ''))
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=None)
+
+
+def time_range(where: str):
+    """WHERE 句から timestamp の下限と上限を取り出す。上限がなければ現在時刻とする"""
+    match = BETWEEN.search(where)
+    if match:
+        return parse_timestamp(match.group('lower')), parse_timestamp(match.group('upper'))
+    lower = LOWER_BOUND.search(where)
+    if not lower:
+        return None, None
+    upper = UPPER_BOUND.search(where)
+    return (
+        parse_timestamp(lower.group('value')),
+        parse_timestamp(upper.group('value')) if upper else datetime.utcnow(),
+    )
+
+
+def parse_select_item(item: str) -> Dict[str, Any]:
+    """SELECT の項目を {'expression', 'alias', 'aggregate'} にする"""
+    expression, alias = item, None
+    match = ALIAS.match(item)
+    # 末尾の識別子が別名なのか式の一部 (CASE ... END など) なのかを区別する
+    if (
+        match
+        and match.group('expression').count('(') == match.group('expression').count(')')
+        and match.group('expression').rstrip()[-1] not in '+-*/%|,('
+        and match.group('alias').upper() not in NOT_ALIASES
+    ):
+        expression, alias = match.group('expression'), match.group('alias')
+    aggregate = AGGREGATE.match(expression.strip())
+    return {
+        'expression': expression.strip(),
+        'alias': alias.strip('"') if alias else None,
+        'aggregate': aggregate.group(1).upper() if aggregate else None,
+    }
+
+
+def plan_fanout(sql: str) -> Optional[Dict[str, Any]]:
+    """分割して実行できるクエリならその計画を返し、できなければ None を返す"""
+    if not FANOUT_ENABLED or UNSUPPORTED.search(sql):
+        return None
+    clauses = CLAUSES.match(sql.strip())
+    if not clauses or not clauses.group('where'):
+        return None
+
+    lower, upper = time_range(clauses.group('where'))
+    if lower is None or upper is None or upper <= lower:
+        return None
+    days = (upper - lower).total_seconds() / 86400
+    if days < FANOUT_MIN_RANGE_DAYS:
+        return None
+
+    items = [parse_select_item(item) for item in split_top_level(clauses.group('select'))]
+    if not any(item['aggregate'] for item in items):
+        return None
+    group_by = []
+    for expression in split_top_level(clauses.group('group') or ''):
+        # GROUP BY 1 のような位置の指定は SELECT の項目に読み替える
+        if expression.isdigit() and 0 < int(expression) <= len(items):
+            expression = items[int(expression) - 1]['expression']
+        group_by.append(expression.strip().lower())
+    for item in items:
+        if item['aggregate']:
+            # 集計関数の中にさらに集計関数があるものはまとめられない
+            if AGGREGATE.search(item['expression'][item['expression'].index('(') + 1:]):
+                return None
+        elif item['expression'].lower() not in group_by:
+            return None
+    # まとめた結果を並べ替えられるのは、ORDER BY の項目が SELECT にある場合だけ
+    order_keys = resolve_order(clauses.group('order'), items)
+    if order_keys is None:
+        return None
+
+    slices = min(FANOUT_MAX_CONCURRENCY, math.ceil(days / FANOUT_MIN_RANGE_DAYS) + 1)
+    if slices < 2:
+        return None
+    # 日単位で区切り、最後の区間は上限を含むよう 1 日先まで広げる (元の条件で絞られる)
+    start = datetime(lower.year, lower.month, lower.day)
+    step = math.ceil(((upper - start).total_seconds() / 86400 + 1) / slices)
+    boundaries = [start + timedelta(days=step * i) for i in range(slices + 1)]
+    return {
+        'items': items,
+        'from': clauses.group('from'),
+        'where': clauses.group('where'),
+        'group': clauses.group('group'),
+        'order_keys': order_keys,
+        'limit': int(clauses.group('limit')) if clauses.group('limit') else None,
+        'slices': list(zip(boundaries[:-1], boundaries[1:])),
+    }
+
+
+def slice_sql(plan: Dict[str, Any], begin: datetime, end: datetime) -> str:
+    """元の条件に期間の条件を加えたサブクエリ。ORDER BY と LIMIT はまとめた後に適用する"""
+    select = ', '.join(
+        f"{item['expression']} AS \"{item['alias']}\"" if item['alias'] else item['expression']
+        for item in plan['items']
+    )
+    sql = (
+        f"SELECT {select} FROM {plan['from']} WHERE ({plan['where']})"
+        f" AND \"timestamp\" >= TIMESTAMP '{begin:%Y-%m-%d %H:%M:%S}'"
+        f" AND \"timestamp\" < TIMESTAMP '{end:%Y-%m-%d %H:%M:%S}'"
+        # ログはリクエストの後に出力されるので、日付のパスは終わりの日まで含める
+        f" AND \"{PARTITION_COLUMN}\" >= '{begin:%Y/%m/%d}' AND \"{PARTITION_COLUMN}\" <= '{end:%Y/%m/%d}'"
+    )
+    if plan['group']:
+        sql += f" GROUP BY {plan['group']}"
+    return sql
+
+
+def to_number(value: Optional[str]):
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+
+def merge_value(aggregate: str, current, value):
+    if value is None:
+        return current
+    if current is None:
+        return value
+    if aggregate in ('SUM', 'COUNT'):
+        return current + value
+    if aggregate == 'MAX':
+        return max(current, value)
+    return min(current, value)
+
+
+def merge_rows(plan: Dict[str, Any], partials: List[List[List[Optional[str]]]]) -> List[List[Any]]:
+    """サブクエリの結果をグループごとにまとめる"""
+    merged: Dict[tuple, List[Any]] = {}
+    for rows in partials:
+        for row in rows:
+            key = tuple(value for item, value in zip(plan['items'], row) if not item['aggregate'])
+            values = [to_number(value) if item['aggregate'] else value for item, value in zip(plan['items'], row)]
+            if key not in merged:
+                merged[key] = values
+                continue
+            current = merged[key]
+            for index, item in enumerate(plan['items']):
+                if item['aggregate']:
+                    current[index] = merge_value(item['aggregate'], current[index], values[index])
+
+    rows = list(merged.values())
+    if not plan['group'] and not rows:
+        # GROUP BY なしの集計は対象がなくても 1 行返る (COUNT は 0)
+        rows = [[0 if item['aggregate'] == 'COUNT' else None for item in plan['items']]]
+    return rows
+
+
+def output_name(item: Dict[str, Any]) -> Optional[str]:
+    """結果の列名。別名がなければ列の参照 (identity.arn なら arn) のときだけわかる"""
+    if item['alias']:
+        return item['alias'].lower()
+    match = re.match(r'^(?:[A-Za-z_][A-Za-z0-9_]*\.)*"?([A-Za-z_][A-Za-z0-9_]*)"?$', item['expression'])
+    return match.group(1).lower() if match else None
+
+
+def resolve_order(order: Optional[str], items: List[Dict[str, Any]]) -> Optional[List[Tuple[int, bool]]]:
+    """ORDER BY の各項目を [(SELECT の項目の位置, 降順か)] にする。SELECT にない項目があれば None"""
+    keys = []
+    names = [output_name(item) for item in items]
+    expressions = [item['expression'].lower() for item in items]
+    for term in split_top_level(order or ''):
+        match = re.match(r'^(?P<key>.+?)(?:\s+(?P<direction>ASC|DESC))?(?:\s+NULLS\s+(FIRST|LAST))?$', term, re.IGNORECASE | re.DOTALL)
+        key = match.group('key').strip()
+        descending = (match.group('direction') or '').upper() == 'DESC'
+        if key.isdigit() and 0 < int(key) <= len(items):
+            index = int(key) - 1
+        elif key.strip('"').lower() in names:
+            index = names.index(key.strip('"').lower())
+        elif key.lower() in expressions:
+            index = expressions.index(key.lower())
+        else:
+            return None
+        keys.append((index, descending))
+    return keys
+
+
+def sort_value(value):
+    """GROUP BY のキーは文字列のまま返ってくるので、数値は数値として並べる"""
+    value = to_number(value) if isinstance(value, str) else value
+    return (isinstance(value, str), value)
+
+
+def order_rows(plan: Dict[str, Any], rows: List[List[Any]]) -> List[List[Any]]:
+    """ORDER BY と LIMIT をまとめた結果に適用する"""
+    # 後ろのキーから順に安定ソートする。NULL は Athena と同じく最後に並べる
+    for index, descending in reversed(plan['order_keys']):
+        present = [row for row in rows if row[index] is not None]
+        missing = [row for row in rows if row[index] is None]
+        present.sort(key=lambda row: sort_value(row[index]), reverse=descending)
+        rows = present + missing
+    if plan['limit'] is not None:
+        rows = rows[: plan['limit']]
+    return rows
+
+
+def fetch_all_rows(athena_client, query_execution_id: str):
+    """結果のすべてのページを取得し、ヘッダーと行を返す"""
+    header = None
+    rows = []
+    kwargs = {'QueryExecutionId': query_execution_id}
+    while True:
+        results = athena_client.get_query_results(**kwargs)
+        page = results['ResultSet']['Rows']
+        if header is None:
+            header = [column['Label'] for column in results['ResultSet']['ResultSetMetadata']['ColumnInfo']]
+            page = page[1:]  # 最初のページの先頭はヘッダー行
+        rows.extend([field.get('VarCharValue') for field in row['Data']] for row in page)
+        if not results.get('NextToken'):
+            return header, rows
+        kwargs['NextToken'] = results['NextToken']
+
+
+def execute_fanout(athena_client, plan: Dict[str, Any], workgroup: str, bytes_scanned_cutoff: int = 0) -> Dict[str, Any]:
+    """サブクエリを同時に実行して待ち、まとめた結果と実行統計を返す
+
+    bytes_scanned_cutoff を指定すると、サブクエリのスキャン量の合計がそれを超えた時点で残りを止める
+    (ワークグループの上限はサブクエリごとにしか効かないため)。
+    """
+    executions = []
+    for begin, end in plan['slices']:
+        response = athena_client.start_query_execution(
+            QueryString=slice_sql(plan, begin, end), WorkGroup=workgroup
+        )
+        executions.append(response['QueryExecutionId'])
+    print(f"Fan-out: {len(executions)} sub-queries")
+
+    pending = set(executions)
+    statuses = {}
+    # 実行中のものも含めた、サブクエリごとの最新の Statistics
+    statistics = {}
+    while pending:
+        for query_execution_id in list(pending):
+            execution = athena_client.get_query_execution(QueryExecutionId=query_execution_id)['QueryExecution']
+            statistics[query_execution_id] = execution.get('Statistics', {})
+            state = execution['Status']['State']
+            if state in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
+                statuses[query_execution_id] = execution
+                pending.discard(query_execution_id)
+                if state != 'SUCCEEDED':
+                    # 1 つでも失敗したら残りは止めて、失敗の内容を返す
+                    for other in pending:
+                        athena_client.stop_query_execution(QueryExecutionId=other)
+                    return {
+                        'error': execution['Status'].get('StateChangeReason', state),
+                        'state': state,
+                        'statistics': list(statistics.values()),
+                    }
+        # 各サブクエリは日付のパーティションで自分の期間だけをスキャンするので、
+        # 合計は分割しないクエリのスキャン量以下になる。同じ上限を合計に適用する
+        scanned = sum(s.get('DataScannedInBytes', 0) for s in statistics.values())
+        if bytes_scanned_cutoff and scanned > bytes_scanned_cutoff:
+            # 全て終わった後に超えていた場合も、分割しないクエリと同じく上限超過として返す
+            for other in pending:
+                athena_client.stop_query_execution(QueryExecutionId=other)
+            return {
+                'error': f"Combined sub-queries exceeded the bytes scanned limit ({scanned} > {bytes_scanned_cutoff} bytes)",
+                'state': 'CANCELLED',
+                'statistics': list(statistics.values()),
+            }
+        if pending:
+            time.sleep(POLL_INTERVAL)
+
+    header = None
+    partials = []
+    for query_execution_id in executions:
+        slice_header, rows = fetch_all_rows(athena_client, query_execution_id)
+        header = header or slice_header
+        partials.append(rows)
+    rows = order_rows(plan, merge_rows(plan, partials))
+    return {
+        'header': header,
+        'rows': rows,
+        'statistics': [statuses[query_execution_id].get('Statistics', {}) for query_execution_id in executions],
+    }
@@ -1,12 +1,37 @@
 import os
-import boto3
+import time
+from functools import lru_cache
 from typing import Dict, Any
 from io import StringIO
-import sqlparse
+
+from apt_common import ParameterError, current_metrics, load_validator, metrics_handler
+from fanout import POLL_INTERVAL, plan_fanout, execute_fanout
+from query_stats import (
+    BYTES_SCANNED_CUTOFF,
+    cutoff_message,
+    format_statistics,
+    is_cutoff_exceeded,
+    record_statistics,
+    summarize_statistics,
+)
+
+# api-schema.yaml から組み立てたパラメータの検証 (コールドスタート時に 1 回だけ作る)
+validator = load_validator()
+
+
+@lru_cache(maxsize=None)
+def get_athena_client():
+    """Athena クライアントを初回利用時に作成し、ウォームスタート間で使い回す"""
+    import boto3
+
+    return boto3.client('athena')
 
 
 def is_select_statement(sql: str) -> bool:
     """SQLがSELECT文かどうかを判定する"""
+    # 検証のときだけ必要になるので初回利用時に読み込む
+    import sqlparse
+
     parsed = sqlparse.parse(sql)
     if not parsed:
         return False
@@ -15,32 +40,57 @@ def is_select_statement(sql: str) -> bool:
 
 def execute_athena_query(sql: str, workgroup: str, event) -> Dict[str, Any]:
     """Athenaクエリを実行し結果をCSV形式で返す"""
-    athena_client = boto3.client('athena')
+    athena_client = get_athena_client()
+    metrics = current_metrics()
 
     try:
-        print('SQL 実行開始')
-        # クエリの実行
-        response = athena_client.start_query_execution(
-            QueryString=sql, WorkGroup=workgroup
-        )
-        print('SQL スタート')
-
-        query_execution_id = response['QueryExecutionId']
-
-        # クエリの完了を待つ
-        while True:
-            query_status = athena_client.get_query_execution(
-                QueryExecutionId=query_execution_id
+        # 長い期間の集計は期間を分けて並列に実行する
+        plan = plan_fanout(sql)
+        if plan:
+            return execute_fanout_query(athena_client, plan, workgroup, event)
+
+        with metrics.timer('AthenaTime'):
+            print('SQL 実行開始')
+            # クエリの実行
+            response = athena_client.start_query_execution(
+                QueryString=sql, WorkGroup=workgroup
             )
-            state = query_status['QueryExecution']['Status']['State']
-            if state in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
-                print(state)
-                break
+            print('SQL スタート')
+
+            query_execution_id = response['QueryExecutionId']
+
+            # クエリの完了を待つ
+            while True:
+                query_status = athena_client.get_query_execution(
+                    QueryExecutionId=query_execution_id
+                )
+                state = query_status['QueryExecution']['Status']['State']
+                if state in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
+                    print(state)
+                    break
+                time.sleep(POLL_INTERVAL)
+
+        # キュー待ち・実行時間とスキャン量は応答の最後の行にも付ける
+        summary = summarize_statistics([query_status['QueryExecution'].get('Statistics', {})])
+        record_statistics(metrics, summary)
+        reason = query_status['QueryExecution']['Status'].get('StateChangeReason', '')
+
+        if state != 'SUCCEEDED' and is_cutoff_exceeded(reason):
+            print(reason)
+            body = cutoff_message() + '\n' + format_statistics(summary)
+
+            response_body = {'text/Csv': {'body': body}}
+            action_response = {
+                'actionGroup': event['actionGroup'],
+                'apiPath': event['apiPath'],
+                'httpMethod': event['httpMethod'],
+                'httpStatusCode': 200,
+                'responseBody': response_body,
+            }
+            return {'messageVersion': '1.0', 'response': action_response}
 
         if state == 'FAILED':
-            error_message = query_status['QueryExecution']['Status'].get(
-                'StateChangeReason', 'Unknown error'
-            )
+            error_message = reason or 'Unknown error'
             print('Failed')
             print(error_message)
             body = f"{error_message} というエラーが出ました。リクエストを修正してください。"
@@ -70,7 +120,8 @@ def execute_athena_query(sql: str, workgroup: str, event) -> Dict[str, Any]:
             return {'messageVersion': '1.0', 'response': action_response}
 
         # 結果の取得
-        results = athena_client.get_query_results(QueryExecutionId=query_execution_id)
+        with metrics.span('AthenaResults'):
+            results = athena_client.get_query_results(QueryExecutionId=query_execution_id)
 
         # 結果をCSV形式に変換
         csv_buffer = StringIO()
@@ -80,9 +131,11 @@ def execute_athena_query(sql: str, workgroup: str, event) -> Dict[str, Any]:
         ]
         csv_buffer.write(','.join(header) + '\n')
 
+        metrics.put('RowsReturned', len(results['ResultSet']['Rows'][1:]))
         for row in results['ResultSet']['Rows'][1:]:  # ヘッダー行をスキップ
             values = [field.get('VarCharValue', '') for field in row['Data']]
             csv_buffer.write(','.join(values) + '\n')
+        csv_buffer.write(format_statistics(summary) + '\n')
         body = csv_buffer.getvalue()
         print(body)
         response_body = {'text/Csv': {'body': body}}
@@ -101,6 +154,42 @@ def execute_athena_query(sql: str, workgroup: str, event) -> Dict[str, Any]:
         return {'statusCode': 200, 'body': str(e)}
 
 
+def execute_fanout_query(athena_client, plan, workgroup: str, event) -> Dict[str, Any]:
+    """期間を分けたサブクエリの結果をまとめて CSV 形式で返す"""
+    metrics = current_metrics()
+    with metrics.timer('AthenaTime'):
+        # ワークグループの上限はサブクエリごとなので、合計のスキャン量も同じ上限で止める
+        result = execute_fanout(athena_client, plan, workgroup, BYTES_SCANNED_CUTOFF)
+    metrics.put('AthenaSubQueries', len(plan['slices']))
+    summary = summarize_statistics(result['statistics'])
+    record_statistics(metrics, summary)
+
+    if 'error' in result and is_cutoff_exceeded(result['error']):
+        body = cutoff_message() + '\n' + format_statistics(summary)
+    elif 'error' in result:
+        body = f"{result['error']} というエラーが出ました。リクエストを修正してください。"
+    else:
+        metrics.put('RowsReturned', len(result['rows']))
+        csv_buffer = StringIO()
+        csv_buffer.write(','.join(result['header']) + '\n')
+        for row in result['rows']:
+            csv_buffer.write(','.join('' if value is None else str(value) for value in row) + '\n')
+        csv_buffer.write(format_statistics(summary) + '\n')
+        body = csv_buffer.getvalue()
+    print(body)
+
+    response_body = {'text/Csv': {'body': body}}
+    action_response = {
+        'actionGroup': event['actionGroup'],
+        'apiPath': event['apiPath'],
+        'httpMethod': event['httpMethod'],
+        'httpStatusCode': 200,
+        'responseBody': response_body,
+    }
+    return {'messageVersion': '1.0', 'response': action_response}
+
+
+@metrics_handler
 def lambda_handler(event: Dict[str, Any], _) -> Dict[str, Any]:
 
     print(event)
@@ -117,17 +206,17 @@ def lambda_handler(event: Dict[str, Any], _) -> Dict[str, Any]:
 
     print(table)
 
-    # SQLの取得
-    sql = None
-    for param in event.get('parameters', []):
-        if param.get('name') == 'sql':
-            sql = param.get('value').replace('BEDROCK_LOG.INVOCATION_LOG', table)
-            break
-    print(sql)
-
+    # SQLの取得 (必須と SELECT の pattern は Athena を呼ぶ前にスキーマで確認する)
+    try:
+        sql = validator.validate(event).get('sql')
+    except ParameterError as e:
+        return {'statusCode': 200, 'body': str(e)}
     if not sql:
         return {'statusCode': 200, 'body': 'SQL parameter is required'}
 
+    sql = sql.replace('BEDROCK_LOG.INVOCATION_LOG', table)
+    print(sql)
+
     # SELECT文のみ許可
     if not is_select_statement(sql):
         return {'statusCode': 200, 'body': 'Only SELECT statements are allowed'}
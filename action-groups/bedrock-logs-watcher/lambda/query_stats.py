@@ -0,0 +1,70 @@
+"""Athena の実行統計 (スキャン量・キュー待ち・実行時間) をまとめ、Agent への応答とログに載せる
+
+スキャン量の上限はワークグループの bytesScannedCutoffPerQuery で強制する。
+上限を超えたクエリは Athena が中止するので、その場合は Agent が条件を絞ったクエリに直せるように伝える。
+"""
+import os
+import re
+import json
+from typing import Any, Dict, List
+
+# ワークグループに設定した 1 クエリあたりのスキャン量の上限 (バイト)。0 は上限なし
+BYTES_SCANNED_CUTOFF = int(os.environ.get('BYTES_SCANNED_CUTOFF', '0'))
+# 上限を超えて中止されたときの StateChangeReason
+CUTOFF_REASON = re.compile(r'bytes scanned limit', re.IGNORECASE)
+# 応答の最後に付ける実行統計の行の先頭
+STATISTICS_PREFIX = '# Athena statistics:'
+
+
+def format_bytes(value: float) -> str:
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if value < 1024:
+            return f"{value:.1f} {unit}" if unit != 'B' else f"{int(value)} B"
+        value /= 1024
+    return f"{value:.1f} TB"
+
+
+def summarize_statistics(statistics: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """クエリごとの Statistics をまとめる。スキャン量は合計、時間は並列に実行したので最大を取る"""
+    return {
+        'queries': len(statistics),
+        'dataScannedBytes': sum(s.get('DataScannedInBytes', 0) for s in statistics),
+        'queueTimeMs': max((s.get('QueryQueueTimeInMillis', 0) for s in statistics), default=0),
+        'engineTimeMs': max((s.get('EngineExecutionTimeInMillis', 0) for s in statistics), default=0),
+        'totalTimeMs': max((s.get('TotalExecutionTimeInMillis', 0) for s in statistics), default=0),
+    }
+
+
+def record_statistics(metrics, summary: Dict[str, Any]) -> None:
+    """メトリクスに記録し、ログにも 1 行で出力する"""
+    metrics.put('AthenaQueueTime', summary['queueTimeMs'], 'Milliseconds')
+    metrics.put('AthenaEngineTime', summary['engineTimeMs'], 'Milliseconds')
+    metrics.put('AthenaDataScanned', summary['dataScannedBytes'], 'Bytes')
+    print(json.dumps({'athenaStatistics': summary, 'bytesScannedCutoff': BYTES_SCANNED_CUTOFF}))
+
+
+def format_statistics(summary: Dict[str, Any]) -> str:
+    """応答の最後に付ける 1 行"""
+    text = (
+        f"{STATISTICS_PREFIX} scanned={format_bytes(summary['dataScannedBytes'])}, "
+        f"queue={summary['queueTimeMs']} ms, engine={summary['engineTimeMs']} ms, "
+        f"total={summary['totalTimeMs']} ms"
+    )
+    if summary['queries'] > 1:
+        text += f", sub-queries={summary['queries']}"
+    if BYTES_SCANNED_CUTOFF:
+        text += f", cutoff={format_bytes(BYTES_SCANNED_CUTOFF)}"
+    return text
+
+
+def is_cutoff_exceeded(reason: str) -> bool:
+    return bool(reason) and bool(CUTOFF_REASON.search(reason))
+
+
+def cutoff_message() -> str:
+    limit = format_bytes(BYTES_SCANNED_CUTOFF) if BYTES_SCANNED_CUTOFF else 'ワークグループの設定値'
+    return (
+        f"このクエリはスキャン量の上限 ({limit}) を超えたため中止されました。"
+        "WHERE 句で timestamp の期間を短くする、必要な列だけを SELECT する (inputbodyjson や outputbodyjson は大きいので避ける) などして、"
+        "スキャン量を減らしたクエリに修正してください。"
+    )
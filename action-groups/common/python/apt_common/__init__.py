@@ -0,0 +1,26 @@
+"""全ての Action Group の Lambda 関数で共有するモジュール (Lambda レイヤーとして配布する)"""
+from .metrics import (
+    Metrics,
+    MemorySink,
+    current_metrics,
+    get_sink,
+    metrics_handler,
+    set_sink,
+)
+from .sqlite_batch import parse_batch, read_only, run_batch
+from .validation import ParameterError, Validator, load_validator
+
+__all__ = [
+    'Metrics',
+    'MemorySink',
+    'ParameterError',
+    'Validator',
+    'current_metrics',
+    'get_sink',
+    'load_validator',
+    'metrics_handler',
+    'parse_batch',
+    'read_only',
+    'run_batch',
+    'set_sink',
+]
@@ -0,0 +1,208 @@
+"""CloudWatch Embedded Metric Format (EMF) で Action Group のメトリクスを出力する
+
+lambda_handler を metrics_handler で包むと、呼び出しごとに Latency, ResponseBytes, Errors, ColdStart を
+ActionGroup / ApiPath のディメンション付きの 1 行の JSON として標準出力に書き出す。
+CloudWatch Logs がこの行をメトリクスとして取り込むので、ログのクエリをしなくてもグラフにできる。
+ハンドラの中からは current_metrics() で独自のメトリクスを追加する。
+
+timer() と span() で計測した区間は、sessionId とともに spans として同じ行に出力する。
+tools/timeline.py がこれを invoke_agent のトレースと突き合わせてセッションごとのタイムラインにする。
+
+出力先は環境変数 METRICS_SINK で切り替える。
+
+    stdout (既定): Lambda のログに書き出す
+    memory: メモリに保持する (ローカルでの確認やベンチマーク用)
+    off: 出力しない
+"""
+import os
+import sys
+import json
+import time
+import functools
+import contextlib
+import contextvars
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'AgentPreparationToolkit')
+DIMENSIONS = ['ActionGroup', 'ApiPath']
+# MemorySink が保持する件数の上限 (ベンチマークで何度も呼び出してもメモリが増え続けないようにする)
+MEMORY_SINK_MAXLEN = 1000
+# 1 回の呼び出しで出力する区間の上限 (ログの 1 行が大きくなりすぎないようにする)
+MAX_SPANS = 100
+
+
+class StdoutSink:
+    def emit(self, document: Dict[str, Any]) -> None:
+        sys.stdout.write(json.dumps(document, ensure_ascii=False, default=str) + '\n')
+        sys.stdout.flush()
+
+
+class MemorySink:
+    def __init__(self, maxlen: int = MEMORY_SINK_MAXLEN):
+        self.documents: deque = deque(maxlen=maxlen)
+
+    def emit(self, document: Dict[str, Any]) -> None:
+        self.documents.append(document)
+
+    def clear(self) -> None:
+        self.documents.clear()
+
+
+class NullSink:
+    def emit(self, document: Dict[str, Any]) -> None:
+        pass
+
+
+SINKS = {'stdout': StdoutSink, 'memory': MemorySink, 'off': NullSink}
+
+_sink = None
+
+
+def get_sink():
+    """METRICS_SINK に応じた出力先を初回利用時に作成して返す"""
+    global _sink
+    if _sink is None:
+        _sink = SINKS.get(os.environ.get('METRICS_SINK', 'stdout'), StdoutSink)()
+    return _sink
+
+
+def set_sink(sink) -> None:
+    global _sink
+    _sink = sink
+
+
+class Metrics:
+    """1 回の呼び出しで記録するメトリクスとプロパティ"""
+
+    def __init__(self, action_group: Optional[str], api_path: Optional[str], namespace: str = NAMESPACE):
+        self.namespace = namespace
+        self.dimensions = {
+            'ActionGroup': action_group or 'unknown',
+            'ApiPath': api_path or 'unknown',
+        }
+        self.metrics: Dict[str, List[float]] = {}
+        self.units: Dict[str, str] = {}
+        self.properties: Dict[str, Any] = {}
+        self.spans: List[Dict[str, Any]] = []
+
+    def put(self, name: str, value: float, unit: str = 'Count') -> None:
+        """同じ名前で複数回記録した値は配列として出力する"""
+        self.metrics.setdefault(name, []).append(value)
+        self.units[name] = unit
+
+    def set_property(self, key: str, value: Any) -> None:
+        """メトリクスにはしないが、ログから検索したい値"""
+        self.properties[key] = value
+
+    def add_span(self, name: str, started_at: float, duration_ms: float) -> None:
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append(
+                {'name': name, 'start': round(started_at, 6), 'durationMs': round(duration_ms, 3)}
+            )
+
+    @contextlib.contextmanager
+    def span(self, name: str):
+        """メトリクスにはせず、区間だけを記録する"""
+        started_at = time.time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, started_at, (time.perf_counter() - start) * 1000)
+
+    @contextlib.contextmanager
+    def timer(self, name: str):
+        """処理時間をメトリクスとして記録し、区間も残す"""
+        started_at = time.time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.put(name, round(elapsed, 3), 'Milliseconds')
+            self.add_span(name, started_at, elapsed)
+
+    def to_document(self, timestamp: Optional[float] = None) -> Dict[str, Any]:
+        document: Dict[str, Any] = {
+            '_aws': {
+                'Timestamp': int((timestamp or time.time()) * 1000),
+                'CloudWatchMetrics': [
+                    {
+                        'Namespace': self.namespace,
+                        'Dimensions': [DIMENSIONS],
+                        'Metrics': [
+                            {'Name': name, 'Unit': self.units[name]} for name in self.metrics
+                        ],
+                    }
+                ],
+            },
+            **self.properties,
+            **self.dimensions,
+        }
+        for name, values in self.metrics.items():
+            document[name] = values[0] if len(values) == 1 else values
+        if self.spans:
+            document['spans'] = self.spans
+        return document
+
+    def flush(self, sink=None) -> None:
+        if self.metrics:
+            (sink or get_sink()).emit(self.to_document())
+        self.metrics = {}
+        self.units = {}
+        self.spans = []
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar('apt_common_metrics', default=None)
+_cold_start = True
+
+
+def current_metrics() -> Metrics:
+    """呼び出し中の Metrics を返す。ハンドラの外では出力されない Metrics を返す"""
+    metrics = _current.get()
+    return metrics if metrics is not None else Metrics(None, None)
+
+
+def response_bytes(response: Any) -> int:
+    """Agent に返すレスポンス本文のバイト数"""
+    body = response.get('response', {}).get('responseBody') if isinstance(response, dict) else None
+    payload = body if body is not None else response
+    return len(json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8'))
+
+
+def metrics_handler(handler: Callable) -> Callable:
+    """lambda_handler を包み、呼び出しごとに共通のメトリクスを出力する"""
+
+    @functools.wraps(handler)
+    def wrapper(event: Dict[str, Any], context: Any) -> Any:
+        global _cold_start
+        metrics = Metrics(event.get('actionGroup'), event.get('apiPath'))
+        metrics.put('ColdStart', 1 if _cold_start else 0)
+        _cold_start = False
+        metrics.set_property('sessionId', event.get('sessionId'))
+        token = _current.set(metrics)
+        started_at = time.time()
+        start = time.perf_counter()
+        try:
+            response = handler(event, context)
+            metrics.put('ResponseBytes', response_bytes(response), 'Bytes')
+            status = response.get('response', {}).get('httpStatusCode') if isinstance(response, dict) else None
+            if status is not None:
+                metrics.set_property('httpStatusCode', status)
+            metrics.put('Errors', 1 if status is None or status >= 400 else 0)
+            return response
+        except Exception:
+            metrics.put('Errors', 1)
+            raise
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            metrics.put('Latency', round(elapsed, 3), 'Milliseconds')
+            # ハンドラ全体の区間を先頭に置く
+            metrics.spans.insert(
+                0, {'name': 'handler', 'start': round(started_at, 6), 'durationMs': round(elapsed, 3)}
+            )
+            _current.reset(token)
+            metrics.flush()
+
+    return wrapper
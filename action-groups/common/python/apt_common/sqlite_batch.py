@@ -0,0 +1,145 @@
+"""複数の SELECT 文を 1 回の Action Group 呼び出しでまとめて実行する (hr / product-support の /batch-select)
+
+Agent は {"キー": "SELECT ...", ...} の JSON を queries パラメータに渡す。
+全ての文を 1 つの読み取りトランザクションの中で実行するので、同じ時点のデータを読む。
+受け付けるのは /select と同じく 1 つの SELECT (WITH ... SELECT) 文だけで、
+実行中は authorizer で読み取り以外の操作 (PRAGMA や INSERT / REPLACE など) を SQLite 自体に拒否させる。
+"""
+import re
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+# 1 回にまとめられる文の数の上限
+MAX_BATCH_STATEMENTS = 10
+
+# api-schema.yaml の /select の pattern と同じ規則
+SELECT_STATEMENT = re.compile(r'^(SELECT|WITH)\s+', re.IGNORECASE)
+
+# 読み取りのときに SQLite が authorizer に問い合わせる操作
+READ_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    sqlite3.SQLITE_RECURSIVE,
+}
+# 値を変えない PRAGMA。テーブルの定義を調べる pragma_table_info('employees') などの
+# テーブル値関数と、仮想テーブル (FTS5 など) が読み取りの中で内部的に使うもの
+READ_ONLY_PRAGMAS = {
+    'data_version',
+    'table_info',
+    'table_xinfo',
+    'table_list',
+    'index_list',
+    'index_info',
+    'index_xinfo',
+    'foreign_key_list',
+}
+# 仮想テーブルの初期化はスキーマ (sqlite_master) への UPDATE として問い合わせられる。
+# writable_schema を有効にしない限り実際には書き換えられない
+SCHEMA_TABLE = 'sqlite_master'
+
+
+def is_single_statement(sql: str) -> bool:
+    """文字列リテラルやコメントの外に、末尾以外の ; がないか"""
+    quote = None
+    i = 0
+    while i < len(sql):
+        char = sql[i]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"', '`'):
+            quote = char
+        elif char == '[':
+            quote = ']'
+        elif sql.startswith('--', i):
+            end = sql.find('\n', i)
+            i = len(sql) if end < 0 else end
+            continue
+        elif sql.startswith('/*', i):
+            end = sql.find('*/', i + 2)
+            i = len(sql) if end < 0 else end + 2
+            continue
+        elif char == ';':
+            return not sql[i + 1:].strip()
+        i += 1
+    return True
+
+
+def _authorize_read(action, arg1, *_):
+    if action in READ_ACTIONS:
+        return sqlite3.SQLITE_OK
+    if action == sqlite3.SQLITE_PRAGMA and arg1 in READ_ONLY_PRAGMAS:
+        return sqlite3.SQLITE_OK
+    if action == sqlite3.SQLITE_UPDATE and arg1 == SCHEMA_TABLE:
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+
+@contextmanager
+def read_only(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """この間に準備される文は読み取りしかできない (呼び出し側の PRAGMA では解除できない)"""
+    conn.set_authorizer(_authorize_read)
+    try:
+        yield conn
+    finally:
+        conn.set_authorizer(None)
+
+
+def parse_batch(value: Any) -> List[Tuple[str, str]]:
+    """queries パラメータを [(キー, SQL)] にする。JSON の配列なら添字をキーにする"""
+    if not value:
+        raise ValueError('queries が指定されていません。')
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValueError('queries は {"キー": "SELECT ..."} の形式の JSON で指定してください。')
+    if isinstance(value, list):
+        value = {str(index): sql for index, sql in enumerate(value)}
+    if not isinstance(value, dict) or not value:
+        raise ValueError('queries は {"キー": "SELECT ..."} の形式の JSON で指定してください。')
+    if len(value) > MAX_BATCH_STATEMENTS:
+        raise ValueError(f'queries に指定できる SQL は {MAX_BATCH_STATEMENTS} 件までです。')
+
+    statements = []
+    for key, sql in value.items():
+        if not isinstance(sql, str) or not sql.strip():
+            raise ValueError(f'{key} の SQL が指定されていません。')
+        if not SELECT_STATEMENT.match(sql.strip()) or not is_single_statement(sql):
+            raise ValueError(f'{key} には SELECT 文を 1 つだけ指定してください。')
+        statements.append((str(key), sql))
+    return statements
+
+
+def run_batch(conn: sqlite3.Connection, statements: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """読み取りトランザクションの中で順に実行し、キーごとに結果と処理時間を返す
+
+    1 つの文が失敗しても残りは実行し、その文の結果に error を入れる。
+    """
+    results: Dict[str, Any] = {}
+    if conn.in_transaction:
+        conn.commit()
+    try:
+        conn.execute('BEGIN')
+        with read_only(conn):
+            for key, sql in statements:
+                start = time.perf_counter()
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(sql)
+                    columns = [description[0] for description in cursor.description or []]
+                    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                    results[key] = {'rows': rows, 'elapsedMs': round((time.perf_counter() - start) * 1000, 3)}
+                except sqlite3.Error as e:
+                    results[key] = {'error': str(e), 'elapsedMs': round((time.perf_counter() - start) * 1000, 3)}
+                finally:
+                    cursor.close()
+        conn.execute('COMMIT')
+    finally:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+    return results
@@ -0,0 +1,196 @@
+"""Action Group の OpenAPI スキーマからパラメータの検証と型変換を組み立てる
+
+コールドスタート時に 1 回だけ api-schema.yaml を読み込み、apiPath / httpMethod ごとに
+必須・型・pattern (正規表現はここでコンパイルしておく)・enum・範囲のチェックを用意する。
+ハンドラは DB や S3、Athena を使う前に validate() を呼び、不正な呼び出しをすぐに返す。
+
+スキーマは Lambda レイヤーとして /opt/api-schema.yaml に置かれる (環境変数 API_SCHEMA_PATH)。
+スキーマや PyYAML が見つからない場合は検証せず、パラメータを文字列のまま返す。
+"""
+import os
+import re
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger()
+
+DEFAULT_SCHEMA_PATH = '/opt/api-schema.yaml'
+
+
+class ParameterError(ValueError):
+    """スキーマに合わないパラメータ"""
+
+
+def to_integer(value: Any) -> int:
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, int):
+        return value
+    number = float(str(value).strip())
+    if not number.is_integer():
+        raise ValueError
+    return int(number)
+
+
+def to_number(value: Any) -> float:
+    if isinstance(value, bool):
+        raise ValueError
+    return float(str(value).strip())
+
+
+def to_boolean(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('true', '1', 'yes'):
+        return True
+    if text in ('false', '0', 'no'):
+        return False
+    raise ValueError
+
+
+def to_array(value: Any) -> List[Any]:
+    """JSON の配列と、Bedrock Agents が渡す [a, b] 形式の両方を受け付ける"""
+    if isinstance(value, list):
+        return value
+    text = str(value).strip()
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        if not (text.startswith('[') and text.endswith(']')):
+            raise
+        parsed = [item.strip() for item in text[1:-1].split(',') if item.strip()]
+    if not isinstance(parsed, list):
+        raise ValueError
+    return parsed
+
+
+def to_object(value: Any) -> Dict[str, Any]:
+    parsed = value if isinstance(value, dict) else json.loads(str(value))
+    if not isinstance(parsed, dict):
+        raise ValueError
+    return parsed
+
+
+COERCIONS: Dict[str, Callable[[Any], Any]] = {
+    'string': str,
+    'integer': to_integer,
+    'number': to_number,
+    'boolean': to_boolean,
+    'array': to_array,
+    'object': to_object,
+}
+
+
+class Parameter:
+    """1 つのパラメータの検証と型変換"""
+
+    def __init__(self, name: str, required: bool, schema: Dict[str, Any]):
+        self.name = name
+        self.required = required
+        self.type = schema.get('type', 'string')
+        self.coerce = COERCIONS.get(self.type, str)
+        # Agent が書く SQL やコードは複数行で小文字のこともあるので、. は改行にも一致させ、大文字・小文字は区別しない
+        self.pattern = re.compile(schema['pattern'], re.DOTALL | re.IGNORECASE) if schema.get('pattern') else None
+        self.enum = schema.get('enum')
+        self.minimum = schema.get('minimum')
+        self.maximum = schema.get('maximum')
+        self.min_length = schema.get('minLength')
+        self.max_length = schema.get('maxLength')
+
+    def __call__(self, value: Any) -> Any:
+        try:
+            value = self.coerce(value)
+        except (TypeError, ValueError):
+            raise ParameterError(f"{self.name} は {self.type} で指定してください: {str(value)[:100]}")
+        if self.pattern is not None and isinstance(value, str) and not self.pattern.search(value.strip()):
+            raise ParameterError(f"{self.name} が形式 {self.pattern.pattern} に一致しません。")
+        if self.enum is not None and value not in self.enum:
+            raise ParameterError(f"{self.name} は {', '.join(map(str, self.enum))} のいずれかで指定してください。")
+        if self.minimum is not None and value < self.minimum:
+            raise ParameterError(f"{self.name} は {self.minimum} 以上で指定してください。")
+        if self.maximum is not None and value > self.maximum:
+            raise ParameterError(f"{self.name} は {self.maximum} 以下で指定してください。")
+        if self.min_length is not None and isinstance(value, str) and len(value) < self.min_length:
+            raise ParameterError(f"{self.name} は {self.min_length} 文字以上で指定してください。")
+        if self.max_length is not None and isinstance(value, str) and len(value) > self.max_length:
+            raise ParameterError(f"{self.name} は {self.max_length} 文字以下で指定してください。")
+        return value
+
+
+class Operation:
+    """apiPath / httpMethod ごとのパラメータ定義"""
+
+    def __init__(self, operation: Dict[str, Any]):
+        self.parameters = {
+            parameter['name']: Parameter(parameter['name'], bool(parameter.get('required')), parameter.get('schema', {}))
+            for parameter in operation.get('parameters', [])
+        }
+        content = (operation.get('requestBody') or {}).get('content', {})
+        for media in content.values():
+            schema = media.get('schema', {})
+            required = set(schema.get('required', []))
+            for name, property_schema in (schema.get('properties') or {}).items():
+                self.parameters[name] = Parameter(name, name in required, property_schema)
+        self.required = [name for name, parameter in self.parameters.items() if parameter.required]
+
+    def validate(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        missing = [name for name in self.required if values.get(name) in (None, '')]
+        if missing:
+            raise ParameterError(f"{', '.join(missing)} が指定されていません。")
+        result = dict(values)
+        for name, value in values.items():
+            parameter = self.parameters.get(name)
+            if parameter is None or (value in (None, '') and not parameter.required):
+                continue
+            result[name] = parameter(value)
+        return result
+
+
+def event_values(event: Dict[str, Any]) -> Dict[str, Any]:
+    """parameters と requestBody の値を {名前: 値} にする"""
+    values = {parameter.get('name'): parameter.get('value') for parameter in event.get('parameters') or []}
+    content = (event.get('requestBody') or {}).get('content', {})
+    for media in content.values():
+        for prop in media.get('properties', []):
+            values[prop.get('name')] = prop.get('value')
+    return values
+
+
+class Validator:
+    def __init__(self, schema: Optional[Dict[str, Any]] = None):
+        self.operations: Dict[Tuple[str, str], Operation] = {}
+        for api_path, operations in ((schema or {}).get('paths') or {}).items():
+            for method, operation in operations.items():
+                if isinstance(operation, dict):
+                    self.operations[(api_path, method.upper())] = Operation(operation)
+
+    def validate(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """スキーマに従って変換したパラメータを返す。合わない場合は ParameterError
+
+        スキーマにない apiPath はハンドラに任せ、パラメータをそのまま返す。
+        """
+        values = event_values(event)
+        operation = self.operations.get((event.get('apiPath'), str(event.get('httpMethod', '')).upper()))
+        if operation is None:
+            return values
+        return operation.validate(values)
+
+
+def load_validator(path: Optional[str] = None) -> Validator:
+    """スキーマを読み込んで Validator を作る。モジュールの読み込み時 (コールドスタート時) に呼ぶ
+
+    スキーマがない場合だけ検証を無効にする。スキーマがあるのに pyyaml を読み込めない場合は
+    検証なしで動き続けないよう、ImportError をそのまま送出する。
+    """
+    path = path or os.environ.get('API_SCHEMA_PATH', DEFAULT_SCHEMA_PATH)
+    try:
+        with open(path, 'rt', encoding='utf-8') as f:
+            text = f.read()
+    except OSError as e:
+        logger.warning(f"Parameter validation is disabled: {e}")
+        return Validator()
+    import yaml
+
+    return Validator(yaml.safe_load(text))
@@ -0,0 +1,198 @@
+"""契約書の本文を条項ごとに n-gram の転置インデックスにして、/search で検索する
+
+日本語は単語の区切りがないため、本文を正規化して文字 n-gram (既定は 2-gram) に分け、
+条項 (「第N条」や Markdown の見出しの区切り) ごとに BM25 でスコアを付ける。
+インデックスは cdk deploy の時に data-source/contract-searcher/templates から作り
+(このファイルをスクリプトとして実行する)、gzip した JSON として S3 の CONTRACT_INDEX_KEY (index/ の下) に置く。
+Lambda はそれを読み込むだけで、作り直しはしない。
+"""
+import os
+import io
+import re
+import sys
+import json
+import gzip
+import math
+import heapq
+import hashlib
+import argparse
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Tuple
+
+CONTRACT_INDEX_KEY = os.environ.get('CONTRACT_INDEX_KEY', 'index/contracts.json.gz')
+# インデックスの形式や分割の方法を変えたときに作り直すためのバージョン
+INDEX_VERSION = 1
+NGRAM = 2
+TEXT_EXTENSIONS = ('.md', '.txt')
+# 検索結果に含める条項の本文の上限 (文字数)
+MAX_CLAUSE_CHARS = 600
+BM25_K1 = 1.2
+BM25_B = 0.75
+# ひらがなだけの n-gram (「した」「たい」「する」など) は助詞や語尾の断片で、
+# どの条項にも現れるため検索には使わない
+STOP_GRAM = re.compile(r'^[\u3041-\u309f\u30fc]+$')
+# 条項が含んでいなければならない、クエリの n-gram (ストップ n-gram を除く) の割合
+MIN_QUERY_COVERAGE = 0.3
+
+CLAUSE_HEADING = re.compile(r'^(?:第[0-9０-９一二三四五六七八九十百]+条.*|#{1,6}\s+.+)$', re.MULTILINE)
+
+
+def normalize(text: str) -> str:
+    """全角・半角と大文字・小文字を揃え、空白や記号を除く"""
+    return ''.join(char for char in unicodedata.normalize('NFKC', text).lower() if char.isalnum())
+
+
+def ngrams(text: str, n: int = NGRAM) -> List[str]:
+    normalized = normalize(text)
+    if len(normalized) < n:
+        return [normalized] if normalized else []
+    return [normalized[i:i + n] for i in range(len(normalized) - n + 1)]
+
+
+def split_clauses(text: str) -> List[Tuple[str, int, int]]:
+    """本文を [(見出し, 開始位置, 終了位置)] に分ける。位置は本文の文字単位のオフセット"""
+    starts = [match.start() for match in CLAUSE_HEADING.finditer(text)]
+    if not starts or starts[0] > 0:
+        starts.insert(0, 0)
+    clauses = []
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        body = text[start:end].rstrip()
+        if not body.strip():
+            continue
+        first_line = body.lstrip().splitlines()[0]
+        title = first_line.lstrip('#').strip() if CLAUSE_HEADING.match(first_line) else ''
+        clauses.append((title, start, start + len(body)))
+    return clauses
+
+
+def encode_postings(entries: List[Tuple[int, int]]) -> List[int]:
+    """[(条項の番号, 出現回数)] を差分で詰めた [差分, 出現回数, ...] にする"""
+    flat = []
+    previous = 0
+    for clause_id, count in entries:
+        flat.extend((clause_id - previous, count))
+        previous = clause_id
+    return flat
+
+
+def decode_postings(flat: List[int]) -> Iterable[Tuple[int, int]]:
+    clause_id = 0
+    for i in range(0, len(flat), 2):
+        clause_id += flat[i]
+        yield clause_id, flat[i + 1]
+
+
+def build_index(documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """[{key, etag, text}] から転置インデックスを作る"""
+    clauses = []
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    for doc_id, document in enumerate(documents):
+        text = document['text']
+        for title, start, end in split_clauses(text):
+            clause_id = len(clauses)
+            grams = Counter(ngrams(text[start:end]))
+            clauses.append([doc_id, title, start, end, sum(grams.values()), text[start:end]])
+            for gram, count in grams.items():
+                postings.setdefault(gram, []).append((clause_id, count))
+    return {
+        'version': INDEX_VERSION,
+        'ngram': NGRAM,
+        'documents': [{'key': document['key'], 'etag': document['etag']} for document in documents],
+        # [ドキュメントの番号, 見出し, 開始位置, 終了位置, n-gram の数, 本文]
+        'clauses': clauses,
+        'postings': {gram: encode_postings(entries) for gram, entries in postings.items()},
+    }
+
+
+def dump_index(index: Dict[str, Any]) -> bytes:
+    # 同じ契約書からは同じバイト列になるよう、gzip の mtime は固定する
+    return gzip.compress(json.dumps(index, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), mtime=0)
+
+
+def load_index(data: bytes) -> Dict[str, Any]:
+    with gzip.GzipFile(fileobj=io.BytesIO(data)) as f:
+        return json.loads(f.read().decode('utf-8'))
+
+
+def search(index: Dict[str, Any], query: str, limit: int = 5) -> List[Dict[str, Any]]:
+    """クエリの n-gram を多く含む条項を BM25 のスコアの高い順に返す
+
+    ストップ n-gram は数えず、残りの n-gram の MIN_QUERY_COVERAGE 以上を含む条項だけを返す。
+    語尾の 1 つの n-gram だけが一致した条項が上位に来ないようにするため。
+    """
+    clauses = index['clauses']
+    if not clauses:
+        return []
+    average_length = sum(clause[4] for clause in clauses) / len(clauses) or 1
+    query_grams = Counter(ngrams(query, index['ngram']))
+    # ひらがなだけのクエリは、そのまま全ての n-gram で検索する
+    query_grams = Counter({gram: count for gram, count in query_grams.items() if not STOP_GRAM.match(gram)}) or query_grams
+    min_matched = max(1, math.ceil(len(query_grams) * MIN_QUERY_COVERAGE))
+    scores: Dict[int, float] = {}
+    matched: Counter = Counter()
+    for gram, query_count in query_grams.items():
+        flat = index['postings'].get(gram)
+        if not flat:
+            continue
+        frequency = len(flat) // 2
+        idf = math.log(1 + (len(clauses) - frequency + 0.5) / (frequency + 0.5))
+        for clause_id, count in decode_postings(flat):
+            length = clauses[clause_id][4]
+            tf = count * (BM25_K1 + 1) / (count + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+            scores[clause_id] = scores.get(clause_id, 0.0) + idf * tf * query_count
+            matched[clause_id] += 1
+
+    candidates = [(clause_id, score) for clause_id, score in scores.items() if matched[clause_id] >= min_matched]
+    hits = []
+    for clause_id, score in heapq.nlargest(limit, candidates, key=lambda item: item[1]):
+        doc_id, title, start, end, _, text = clauses[clause_id]
+        hits.append({
+            'key': index['documents'][doc_id]['key'],
+            'title': title,
+            'start': start,
+            'end': end,
+            'score': round(score, 3),
+            'text': text if len(text) <= MAX_CLAUSE_CHARS else text[:MAX_CLAUSE_CHARS] + '…',
+        })
+    return hits
+
+
+def build_from_directory(directory: str, prefix: str) -> Dict[str, Any]:
+    """ローカルのディレクトリの契約書から、S3 のキー (prefix + 相対パス) でインデックスを作る
+
+    ETag は BucketDeployment がアップロードしたときと同じ MD5 にする。
+    """
+    documents = []
+    for current, _, files in os.walk(directory):
+        for file_name in files:
+            if not file_name.endswith(TEXT_EXTENSIONS):
+                continue
+            path = os.path.join(current, file_name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            documents.append({
+                'key': prefix + os.path.relpath(path, directory).replace(os.sep, '/'),
+                'etag': f'"{hashlib.md5(data).hexdigest()}"',
+                'text': data.decode('utf-8'),
+            })
+    return build_index(sorted(documents, key=lambda document: document['key']))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Build the contract clause index for /search')
+    parser.add_argument('source', help='Directory of the contract documents')
+    parser.add_argument('output', help='Path of the gzipped JSON index to write')
+    parser.add_argument('--prefix', default='data/', help='S3 key prefix of the documents (DOC_DATA_PREFIX)')
+    args = parser.parse_args()
+
+    index = build_from_directory(args.source, args.prefix)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'wb') as f:
+        f.write(dump_index(index))
+    print(f"{len(index['documents'])} documents, {len(index['clauses'])} clauses, {len(index['postings'])} n-grams -> {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,66 @@
 import json
 import os
-import boto3
-from botocore.exceptions import ClientError
+import time
+from functools import lru_cache
+
+from apt_common import ParameterError, current_metrics, load_validator, metrics_handler
+
+import contract_index
 
-s3_client = boto3.client('s3')
 bucket_name = os.environ.get('CONTRACT_BUCKET')
 doc_data_prefix = os.environ.get('DOC_DATA_PREFIX')
 
+# api-schema.yaml から組み立てたパラメータの検証 (コールドスタート時に 1 回だけ作る)
+validator = load_validator()
+
+
+@lru_cache(maxsize=None)
+def get_s3_client():
+    """S3 クライアントを初回利用時に作成し、ウォームスタート間で使い回す"""
+    import boto3
+
+    return boto3.client('s3')
+
+
+class ContractIndexNotFound(Exception):
+    """デプロイ時に作られるインデックスが S3 にない"""
 
+
+# S3 のインデックスが更新されていないかを確認する間隔 (秒)
+CONTRACT_INDEX_TTL_SECONDS = int(os.environ.get('CONTRACT_INDEX_TTL_SECONDS', '300'))
+_contract_index = {'index': None, 'etag': None, 'checked_at': 0.0}
+
+
+def get_contract_index():
+    """デプロイ時に作られた契約書の転置インデックスを S3 から読み込み、ウォームスタート間で使い回す
+
+    CONTRACT_INDEX_TTL_SECONDS ごとに ETag を確認し、再デプロイで変わっていれば読み直す。
+    """
+    now = time.monotonic()
+    if _contract_index['index'] is not None and now - _contract_index['checked_at'] < CONTRACT_INDEX_TTL_SECONDS:
+        return _contract_index['index']
+
+    s3_client = get_s3_client()
+    key = contract_index.CONTRACT_INDEX_KEY
+    try:
+        with current_metrics().timer('S3Time'):
+            etag = s3_client.head_object(Bucket=bucket_name, Key=key)['ETag']
+            if etag != _contract_index['etag']:
+                with current_metrics().span('IndexLoad'):
+                    data = s3_client.get_object(Bucket=bucket_name, Key=key)['Body'].read()
+                    _contract_index['index'] = contract_index.load_index(data)
+                _contract_index['etag'] = etag
+                print(f"Contract index loaded: {key} {etag}")
+    except s3_client.exceptions.ClientError as e:
+        if _contract_index['index'] is None:
+            raise ContractIndexNotFound(f"契約書のインデックス {key} を読み込めません。cdk deploy で作成してください: {e}")
+        # 読み込み済みのインデックスがあれば、確認に失敗してもそれを使う
+        print(f"Failed to check contract index, using the loaded one: {e}")
+    _contract_index['checked_at'] = now
+    return _contract_index['index']
+
+
+@metrics_handler
 def lambda_handler(event, context):
     try:
         print(f"Received event: {json.dumps(event)}")
@@ -31,14 +84,24 @@ def lambda_handler(event, context):
         # APIパスを取得
         api_path = event.get('apiPath', '')
 
-        # パラメータからファイル名を取得（/listと/getの両方で使用）
-        parameters = event.get('parameters', [])
-        file_name = None
+        # パラメータからファイル名を取得（/listと/getの両方で使用、/search では検索する文）
+        # スキーマの必須・型を S3 にアクセスする前に確認する
+        try:
+            parameters = validator.validate(event)
+            file_name = parameters.get('text')
+        except ParameterError as e:
+            error_body = {'error': str(e)}
+            response_body = {'application/json': {'body': error_body}}
+            print(f"Error response: {response_body}")
 
-        for param in parameters:
-            if param.get('name') == 'text':
-                file_name = param.get('value', '')
-                break
+            action_response = {
+                'actionGroup': event.get('actionGroup', ''),
+                'apiPath': event.get('apiPath', ''),
+                'httpMethod': event.get('httpMethod', ''),
+                'httpStatusCode': 400,
+                'responseBody': response_body,
+            }
+            return {'messageVersion': '1.0', 'response': action_response}
 
         # /list エンドポイント - バケット内のファイルとその更新日を返す
         if api_path == '/list':
@@ -62,6 +125,10 @@ def lambda_handler(event, context):
 
             return get_signed_url(bucket_name, file_name, event)
 
+        # /search エンドポイント - 契約書の本文を検索し、一致する条項を返す
+        elif api_path == '/search':
+            return search_contracts(event, file_name, parameters.get('limit', 5))
+
         else:
             error_body = {'error': f'Invalid API path: {api_path}'}
             response_body = {'application/json': {'body': error_body}}
@@ -94,7 +161,8 @@ def lambda_handler(event, context):
 def list_files(bucket_name, event, file_name=None):
     """S3バケット内のファイルとその更新日を返す。file_nameが指定された場合は一致するファイルのみを返す"""
     try:
-        response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=doc_data_prefix)
+        with current_metrics().timer('S3Time'):
+            response = get_s3_client().list_objects_v2(Bucket=bucket_name, Prefix=doc_data_prefix)
 
         files = []
         if 'Contents' in response:
@@ -105,6 +173,7 @@ def list_files(bucket_name, event, file_name=None):
                     last_modified = item['LastModified'].isoformat()
                     files.append({'key': item['Key'], 'lastModified': last_modified})
 
+        current_metrics().put('RowsReturned', len(files))
         body = {'files': files}
         response_body = {'application/json': {'body': body}}
         print(f"Success response: {response_body}")
@@ -118,7 +187,43 @@ def list_files(bucket_name, event, file_name=None):
         }
         return {'messageVersion': '1.0', 'response': action_response}
 
-    except ClientError as e:
+    except get_s3_client().exceptions.ClientError as e:
+        error_body = {'error': str(e)}
+        response_body = {'application/json': {'body': error_body}}
+        print(f"Error response: {response_body}")
+
+        action_response = {
+            'actionGroup': event.get('actionGroup', ''),
+            'apiPath': event.get('apiPath', ''),
+            'httpMethod': event.get('httpMethod', ''),
+            'httpStatusCode': 500,
+            'responseBody': response_body,
+        }
+        return {'messageVersion': '1.0', 'response': action_response}
+
+
+def search_contracts(event, query, limit):
+    """転置インデックスから query に一致する条項を、ファイルのキーと本文中の位置とともに返す"""
+    try:
+        index = get_contract_index()
+        with current_metrics().timer('QueryTime'):
+            hits = contract_index.search(index, query, limit)
+
+        current_metrics().put('RowsReturned', len(hits))
+        body = {'hits': hits}
+        response_body = {'application/json': {'body': body}}
+        print(f"Success response: {response_body}")
+
+        action_response = {
+            'actionGroup': event.get('actionGroup', ''),
+            'apiPath': event.get('apiPath', ''),
+            'httpMethod': event.get('httpMethod', ''),
+            'httpStatusCode': 200,
+            'responseBody': response_body,
+        }
+        return {'messageVersion': '1.0', 'response': action_response}
+
+    except ContractIndexNotFound as e:
         error_body = {'error': str(e)}
         response_body = {'application/json': {'body': error_body}}
         print(f"Error response: {response_body}")
@@ -140,11 +245,12 @@ def get_signed_url(bucket_name, file_key, event):
         expiration = 3600  # 60分
 
         # 署名付きURLを生成
-        signed_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': bucket_name, 'Key': file_key},
-            ExpiresIn=expiration,
-        )
+        with current_metrics().span('S3Presign'):
+            signed_url = get_s3_client().generate_presigned_url(
+                'get_object',
+                Params={'Bucket': bucket_name, 'Key': file_key},
+                ExpiresIn=expiration,
+            )
 
         body = {'signedUrl': signed_url, 'expiresIn': expiration, 'fileName': file_key}
         response_body = {'application/json': {'body': body}}
@@ -159,7 +265,7 @@ def get_signed_url(bucket_name, file_key, event):
         }
         return {'messageVersion': '1.0', 'response': action_response}
 
-    except ClientError as e:
+    except get_s3_client().exceptions.ClientError as e:
         error_body = {'error': str(e)}
         response_body = {'application/json': {'body': error_body}}
         print(f"Error response: {response_body}")
@@ -2,6 +2,22 @@ import sqlite3
 import json
 from typing import Dict, Any
 
+from apt_common import (
+    ParameterError,
+    current_metrics,
+    load_validator,
+    metrics_handler,
+    parse_batch,
+    read_only,
+    run_batch,
+)
+from leave import create_leave_schema, refresh_leave_entitlements
+
+DB_PATH = '/tmp/employee.db'
+
+# api-schema.yaml から組み立てたパラメータの検証 (コールドスタート時に 1 回だけ作る)
+validator = load_validator()
+
 
 def create_error_response(
     event: Dict[str, Any], error_message: str, status_code: int = 400
@@ -22,6 +38,80 @@ def create_error_response(
     return {'messageVersion': '1.0', 'response': action_response}
 
 
+def prepare_database(cursor) -> None:
+    """テーブル作成とサンプルデータ投入、年休付与日数の計算"""
+    ddl = '''
+    CREATE TABLE IF NOT EXISTS employees (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        hire_date DATE NOT NULL
+    )
+    '''
+    cursor.execute(ddl)
+    create_leave_schema(cursor)
+
+    # サンプルデータ投入
+    employees = [
+        (1, 'Kazuhito Go', '2020-01-01'),
+        (2, 'Taro Yamada', '2022-04-01'),
+    ]
+    cursor.executemany(
+        'INSERT OR IGNORE INTO employees VALUES (?, ?, ?)', employees
+    )
+    cursor.connection.commit()
+
+    # 追加・変更された社員の年休付与日数だけを計算し直す
+    with current_metrics().span('LeaveRefresh'):
+        refresh_leave_entitlements(cursor.connection)
+
+
+def batch_select(event: Dict[str, Any], parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """複数の SELECT 文を同じ時点のデータに対して実行し、キーごとの結果を返す"""
+    try:
+        statements = parse_batch(parameters.get('queries'))
+    except ValueError as e:
+        return create_error_response(event, str(e))
+
+    dangerous_keywords = ["DROP", "DELETE", "UPDATE", "INSERT", "TRUNCATE"]
+    for key, sql in statements:
+        if any(keyword in sql.upper() for keyword in dangerous_keywords):
+            return create_error_response(
+                event, f"不正なSQLクエリが検出されました。({key})", 403
+            )
+
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+    except sqlite3.Error as e:
+        return create_error_response(event, f"データベース接続エラー: {str(e)}", 500)
+
+    try:
+        prepare_database(cursor)
+        metrics = current_metrics()
+        with metrics.timer('QueryTime'):
+            results = run_batch(conn, statements)
+        metrics.put('BatchStatements', len(statements))
+        metrics.put('RowsReturned', sum(len(result.get('rows', [])) for result in results.values()))
+
+        response_body = {'application/json': {'body': json.dumps(results, ensure_ascii=False)}}
+        action_response = {
+            'actionGroup': event['actionGroup'],
+            'apiPath': event['apiPath'],
+            'httpMethod': event['httpMethod'],
+            'httpStatusCode': 200,
+            'responseBody': response_body,
+        }
+        return {'messageVersion': '1.0', 'response': action_response}
+
+    except sqlite3.Error as e:
+        return create_error_response(event, f"SQLクエリ実行エラー: {str(e)}", 500)
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@metrics_handler
 def lambda_handler(event: Dict[str, Any], _) -> Dict[str, Any]:
     try:
         print(event)
@@ -29,16 +119,20 @@ def lambda_handler(event: Dict[str, Any], _) -> Dict[str, Any]:
         if not api_path:
             return create_error_response(event, "APIパスが指定されていません。")
 
-        if api_path != "/select":
+        if api_path not in ("/select", "/batch-select"):
             return create_error_response(event, f"未対応のAPIパス: {api_path}")
 
+        # スキーマの必須・型・pattern を DB に接続する前に確認する
+        try:
+            parameters = validator.validate(event)
+        except ParameterError as e:
+            return create_error_response(event, str(e))
+
+        if api_path == "/batch-select":
+            return batch_select(event, parameters)
+
         # SQLパラメータの取得
-        parameters = event.get('parameters', [])
-        sql = None
-        for param in parameters:
-            if param.get('name') == 'sql':
-                sql = param.get('value')
-                break
+        sql = parameters.get('sql')
 
         if not sql:
             return create_error_response(event, "SQLクエリが指定されていません。")
@@ -51,9 +145,8 @@ def lambda_handler(event: Dict[str, Any], _) -> Dict[str, Any]:
             )
 
         # データベース接続
-        db_path = '/tmp/employee.db'
         try:
-            conn = sqlite3.connect(db_path)
+            conn = sqlite3.connect(DB_PATH)
             cursor = conn.cursor()
         except sqlite3.Error as e:
             return create_error_response(
@@ -61,34 +154,21 @@ def lambda_handler(event: Dict[str, Any], _) -> Dict[str, Any]:
             )
 
         try:
-            # テーブル作成
-            ddl = '''
-            CREATE TABLE IF NOT EXISTS employees (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                hire_date DATE NOT NULL
-            )
-            '''
-            cursor.execute(ddl)
-
-            # サンプルデータ投入
-            employees = [
-                (1, 'Kazuhito Go', '2020-01-01'),
-                (2, 'Taro Yamada', '2022-04-01'),
-            ]
-            cursor.executemany(
-                'INSERT OR IGNORE INTO employees VALUES (?, ?, ?)', employees
-            )
-            conn.commit()
+            # テーブル作成とサンプルデータ投入
+            prepare_database(cursor)
 
             # クエリ実行
-            cursor.execute(sql)
+            metrics = current_metrics()
+            # 読み取り以外の操作は SQLite に拒否させる
+            with metrics.timer('QueryTime'), read_only(conn):
+                cursor.execute(sql)
 
-            # カラム名を取得
-            columns = [description[0] for description in cursor.description]
+                # カラム名を取得
+                columns = [description[0] for description in cursor.description]
 
-            # 結果を取得
-            rows = cursor.fetchall()
+                # 結果を取得
+                rows = cursor.fetchall()
+            metrics.put('RowsReturned', len(rows))
 
             # 連想配列のリストを作成
             result_list = []
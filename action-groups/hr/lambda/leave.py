@@ -0,0 +1,176 @@
+import os
+import sqlite3
+from datetime import date
+from typing import List, Optional, Tuple
+
+# 年度の開始月 (4 月始まり)
+FISCAL_YEAR_START_MONTH = int(os.environ.get('FISCAL_YEAR_START_MONTH', '4'))
+
+# data-source/hr/vacation.md の年休付与規則: (勤続月数の下限, 付与日数)
+# 入社 6 か月後に初回付与し、以降は 1 年ごとに付与する
+LEAVE_GRANT_RULES: List[Tuple[int, int]] = [
+    (78, 20),
+    (66, 18),
+    (54, 16),
+    (42, 14),
+    (30, 12),
+    (18, 11),
+    (6, 10),
+]
+FIRST_GRANT_MONTHS = 6
+
+LEAVE_DDL = '''
+CREATE TABLE IF NOT EXISTS leave_entitlements (
+    employee_id INTEGER NOT NULL,
+    fiscal_year INTEGER NOT NULL,
+    grant_date DATE NOT NULL,
+    tenure_years REAL NOT NULL,
+    days INTEGER NOT NULL,
+    PRIMARY KEY (employee_id, fiscal_year)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS leave_refresh_queue (
+    employee_id INTEGER PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS leave_refresh_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    fiscal_year INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS employees_leave_insert AFTER INSERT ON employees
+BEGIN
+    INSERT OR IGNORE INTO leave_refresh_queue VALUES (NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS employees_leave_update AFTER UPDATE OF id, hire_date ON employees
+BEGIN
+    INSERT OR IGNORE INTO leave_refresh_queue VALUES (OLD.id);
+    INSERT OR IGNORE INTO leave_refresh_queue VALUES (NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS employees_leave_delete AFTER DELETE ON employees
+BEGIN
+    INSERT OR IGNORE INTO leave_refresh_queue VALUES (OLD.id);
+END;
+
+CREATE VIEW IF NOT EXISTS employee_leave AS
+SELECT
+    e.id AS employee_id,
+    e.name,
+    e.hire_date,
+    l.fiscal_year,
+    l.grant_date,
+    l.tenure_years,
+    l.days
+FROM employees e
+JOIN leave_entitlements l ON l.employee_id = e.id;
+
+CREATE VIEW IF NOT EXISTS current_leave_entitlements AS
+SELECT employee_leave.*
+FROM employee_leave
+JOIN leave_refresh_state s ON employee_leave.fiscal_year = s.fiscal_year;
+'''
+
+
+def fiscal_year(day: date) -> int:
+    """日付が属する年度 (4 月始まりなら 2025-03-31 は 2024 年度)"""
+    return day.year if day.month >= FISCAL_YEAR_START_MONTH else day.year - 1
+
+
+def add_months(day: date, months: int) -> date:
+    """月を加算する。移動先の月に同じ日がなければ月末にする"""
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    last_day = (next_month - date(year, month, 1)).days
+    return date(year, month, min(day.day, last_day))
+
+
+def grant_days(tenure_months: int) -> int:
+    for minimum_months, days in LEAVE_GRANT_RULES:
+        if tenure_months >= minimum_months:
+            return days
+    return 0
+
+
+def entitlements(employee_id: int, hire_date: str, through_fiscal_year: int):
+    """入社日から through_fiscal_year 年度までの付与 (1 年度に 1 回) を列挙する"""
+    hired = date.fromisoformat(hire_date)
+    tenure_months = FIRST_GRANT_MONTHS
+    while True:
+        granted = add_months(hired, tenure_months)
+        year = fiscal_year(granted)
+        if year > through_fiscal_year:
+            return
+        yield (
+            employee_id,
+            year,
+            granted.isoformat(),
+            tenure_months / 12,
+            grant_days(tenure_months),
+        )
+        tenure_months += 12
+
+
+def create_leave_schema(cursor: sqlite3.Cursor) -> None:
+    """年休付与日数のテーブルとビュー、employees の変更を検知するトリガーを作成する"""
+    cursor.executescript(LEAVE_DDL)
+
+
+def refresh_leave_entitlements(conn: sqlite3.Connection, today: Optional[date] = None) -> int:
+    """変更のあった社員と、新しく始まった年度の分だけ年休付与日数を計算し直す
+
+    employees のトリガーが積んだキューと、前回計算した年度を見て差分だけを更新する。
+    更新した社員数を返す。
+    """
+    current_year = fiscal_year(today or date.today())
+    cursor = conn.cursor()
+    try:
+        row = cursor.execute('SELECT fiscal_year FROM leave_refresh_state').fetchone()
+        refreshed_year = row[0] if row else None
+
+        if refreshed_year is None:
+            # 初回は全社員を計算する
+            cursor.execute('INSERT OR IGNORE INTO leave_refresh_queue SELECT id FROM employees')
+        elif refreshed_year < current_year:
+            # 年度が変わったら全社員の新しい年度の分だけ追加する
+            employees = cursor.execute('SELECT id, hire_date FROM employees').fetchall()
+            cursor.executemany(
+                'INSERT OR REPLACE INTO leave_entitlements VALUES (?, ?, ?, ?, ?)',
+                [
+                    entitlement
+                    for employee_id, hire_date in employees
+                    for entitlement in entitlements(employee_id, hire_date, current_year)
+                    if entitlement[1] > refreshed_year
+                ],
+            )
+
+        queued = [row[0] for row in cursor.execute('SELECT employee_id FROM leave_refresh_queue')]
+        if queued:
+            cursor.executemany(
+                'DELETE FROM leave_entitlements WHERE employee_id = ?',
+                [(employee_id,) for employee_id in queued],
+            )
+            placeholders = ','.join('?' * len(queued))
+            employees = cursor.execute(
+                f'SELECT id, hire_date FROM employees WHERE id IN ({placeholders})', queued
+            ).fetchall()
+            cursor.executemany(
+                'INSERT INTO leave_entitlements VALUES (?, ?, ?, ?, ?)',
+                [
+                    entitlement
+                    for employee_id, hire_date in employees
+                    for entitlement in entitlements(employee_id, hire_date, current_year)
+                ],
+            )
+            cursor.execute('DELETE FROM leave_refresh_queue')
+
+        if refreshed_year != current_year:
+            cursor.execute(
+                'INSERT OR REPLACE INTO leave_refresh_state VALUES (1, ?)', (current_year,)
+            )
+        conn.commit()
+        return len(queued)
+    finally:
+        cursor.close()
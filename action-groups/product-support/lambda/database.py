@@ -0,0 +1,136 @@
+import sqlite3
+
+DB_PATH = '/tmp/support.db'
+
+# スキーマを変えたときに既存の /tmp の DB を移行するためのバージョン (PRAGMA user_version)
+SCHEMA_VERSION = 1
+
+SUPPORT_DDL = '''
+CREATE TABLE IF NOT EXISTS support (
+    error_code TEXT NOT NULL,
+    support TEXT NOT NULL,
+    date DATE NOT NULL,
+    supporter TEXT NOT NULL,
+    device_id TEXT NOT NULL
+)
+'''
+
+# support.support の全文検索インデックス
+# 日本語は単語区切りが無いので trigram で分割し、support を外部コンテンツとしてトリガーで同期する
+SUPPORT_FTS_DDL = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS support_fts USING fts5(
+    support,
+    content='support',
+    content_rowid='rowid',
+    tokenize='trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS support_fts_insert AFTER INSERT ON support
+BEGIN
+    INSERT INTO support_fts(rowid, support) VALUES (NEW.rowid, NEW.support);
+END;
+
+CREATE TRIGGER IF NOT EXISTS support_fts_delete AFTER DELETE ON support
+BEGIN
+    INSERT INTO support_fts(support_fts, rowid, support) VALUES ('delete', OLD.rowid, OLD.support);
+END;
+
+CREATE TRIGGER IF NOT EXISTS support_fts_update AFTER UPDATE OF support ON support
+BEGIN
+    INSERT INTO support_fts(support_fts, rowid, support) VALUES ('delete', OLD.rowid, OLD.support);
+    INSERT INTO support_fts(rowid, support) VALUES (NEW.rowid, NEW.support);
+END;
+'''
+
+SAMPLE_SUPPORT = [
+    (
+        'E-01',
+        '給紙トレイの用紙補充と用紙ガイドの調整を実施。センサー部分の清掃も行った',
+        '2023-11-01',
+        '山田太郎',
+        'PRN-2023-0001',
+    ),
+    (
+        'E-02',
+        '後部カバーを開けて詰まった用紙を除去。給紙ローラーの清掃も実施',
+        '2023-11-02',
+        '鈴木花子',
+        'PRN-2023-0054',
+    ),
+    (
+        'E-01',
+        '用紙センサーの清掃とファームウェアの再起動で解決',
+        '2023-11-02',
+        '佐藤次郎',
+        'PRN-2023-0078',
+    ),
+    (
+        'E-03',
+        '純正トナーカートリッジへの交換を実施。装着位置の調整も行った',
+        '2023-11-03',
+        '田中明子',
+        'PRN-2023-0023',
+    ),
+    (
+        'E-04',
+        'カバーセンサーの清掃とカバーヒンジの調整を実施',
+        '2023-11-03',
+        '山田太郎',
+        'PRN-2023-0089',
+    ),
+    (
+        'E-05',
+        'ヘッドクリーニングを3回実施。その後テストページで印刷品質を確認',
+        '2023-11-04',
+        '鈴木花子',
+        'PRN-2023-0012',
+    ),
+    (
+        'E-02',
+        '給紙ローラーの交換を実施。メンテナンスキットによる定期点検も実施',
+        '2023-11-04',
+        '佐藤次郎',
+        'PRN-2023-0045',
+    ),
+    (
+        'E-03',
+        'カートリッジの抜き差しとクリーニングを実施。認識エラー解消',
+        '2023-11-05',
+        '田中明子',
+        'PRN-2023-0067',
+    ),
+    (
+        'E-04',
+        'カバーの破損を確認。交換部品の手配と修理を実施',
+        '2023-11-05',
+        '山田太郎',
+        'PRN-2023-0034',
+    ),
+    (
+        'E-05',
+        'インクパッドの交換とヘッドクリーニングを実施',
+        '2023-11-06',
+        '鈴木花子',
+        'PRN-2023-0098',
+    ),
+]
+
+
+def prepare_database(conn: sqlite3.Connection) -> None:
+    """テーブルと全文検索インデックスを作成し、空のときだけサンプルデータを投入する"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SUPPORT_DDL)
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        if version < SCHEMA_VERSION:
+            # インデックス導入前に作られた DB は既存の行から作り直す
+            cursor.executescript(SUPPORT_FTS_DDL)
+            cursor.execute("INSERT INTO support_fts(support_fts) VALUES ('rebuild')")
+            cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+        # サンプルデータ投入 (呼び出しごとに重複して増えないよう、空のときだけ)
+        if cursor.execute('SELECT NOT EXISTS (SELECT 1 FROM support)').fetchone()[0]:
+            cursor.executemany('INSERT INTO support VALUES (?, ?, ?, ?, ?)', SAMPLE_SUPPORT)
+        conn.commit()
+    finally:
+        cursor.close()
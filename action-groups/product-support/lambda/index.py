@@ -2,6 +2,21 @@ import sqlite3
 import json
 from typing import Dict, Any
 
+from apt_common import (
+    ParameterError,
+    current_metrics,
+    load_validator,
+    metrics_handler,
+    parse_batch,
+    read_only,
+    run_batch,
+)
+from database import DB_PATH, prepare_database
+from search import parse_limit, search_support
+
+# api-schema.yaml から組み立てたパラメータの検証 (コールドスタート時に 1 回だけ作る)
+validator = load_validator()
+
 
 def create_error_response(
     event: Dict[str, Any], error_message: str, status_code: int = 400
@@ -22,6 +37,87 @@ def create_error_response(
     return {'messageVersion': '1.0', 'response': action_response}
 
 
+def create_success_response(event: Dict[str, Any], result: Any) -> Dict[str, Any]:
+    """結果を JSON 文字列にして成功レスポンスを生成する関数"""
+    json_string = json.dumps(result, ensure_ascii=False)
+
+    response_body = {'application/json': {'body': json_string}}
+    action_response = {
+        'actionGroup': event['actionGroup'],
+        'apiPath': event['apiPath'],
+        'httpMethod': event['httpMethod'],
+        'httpStatusCode': 200,
+        'responseBody': response_body,
+    }
+    return {'messageVersion': '1.0', 'response': action_response}
+
+
+def search(event: Dict[str, Any], parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """対応履歴を全文検索する"""
+    query = parameters.get('query')
+    if not query:
+        return create_error_response(event, "検索語が指定されていません。")
+    try:
+        limit = parse_limit(parameters.get('limit'))
+    except ValueError as e:
+        return create_error_response(event, str(e))
+
+    try:
+        conn = sqlite3.connect(DB_PATH)
+    except sqlite3.Error as e:
+        return create_error_response(event, f"データベース接続エラー: {str(e)}", 500)
+
+    try:
+        metrics = current_metrics()
+        with metrics.span('DBPrepare'):
+            prepare_database(conn)
+        with metrics.timer('QueryTime'):
+            results = search_support(conn, query, limit, parameters.get('error_code'))
+        metrics.put('RowsReturned', len(results))
+        return create_success_response(event, results)
+    except ValueError as e:
+        return create_error_response(event, str(e))
+    except sqlite3.Error as e:
+        return create_error_response(event, f"検索エラー: {str(e)}", 500)
+    finally:
+        conn.close()
+
+
+def batch_select(event: Dict[str, Any], parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """複数の SELECT 文を同じ時点のデータに対して実行し、キーごとの結果を返す"""
+    try:
+        statements = parse_batch(parameters.get('queries'))
+    except ValueError as e:
+        return create_error_response(event, str(e))
+
+    dangerous_keywords = ["DROP", "DELETE", "UPDATE", "INSERT", "TRUNCATE"]
+    for key, sql in statements:
+        if any(keyword in sql.upper() for keyword in dangerous_keywords):
+            return create_error_response(
+                event, f"不正なSQLクエリが検出されました。({key})", 403
+            )
+
+    try:
+        conn = sqlite3.connect(DB_PATH)
+    except sqlite3.Error as e:
+        return create_error_response(event, f"データベース接続エラー: {str(e)}", 500)
+
+    try:
+        metrics = current_metrics()
+        with metrics.span('DBPrepare'):
+            prepare_database(conn)
+        with metrics.timer('QueryTime'):
+            results = run_batch(conn, statements)
+        metrics.put('BatchStatements', len(statements))
+        metrics.put('RowsReturned', sum(len(result.get('rows', [])) for result in results.values()))
+        return create_success_response(event, results)
+    except sqlite3.Error as e:
+        return create_error_response(event, f"SQLクエリ実行エラー: {str(e)}", 500)
+    finally:
+        conn.close()
+
+
+@metrics_handler
 def lambda_handler(event: Dict[str, Any], _) -> Dict[str, Any]:
     try:
         print(event)
@@ -29,16 +125,23 @@ def lambda_handler(event: Dict[str, Any], _) -> Dict[str, Any]:
         if not api_path:
             return create_error_response(event, "APIパスが指定されていません。")
 
-        if api_path != "/select":
+        if api_path not in ("/select", "/search", "/batch-select"):
             return create_error_response(event, f"未対応のAPIパス: {api_path}")
 
+        # スキーマの必須・型・pattern を DB に接続する前に確認する
+        try:
+            parameters = validator.validate(event)
+        except ParameterError as e:
+            return create_error_response(event, str(e))
+
+        if api_path == "/search":
+            return search(event, parameters)
+
+        if api_path == "/batch-select":
+            return batch_select(event, parameters)
+
         # SQLパラメータの取得
-        parameters = event.get('parameters', [])
-        sql = None
-        for param in parameters:
-            if param.get('name') == 'sql':
-                sql = param.get('value')
-                break
+        sql = parameters.get('sql')
 
         if not sql:
             return create_error_response(event, "SQLクエリが指定されていません。")
@@ -51,9 +154,8 @@ def lambda_handler(event: Dict[str, Any], _) -> Dict[str, Any]:
             )
 
         # データベース接続
-        db_path = '/tmp/support.db'
         try:
-            conn = sqlite3.connect(db_path)
+            conn = sqlite3.connect(DB_PATH)
             cursor = conn.cursor()
         except sqlite3.Error as e:
             return create_error_response(
@@ -61,104 +163,22 @@ def lambda_handler(event: Dict[str, Any], _) -> Dict[str, Any]:
             )
 
         try:
-            # テーブル作成
-            ddl = '''
-            CREATE TABLE IF NOT EXISTS support (
-                error_code TEXT NOT NULL,
-                support TEXT NOT NULL,
-                date DATE NOT NULL,
-                supporter TEXT NOT NULL,
-                device_id TEXT NOT NULL
-            )
-            '''
-            cursor.execute(ddl)
-
-            # サンプルデータ投入
-            support = [
-                (
-                    'E-01',
-                    '給紙トレイの用紙補充と用紙ガイドの調整を実施。センサー部分の清掃も行った',
-                    '2023-11-01',
-                    '山田太郎',
-                    'PRN-2023-0001',
-                ),
-                (
-                    'E-02',
-                    '後部カバーを開けて詰まった用紙を除去。給紙ローラーの清掃も実施',
-                    '2023-11-02',
-                    '鈴木花子',
-                    'PRN-2023-0054',
-                ),
-                (
-                    'E-01',
-                    '用紙センサーの清掃とファームウェアの再起動で解決',
-                    '2023-11-02',
-                    '佐藤次郎',
-                    'PRN-2023-0078',
-                ),
-                (
-                    'E-03',
-                    '純正トナーカートリッジへの交換を実施。装着位置の調整も行った',
-                    '2023-11-03',
-                    '田中明子',
-                    'PRN-2023-0023',
-                ),
-                (
-                    'E-04',
-                    'カバーセンサーの清掃とカバーヒンジの調整を実施',
-                    '2023-11-03',
-                    '山田太郎',
-                    'PRN-2023-0089',
-                ),
-                (
-                    'E-05',
-                    'ヘッドクリーニングを3回実施。その後テストページで印刷品質を確認',
-                    '2023-11-04',
-                    '鈴木花子',
-                    'PRN-2023-0012',
-                ),
-                (
-                    'E-02',
-                    '給紙ローラーの交換を実施。メンテナンスキットによる定期点検も実施',
-                    '2023-11-04',
-                    '佐藤次郎',
-                    'PRN-2023-0045',
-                ),
-                (
-                    'E-03',
-                    'カートリッジの抜き差しとクリーニングを実施。認識エラー解消',
-                    '2023-11-05',
-                    '田中明子',
-                    'PRN-2023-0067',
-                ),
-                (
-                    'E-04',
-                    'カバーの破損を確認。交換部品の手配と修理を実施',
-                    '2023-11-05',
-                    '山田太郎',
-                    'PRN-2023-0034',
-                ),
-                (
-                    'E-05',
-                    'インクパッドの交換とヘッドクリーニングを実施',
-                    '2023-11-06',
-                    '鈴木花子',
-                    'PRN-2023-0098',
-                ),
-            ]
-            cursor.executemany(
-                'INSERT OR IGNORE INTO support VALUES (?, ?, ?, ?, ?)', support
-            )
-            conn.commit()
+            # テーブルと全文検索インデックスの作成、サンプルデータ投入
+            metrics = current_metrics()
+            with metrics.span('DBPrepare'):
+                prepare_database(conn)
 
             # クエリ実行
-            cursor.execute(sql)
+            # 読み取り以外の操作は SQLite に拒否させる
+            with metrics.timer('QueryTime'), read_only(conn):
+                cursor.execute(sql)
 
-            # カラム名を取得
-            columns = [description[0] for description in cursor.description]
+                # カラム名を取得
+                columns = [description[0] for description in cursor.description]
 
-            # 結果を取得
-            rows = cursor.fetchall()
+                # 結果を取得
+                rows = cursor.fetchall()
+            metrics.put('RowsReturned', len(rows))
 
             # 連想配列のリストを作成
             result_list = []
@@ -166,18 +186,7 @@ def lambda_handler(event: Dict[str, Any], _) -> Dict[str, Any]:
                 row_dict = {columns[i]: value for i, value in enumerate(row)}
                 result_list.append(row_dict)
 
-            # JSON文字列に変換
-            json_string = json.dumps(result_list, ensure_ascii=False)
-
-            response_body = {'application/json': {'body': json_string}}
-            action_response = {
-                'actionGroup': event['actionGroup'],
-                'apiPath': event['apiPath'],
-                'httpMethod': event['httpMethod'],
-                'httpStatusCode': 200,
-                'responseBody': response_body,
-            }
-            return {'messageVersion': '1.0', 'response': action_response}
+            return create_success_response(event, result_list)
 
         except sqlite3.Error as e:
             return create_error_response(event, f"SQLクエリ実行エラー: {str(e)}", 500)
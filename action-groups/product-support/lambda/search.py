@@ -0,0 +1,126 @@
+import os
+import re
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = int(os.environ.get('SEARCH_MAX_LIMIT', '50'))
+HIGHLIGHT_START = '<b>'
+HIGHLIGHT_END = '</b>'
+SNIPPET_TOKENS = 32
+# trigram で索引できる最短の文字数
+TRIGRAM_LENGTH = 3
+
+COLUMNS = ['error_code', 'support', 'date', 'supporter', 'device_id']
+
+
+def parse_limit(value: Optional[str]) -> int:
+    if value in (None, ''):
+        return SEARCH_DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"limit は整数で指定してください: {value}")
+    if limit < 1:
+        raise ValueError("limit は 1 以上で指定してください。")
+    return min(limit, SEARCH_MAX_LIMIT)
+
+
+def split_terms(query: str) -> List[str]:
+    """空白 (全角を含む) で区切った検索語を重複なしで返す"""
+    terms = []
+    for term in query.replace('　', ' ').split():
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+def fts_phrase(term: str) -> str:
+    """検索語を FTS5 のフレーズとしてエスケープする"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def escape_like(term: str) -> str:
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def highlight(text: str, terms: List[str]) -> str:
+    """FTS5 の snippet が使えない短い検索語の一致箇所を囲む
+
+    全ての語を 1 回で置き換える。snippet がすでに付けたタグは選択肢に含めてそのまま残し、
+    タグの中の文字 (「b」など) や囲んだ後の語が別の語に置き換えられないようにする。
+    """
+    if not terms:
+        return text
+    tags = [HIGHLIGHT_START, HIGHLIGHT_END]
+    alternatives = tags + sorted(terms, key=len, reverse=True)
+    pattern = re.compile('|'.join(re.escape(alternative) for alternative in alternatives))
+    return pattern.sub(
+        lambda match: match.group(0) if match.group(0) in tags else f"{HIGHLIGHT_START}{match.group(0)}{HIGHLIGHT_END}",
+        text,
+    )
+
+
+def search_support(
+    conn: sqlite3.Connection,
+    query: str,
+    limit: int = SEARCH_DEFAULT_LIMIT,
+    error_code: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """対応履歴を全文検索し、関連度の高い順にハイライト付きの抜粋とともに返す
+
+    3 文字以上の検索語は trigram のインデックスで絞り込んで bm25 で並べる。
+    2 文字以下の語 (「清掃」など) はインデックスを引けないので LIKE で追加の条件にする。
+    全ての語が短い場合は新しい対応から順に返す。
+    """
+    terms = split_terms(query)
+    if not terms:
+        raise ValueError("検索語が指定されていません。")
+    indexed = [term for term in terms if len(term) >= TRIGRAM_LENGTH]
+    short = [term for term in terms if len(term) < TRIGRAM_LENGTH]
+
+    conditions = []
+    params: List[Any] = []
+    if indexed:
+        conditions.append('support_fts MATCH ?')
+        params.append(' AND '.join(fts_phrase(term) for term in indexed))
+    for term in short:
+        conditions.append("s.support LIKE ? ESCAPE '\\'")
+        params.append(f"%{escape_like(term)}%")
+    if error_code:
+        conditions.append('s.error_code = ?')
+        params.append(error_code)
+    where = ' AND '.join(conditions)
+    columns = ', '.join(f's.{column}' for column in COLUMNS)
+
+    if indexed:
+        sql = f'''
+            SELECT {columns},
+                snippet(support_fts, 0, ?, ?, '…', {SNIPPET_TOKENS}),
+                bm25(support_fts)
+            FROM support_fts
+            JOIN support s ON s.rowid = support_fts.rowid
+            WHERE {where}
+            ORDER BY bm25(support_fts)
+            LIMIT ?
+        '''
+        params = [HIGHLIGHT_START, HIGHLIGHT_END] + params + [limit]
+    else:
+        sql = f'''
+            SELECT {columns}, s.support, NULL
+            FROM support s
+            WHERE {where}
+            ORDER BY s.date DESC
+            LIMIT ?
+        '''
+        params = params + [limit]
+
+    results = []
+    for row in conn.execute(sql, params):
+        result = dict(zip(COLUMNS, row[: len(COLUMNS)]))
+        snippet, score = row[len(COLUMNS)], row[len(COLUMNS) + 1]
+        # bm25 は小さいほど関連度が高いので符号を反転して返す
+        result['snippet'] = highlight(snippet, short)
+        result['score'] = round(-score, 4) if score is not None else None
+        results.append(result)
+    return results
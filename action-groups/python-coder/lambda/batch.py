@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import contextlib
+from typing import Dict, Any, List
+
+from sandbox import get_pool, build_job
+from profiling import parse_options
+from cache import get_cache
+
+logger = logging.getLogger()
+
+# 1 リクエストで受け付ける候補数の上限
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '8'))
+
+
+def parse_candidates(candidates: str) -> List[Dict[str, Any]]:
+    """JSON 文字列で渡された候補の配列を検証して返す"""
+    try:
+        parsed = json.loads(candidates)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"candidates must be a JSON array: {str(e)}")
+
+    if not isinstance(parsed, list) or not parsed:
+        raise ValueError("candidates must be a non-empty JSON array.")
+    if len(parsed) > MAX_BATCH_SIZE:
+        raise ValueError(
+            f"Too many candidates: {len(parsed)} (max {MAX_BATCH_SIZE})."
+        )
+
+    normalized = []
+    for index, candidate in enumerate(parsed):
+        if not isinstance(candidate, dict) or 'code' not in candidate or 'test_code' not in candidate:
+            raise ValueError(
+                f"candidates[{index}] must be an object with code and test_code."
+            )
+        normalized.append(
+            {
+                'id': str(candidate.get('id', index)),
+                'code': str(candidate['code']),
+                'test_code': str(candidate['test_code']),
+                'options': parse_options(candidate),
+            }
+        )
+    return normalized
+
+
+def run_batch(candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """候補ごとに別々の一時ディレクトリを用意し、コア数まで並列にテストする
+
+    キャッシュ済みの候補は実行せず記録済みの結果を返す。
+    """
+    start_time = time.perf_counter()
+    cache = get_cache()
+    results: List[Dict[str, Any]] = [None] * len(candidates)
+    misses = []
+    for index, candidate in enumerate(candidates):
+        # 計測が目的のオプション付き候補はキャッシュしない
+        key = None
+        if not candidate['options']:
+            key = cache.key(candidate['code'], candidate['test_code'])
+            cached = cache.get(key)
+            if cached is not None:
+                results[index] = {
+                    'id': candidate['id'],
+                    **cached,
+                    'cacheHit': True,
+                    'wallTime': "0.00s",
+                }
+                continue
+        misses.append((index, key, candidate))
+
+    parallelism = min(len(misses), os.cpu_count() or 1)
+    logger.info(
+        f"Running {len(misses)} of {len(candidates)} candidates with parallelism {parallelism}"
+    )
+    with contextlib.ExitStack() as stack:
+        jobs = []
+        for _, _, candidate in misses:
+            temp_dir = stack.enter_context(tempfile.TemporaryDirectory())
+            with open(os.path.join(temp_dir, 'main.py'), 'w') as f:
+                f.write(candidate['code'])
+            test_path = os.path.join(temp_dir, 'test_main.py')
+            with open(test_path, 'w') as f:
+                f.write(candidate['test_code'])
+            jobs.append(
+                build_job(test_path, candidate['test_code'], candidate['options'])
+            )
+
+        outcomes = get_pool().run_many(jobs, parallelism) if jobs else []
+    execution_time = time.perf_counter() - start_time
+
+    for (index, key, candidate), (result, elapsed) in zip(misses, outcomes):
+        if key:
+            cache.put(key, result)
+        results[index] = {
+            'id': candidate['id'],
+            **result,
+            'cacheHit': False,
+            'wallTime': f"{elapsed:.2f}s",
+        }
+
+    passed = sum(1 for result in results if result['status'] == 'success')
+    logger.info(
+        f"Batch finished: {passed}/{len(results)} passed in {execution_time:.2f} seconds"
+    )
+    return {
+        'results': results,
+        'passed': passed,
+        'total': len(results),
+        'executionTime': f"{execution_time:.2f}s",
+    }
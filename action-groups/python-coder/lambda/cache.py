@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import hashlib
+import logging
+from collections import OrderedDict
+from importlib import metadata
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger()
+
+# 結果の形式を変えたときに古いキャッシュを無効にするためのバージョン
+CACHE_VERSION = 1
+CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', '/tmp/python-coder-cache')
+CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', '256'))
+# キャッシュしてよい結果 (リソース上限や実行環境のエラーは一時的な可能性があるため除く)
+CACHEABLE_STATUSES = ('success', 'failure')
+
+_cache = None
+
+
+def runtime_version() -> str:
+    """キャッシュキーに含める実行環境のバージョン"""
+    try:
+        pytest_version = metadata.version('pytest')
+    except metadata.PackageNotFoundError:
+        pytest_version = 'unknown'
+    return f"{CACHE_VERSION}|{sys.version}|pytest {pytest_version}"
+
+
+class ResultCache:
+    """コードとテストコードの内容をキーにしたテスト結果のキャッシュ
+
+    メモリ上の LRU と /tmp 上のファイルの 2 段で保持し、
+    どちらも max_entries 件を超えたら最も古く使われたものから捨てる。
+    """
+
+    def __init__(
+        self,
+        directory: str = CACHE_DIR,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        enabled: bool = CACHE_ENABLED,
+    ):
+        self.enabled = enabled
+        self.directory = directory
+        self.max_entries = max(max_entries, 1)
+        self._memory: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._runtime = runtime_version()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, code: str, test_code: str) -> str:
+        digest = hashlib.sha256()
+        for part in (self._runtime, code, test_code):
+            encoded = part.encode('utf-8')
+            digest.update(len(encoded).to_bytes(8, 'big'))
+            digest.update(encoded)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return dict(self._memory[key])
+
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            # ファイルの更新日時を LRU の順序として使う
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        self._remember(key, result)
+        return dict(result)
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        if not self.enabled or result.get('status') not in CACHEABLE_STATUSES:
+            return
+        self._remember(key, result)
+
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+            self._prune_files()
+        except OSError as e:
+            logger.warning(f"Failed to write result cache: {str(e)}")
+
+    def _remember(self, key: str, result: Dict[str, Any]) -> None:
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _prune_files(self) -> None:
+        entries = [
+            entry
+            for entry in os.scandir(self.directory)
+            if entry.is_file() and entry.name.endswith('.json')
+        ]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[: len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def get_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        _cache = ResultCache()
+    return _cache
+
+
+def cached_run(code: str, test_code: str, options: Dict[str, Any], run) -> Dict[str, Any]:
+    """キャッシュがあればそれを返し、なければ run() を実行して結果を記録する
+
+    プロファイルやベンチマークは計測そのものが目的なのでキャッシュしない。
+    """
+    if options:
+        result = run()
+        result['cacheHit'] = False
+        return result
+
+    cache = get_cache()
+    key = cache.key(code, test_code)
+    result = cache.get(key)
+    if result is not None:
+        logger.info(f"Result cache hit: {key[:12]}")
+        result['cacheHit'] = True
+        return result
+
+    result = run()
+    cache.put(key, result)
+    result['cacheHit'] = False
+    return result
@@ -0,0 +1,194 @@
+"""Agent に返す結果を RESPONSE_BUDGET_BYTES に収める
+
+結果が予算を超える場合だけ、Agent にとって情報の少ないものから順に削る。
+
+    1. 送られてきた code / test_code の複製
+    2. 成功したテストの行と pytest のヘッダ (件数だけ残す)
+    3. 2 件目以降の失敗と、main.py / test_main.py の外のトレースバック (最初の失敗の assert は残す)
+    4. 成功したテストの所要時間
+    5. それでも超える場合は output / error の末尾
+
+削ったものは omitted に記録し、Agent が何を見ていないかわかるようにする。
+"""
+import os
+import re
+import json
+from typing import Any, Dict, List, Optional
+
+RESPONSE_BUDGET_BYTES = int(os.environ.get('RESPONSE_BUDGET_BYTES', '12000'))
+USER_FILES = ('main.py', 'test_main.py')
+
+# pytest の出力の区切り
+SECTION = re.compile(r'^=+ (.+?) =+$')
+FAILURE_HEADER = re.compile(r'^_{3,} (.+?) _{3,}$')
+FRAME_SEPARATOR = re.compile(r'^(_ )+_?\s*$')
+LOCATION = re.compile(r'^(\S+?\.py):\d+:')
+SHORT_LOCATION = re.compile(r'^\S+?\.py:\d+: in \S+')
+CAPTURED = re.compile(r'^-{3,} Captured .+ -{3,}$')
+TEST_LINE = re.compile(r'^(\S+::\S+) (PASSED|FAILED|ERROR|SKIPPED|XFAIL|XPASS)\b')
+
+
+def result_bytes(result: Dict[str, Any]) -> int:
+    return len(json.dumps(result, ensure_ascii=False, default=str).encode('utf-8'))
+
+
+def compact_output(output: str) -> str:
+    """成功したテストの行とヘッダ、失敗の詳細 (error と重複する) を除き、失敗した行と集計だけを残す"""
+    kept = []
+    passed = 0
+    section = None
+    for line in output.splitlines():
+        match = SECTION.match(line)
+        if match:
+            section = match.group(1)
+            if section.startswith('short test summary') or re.search(r'\bin [\d.]+s\b', section):
+                kept.append(line)
+            continue
+        test_line = TEST_LINE.match(line)
+        if test_line:
+            if test_line.group(2) == 'PASSED':
+                passed += 1
+            else:
+                kept.append(line)
+            continue
+        if section and section.startswith('short test summary'):
+            kept.append(line)
+        elif re.match(r'^\d+ passed in [\d.]+s$', line):
+            # fast path の最後の行
+            kept.append(line)
+    if passed:
+        kept.insert(0, f"({passed} passed tests not listed)")
+    return '\n'.join(kept)
+
+
+def failure_blocks(output: str) -> List[str]:
+    """pytest の出力の FAILURES / ERRORS から失敗ごとの詳細を取り出す"""
+    blocks = []
+    current: Optional[List[str]] = None
+    in_failures = False
+    for line in output.splitlines():
+        section = SECTION.match(line)
+        if section:
+            if current:
+                blocks.append('\n'.join(current))
+            current = None
+            in_failures = section.group(1) in ('FAILURES', 'ERRORS')
+            continue
+        if not in_failures:
+            continue
+        header = FAILURE_HEADER.match(line)
+        if header:
+            if current:
+                blocks.append('\n'.join(current))
+            current = [line]
+        elif current is not None:
+            current.append(line)
+    if current:
+        blocks.append('\n'.join(current))
+    return blocks
+
+
+def compact_failure(block: str) -> str:
+    """失敗 1 件から、main.py / test_main.py のフレームと例外が起きたフレームの要点だけを残す"""
+    # テスト中の print などの出力は除く
+    lines = []
+    for line in block.splitlines():
+        if CAPTURED.match(line):
+            break
+        lines.append(line)
+
+    # フレームは "_ _ _" の行で区切られるか、短い形式では "path:line: in 関数名" の行から始まる
+    frames: List[List[str]] = [[]]
+    for line in lines:
+        if FRAME_SEPARATOR.match(line):
+            frames.append([])
+            continue
+        if SHORT_LOCATION.match(line) and frames[-1]:
+            frames.append([])
+        frames[-1].append(line)
+    frames = [frame for frame in frames if any(line.strip() for line in frame)]
+
+    kept = []
+    skipped = 0
+    for index, frame in enumerate(frames):
+        # ユーザーのファイルは rootdir からの相対パスで表示される
+        paths = [match.group(1) for match in map(LOCATION.match, frame) if match]
+        if index == 0 or any(path in USER_FILES for path in paths):
+            kept.extend(frame)
+        elif index == len(frames) - 1:
+            # 例外が起きたフレームはソースを省き、実行行とエラーと場所だけにする
+            if skipped:
+                kept.append(f"... {skipped} frames outside {' / '.join(USER_FILES)} omitted ...")
+                skipped = 0
+            kept.extend(
+                line for line in frame if line.startswith(('>', 'E ')) or LOCATION.match(line)
+            )
+        else:
+            skipped += 1
+    if skipped:
+        kept.append(f"... {skipped} frames outside {' / '.join(USER_FILES)} omitted ...")
+    return '\n'.join(kept).strip()
+
+
+def truncate(text: str, limit: int) -> str:
+    encoded = text.encode('utf-8')
+    if len(encoded) <= limit:
+        return text
+    return encoded[: max(limit, 0)].decode('utf-8', errors='ignore') + '\n... (truncated)'
+
+
+def compact_result(result: Dict[str, Any], budget: int = RESPONSE_BUDGET_BYTES) -> Dict[str, Any]:
+    """予算を超えている間だけ順に削り、削ったものを omitted に記録する"""
+    result = dict(result)
+    omitted: List[str] = []
+
+    def over() -> bool:
+        return result_bytes({**result, 'omitted': omitted}) > budget
+
+    if not over():
+        return result
+
+    echoed = [key for key in ('code', 'test_code') if key in result]
+    if echoed:
+        size = sum(len(str(result.pop(key)).encode('utf-8')) for key in echoed)
+        omitted.append(f"{', '.join(echoed)}: echoed request inputs ({size} bytes)")
+
+    output = result.get('output') or ''
+    if over() and output:
+        result['output'] = compact_output(output)
+        omitted.append('output: passed test lines, pytest header and failure details (see error)')
+
+    if over() and (output or result.get('error')):
+        blocks = failure_blocks(output)
+        if blocks:
+            result['error'] = compact_failure(blocks[0])
+            note = 'error: traceback frames outside main.py / test_main.py and captured output'
+            if len(blocks) > 1:
+                note += f"; {len(blocks) - 1} more failures (one-line summaries in output)"
+            omitted.append(note)
+
+    if over() and result.get('tests'):
+        failed = [test for test in result['tests'] if test.get('outcome') != 'passed']
+        passed = len(result['tests']) - len(failed)
+        if passed:
+            result['tests'] = failed
+            result.pop('slowest', None)
+            omitted.append(f"tests: timings of {passed} passed tests and slowest")
+
+    for key in ('output', 'error'):
+        if over() and result.get(key):
+            excess = result_bytes({**result, 'omitted': omitted}) - budget
+            size = len(result[key].encode('utf-8'))
+            result[key] = truncate(result[key], size - excess - 64)
+            omitted.append(f"{key}: truncated to fit {budget} bytes")
+
+    result['omitted'] = omitted
+    return result
+
+
+def compact_batch(batch: Dict[str, Any], budget: int = RESPONSE_BUDGET_BYTES) -> Dict[str, Any]:
+    """バッチの結果は候補ごとに予算を均等に分ける"""
+    if result_bytes(batch) <= budget or not batch.get('results'):
+        return batch
+    share = budget // len(batch['results'])
+    return {**batch, 'results': [compact_result(result, share) for result in batch['results']]}
@@ -1,11 +1,15 @@
 import tempfile
-import pytest
 import os
 import traceback
 import logging
 from typing import Dict, Any
-from io import StringIO
-from datetime import datetime
+
+from apt_common import ParameterError, current_metrics, load_validator, metrics_handler
+from sandbox import get_pool, PREWARM
+from batch import parse_candidates, run_batch
+from profiling import parse_options
+from cache import cached_run
+from compaction import compact_batch, compact_result
 
 # ログの設定
 logger = logging.getLogger()
@@ -21,6 +25,14 @@ handler = logging.StreamHandler()
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
+# api-schema.yaml から組み立てたパラメータの検証 (コールドスタート時に 1 回だけ作る)
+validator = load_validator()
+
+# pytest を読み込んだワーカープロセスをコールドスタート時に用意しておく
+# (SANDBOX_PREWARM=false の場合は最初のリクエストで用意する)
+if PREWARM:
+    get_pool()
+
 
 def write_code(code: str, filename: str, directory: str) -> str:
     """コードをファイルに書き込む"""
@@ -36,67 +48,16 @@ def write_code(code: str, filename: str, directory: str) -> str:
         raise
 
 
-def run_tests(test_path: str) -> Dict[str, Any]:
-    """テストを実行する"""
-    logger.info(f"Starting test execution: {test_path}")
-    try:
-        capture_output = StringIO()
-        stderr_output = StringIO()
-
-        start_time = datetime.now()
-        plugin = CaptureManager(capture_output, stderr_output)
-        result = pytest.main(["-v", test_path], plugins=[plugin])
-        execution_time = (datetime.now() - start_time).total_seconds()
-
-        output = capture_output.getvalue()
-        error_output = stderr_output.getvalue()
-
-        if result == 0:
-            status = "success"
-            message = "All tests passed!"
-            logger.info(f"Tests passed successfully in {execution_time:.2f} seconds")
-        else:
-            status = "failure"
-            message = "Some tests failed."
-            logger.warning(f"Tests failed in {execution_time:.2f} seconds")
-            logger.debug(f"Test output: {output}")
-            logger.debug(f"Error output: {error_output}")
-
-        return {
-            "status": status,
-            "message": message,
-            "exitCode": result,
-            "output": output,
-            "error": error_output,
-            "executionTime": f"{execution_time:.2f}s",
-        }
-    except Exception as e:
-        logger.error(f"Test execution failed: {str(e)}")
-        logger.error(traceback.format_exc())
-        return {
-            "status": "error",
-            "message": str(e),
-            "exitCode": 1,
-            "output": "",
-            "error": str(e),
-            "executionTime": "0s",
-        }
-
-
-class CaptureManager:
-    """テスト出力をキャプチャするプラグイン"""
+def run_in_sandbox(code: str, test_code: str, options: Dict) -> Dict:
+    """一時ディレクトリにコードを書き出してワーカープロセスでテストする"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        logger.info(f"Created temporary directory: {temp_dir}")
 
-    def __init__(self, stdout_capture, stderr_capture):
-        self.stdout_capture = stdout_capture
-        self.stderr_capture = stderr_capture
+        write_code(code, "main.py", temp_dir)
+        test_path = write_code(test_code, "test_main.py", temp_dir)
 
-    def pytest_runtest_logreport(self, report):
-        if report.failed:
-            if hasattr(report, "longrepr"):
-                error_msg = str(report.longrepr)
-                self.stderr_capture.write(error_msg)
-                logger.error(f"Test failed: {report.nodeid}")
-                logger.debug(f"Error details: {error_msg}")
+        with current_metrics().timer("PytestTime"):
+            return get_pool().run(test_path, test_code, options)
 
 
 def main(event: Dict) -> Dict:
@@ -107,33 +68,67 @@ def main(event: Dict) -> Dict:
     try:
         logger.debug(f"Received event: {event}")
 
-        parameters = {param["name"]: param["value"] for param in event["parameters"]}
-        code = parameters.get("code", "")
-        test_code = parameters.get("test_code", "")
-
-        with tempfile.TemporaryDirectory() as temp_dir:
-            logger.info(f"Created temporary directory: {temp_dir}")
-
-            code_path = write_code(code, "main.py", temp_dir)
-            test_path = write_code(test_code, "test_main.py", temp_dir)
-
-            result = run_tests(test_path)
-            result["code"] = code
-            result["test_code"] = test_code
-
-            response = {
+        try:
+            parameters = validator.validate(event)
+        except ParameterError as e:
+            logger.warning(f"Invalid parameters: {str(e)}")
+            return {
                 "messageVersion": "1.0",
                 "response": {
                     "actionGroup": event["actionGroup"],
                     "apiPath": event["apiPath"],
                     "httpMethod": event["httpMethod"],
-                    "httpStatusCode": 200,
-                    "responseBody": {"application/json": {"result": result}},
+                    "httpStatusCode": 400,
+                    "responseBody": {"application/json": {"error": str(e)}},
                 },
             }
 
-            logger.info(f"Request {request_id} completed successfully")
-            return response
+        if event.get("apiPath") == "/code/test/batch":
+            try:
+                candidates = parse_candidates(parameters.get("candidates", ""))
+            except ValueError as e:
+                logger.warning(f"Invalid batch request: {str(e)}")
+                return {
+                    "messageVersion": "1.0",
+                    "response": {
+                        "actionGroup": event["actionGroup"],
+                        "apiPath": event["apiPath"],
+                        "httpMethod": event["httpMethod"],
+                        "httpStatusCode": 400,
+                        "responseBody": {"application/json": {"error": str(e)}},
+                    },
+                }
+            with current_metrics().timer("BatchTime"):
+                result = run_batch(candidates)
+            current_metrics().put("Candidates", len(candidates))
+            result = compact_batch(result)
+        else:
+            code = parameters.get("code", "")
+            test_code = parameters.get("test_code", "")
+            options = parse_options(parameters)
+
+            result = cached_run(
+                code, test_code, options, lambda: run_in_sandbox(code, test_code, options)
+            )
+            current_metrics().put("CacheHit", 1 if result.get("cacheHit") else 0)
+            # キャッシュに記録された結果を書き換えないようにコピーする
+            result = {**result, "code": code, "test_code": test_code}
+            # RESPONSE_BUDGET_BYTES を超える場合は削って、削ったものを omitted に記録する
+            result = compact_result(result)
+
+        response = {
+            "messageVersion": "1.0",
+            "response": {
+                "actionGroup": event["actionGroup"],
+                "apiPath": event["apiPath"],
+                "httpMethod": event["httpMethod"],
+                "httpStatusCode": 200,
+                "responseBody": {"application/json": {"result": result}},
+            },
+        }
+
+        logger.info(f"Request {request_id} completed successfully")
+        return response
 
     except Exception as e:
         logger.error(f"Request {request_id} failed with error: {str(e)}")
@@ -155,6 +150,7 @@ def main(event: Dict) -> Dict:
         }
 
 
+@metrics_handler
 def lambda_handler(event: Dict, context: Any) -> Dict:
     """Lambda handler"""
     if context:
@@ -0,0 +1,150 @@
+import os
+import time
+import pstats
+import cProfile
+import statistics
+import tracemalloc
+import logging
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger()
+
+PROFILE_KINDS = ('cprofile', 'tracemalloc')
+# プロファイル結果として返す関数・行の数
+PROFILE_TOP_N = int(os.environ.get('PROFILE_TOP_N', '10'))
+# ベンチマークの既定の繰り返し回数と上限
+BENCHMARK_DEFAULT_REPEAT = 100
+BENCHMARK_MAX_REPEAT = int(os.environ.get('BENCHMARK_MAX_REPEAT', '10000'))
+
+
+def parse_options(values: Dict[str, Any]) -> Dict[str, Any]:
+    """リクエストのパラメータからプロファイル・ベンチマークのオプションを取り出す"""
+    options = {}
+    profile = str(values.get('profile') or '').strip().lower()
+    if profile in PROFILE_KINDS:
+        options['profile'] = profile
+    elif profile:
+        logger.warning(f"Unknown profile kind ignored: {profile}")
+
+    name = str(values.get('benchmark') or '').strip()
+    if name:
+        options['benchmark'] = name
+        try:
+            options['benchmarkRepeat'] = int(
+                values.get('benchmark_repeat') or BENCHMARK_DEFAULT_REPEAT
+            )
+        except (TypeError, ValueError):
+            options['benchmarkRepeat'] = BENCHMARK_DEFAULT_REPEAT
+    return options
+
+
+class Profiler:
+    """テスト対象コード (main.py) のプロファイルを取るコンテキストマネージャ"""
+
+    def __init__(self, kind: Optional[str], directory: str):
+        self.kind = kind
+        self.target = os.path.join(os.path.realpath(directory), 'main.py')
+        self._profile = None
+        self._snapshot = None
+        self._peak = 0
+
+    def __enter__(self):
+        if self.kind == 'cprofile':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        elif self.kind == 'tracemalloc':
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.kind == 'cprofile':
+            self._profile.disable()
+        elif self.kind == 'tracemalloc':
+            self._snapshot = tracemalloc.take_snapshot()
+            _, self._peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return False
+
+    def report(self) -> Dict[str, Any]:
+        """main.py 内の関数・行だけに絞ったプロファイル結果を返す"""
+        if self.kind == 'cprofile':
+            return {'kind': self.kind, 'functions': self._cprofile_top()}
+        return {
+            'kind': self.kind,
+            'peakBytes': self._peak,
+            'lines': self._tracemalloc_top(),
+        }
+
+    def _cprofile_top(self) -> List[Dict[str, Any]]:
+        stats = pstats.Stats(self._profile)
+        entries = []
+        for (filename, line, name), (_, calls, total, cumulative, _) in stats.stats.items():
+            if os.path.realpath(filename) != self.target:
+                continue
+            entries.append(
+                {
+                    'function': f"main.py:{line}({name})",
+                    'calls': calls,
+                    'totalTime': round(total, 6),
+                    'cumulativeTime': round(cumulative, 6),
+                }
+            )
+        entries.sort(key=lambda entry: entry['cumulativeTime'], reverse=True)
+        return entries[:PROFILE_TOP_N]
+
+    def _tracemalloc_top(self) -> List[Dict[str, Any]]:
+        snapshot = self._snapshot.filter_traces(
+            [tracemalloc.Filter(True, self.target)]
+        )
+        return [
+            {
+                'line': f"main.py:{stat.traceback[0].lineno}",
+                'sizeBytes': stat.size,
+                'count': stat.count,
+            }
+            for stat in snapshot.statistics('lineno')[:PROFILE_TOP_N]
+        ]
+
+
+def percentile(samples: List[float], ratio: float) -> float:
+    """最近傍法でパーセンタイルを求める"""
+    ordered = sorted(samples)
+    index = min(int(round(ratio * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def benchmark(modules: List[Any], name: str, repeat: int) -> Dict[str, Any]:
+    """引数なしの関数 name を repeat 回呼び出して実行時間の統計を返す
+
+    関数は modules の先頭から順に探す (test_main → main)。
+    """
+    repeat = max(1, min(repeat, BENCHMARK_MAX_REPEAT))
+    target = None
+    for module in modules:
+        target = getattr(module, name, None)
+        if callable(target):
+            break
+    if not callable(target):
+        return {'function': name, 'error': f"Function '{name}' was not found."}
+
+    try:
+        # 初回呼び出しのキャッシュ等の影響を除くため 1 回空回しする
+        target()
+        samples = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            target()
+            samples.append((time.perf_counter() - start_time) * 1000)
+    except Exception as e:
+        logger.warning(f"Benchmark of {name} failed: {str(e)}")
+        return {'function': name, 'error': f"{type(e).__name__}: {str(e)}"}
+
+    return {
+        'function': name,
+        'repeat': repeat,
+        'meanMs': round(statistics.fmean(samples), 6),
+        'stdevMs': round(statistics.stdev(samples), 6) if len(samples) > 1 else 0.0,
+        'p95Ms': round(percentile(samples, 0.95), 6),
+        'minMs': round(min(samples), 6),
+        'maxMs': round(max(samples), 6),
+    }
@@ -0,0 +1,319 @@
+import ast
+import os
+import sys
+import time
+import types
+import tempfile
+import traceback
+import logging
+import contextlib
+from typing import Dict, Any, List, Optional, Tuple
+from io import StringIO
+
+from profiling import Profiler, benchmark, BENCHMARK_DEFAULT_REPEAT
+
+logger = logging.getLogger()
+
+# ユーザーコードとして扱うモジュール名
+USER_MODULES = ('main', 'test_main')
+# 結果に含める遅いテストの件数
+SLOWEST_TEST_COUNT = 5
+
+# 実行のたびに不要なプラグイン探索やキャッシュ書き込みが走らないようにする
+PYTEST_ARGS = [
+    '-v',
+    '-p',
+    'no:cacheprovider',
+    '-p',
+    'no:pastebin',
+    '-p',
+    'no:junitxml',
+    '--noconftest',
+]
+
+_warmed_up = False
+
+
+class CaptureManager:
+    """テスト出力をキャプチャするプラグイン"""
+
+    def __init__(self, stdout_capture, stderr_capture):
+        self.stdout_capture = stdout_capture
+        self.stderr_capture = stderr_capture
+        self.tests: Dict[str, Dict[str, Any]] = {}
+
+    def pytest_runtest_logreport(self, report):
+        # setup / call / teardown の所要時間を合算し、結果は call か失敗したフェーズのものを使う
+        test = self.tests.setdefault(
+            report.nodeid, {"name": report.nodeid, "outcome": "passed", "duration": 0.0}
+        )
+        test["duration"] += report.duration
+        if report.when == "call" or report.failed or report.skipped:
+            test["outcome"] = report.outcome
+
+        if report.failed:
+            if hasattr(report, "longrepr"):
+                error_msg = str(report.longrepr)
+                self.stderr_capture.write(error_msg)
+                logger.error(f"Test failed: {report.nodeid}")
+                logger.debug(f"Error details: {error_msg}")
+
+
+@contextlib.contextmanager
+def isolated_user_modules(directory: str):
+    """ユーザーコードの import 状態を実行ごとに分離する
+
+    実行中は作業ディレクトリを一時ディレクトリに移し、
+    終了後に sys.path とユーザーモジュールを実行前の状態に戻す。
+    """
+    saved_path = list(sys.path)
+    saved_cwd = os.getcwd()
+    _purge_user_modules(directory)
+    try:
+        os.chdir(directory)
+        yield
+    finally:
+        os.chdir(saved_cwd)
+        sys.path[:] = saved_path
+        _purge_user_modules(directory)
+
+
+def _purge_user_modules(directory: str) -> None:
+    """main / test_main と一時ディレクトリ配下から読み込まれたモジュールを破棄する"""
+    prefix = os.path.realpath(directory) + os.sep
+    for name, module in list(sys.modules.items()):
+        module_file = getattr(module, '__file__', None) or ''
+        if name in USER_MODULES or (
+            module_file and os.path.realpath(module_file).startswith(prefix)
+        ):
+            del sys.modules[name]
+
+
+def fast_path_tests(test_code: str) -> Optional[List[str]]:
+    """pytest を起動せずに直接呼び出せるテスト関数名を返す
+
+    import と引数・デコレータなしの関数定義だけで構成された
+    assert ベースのテストのみを対象とし、それ以外は None を返す。
+    """
+    try:
+        tree = ast.parse(test_code)
+    except SyntaxError:
+        return None
+
+    test_names = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            continue
+        if (
+            isinstance(node, ast.Expr)
+            and isinstance(node.value, ast.Constant)
+            and isinstance(node.value.value, str)
+        ):
+            continue
+        if not isinstance(node, ast.FunctionDef) or node.decorator_list:
+            return None
+        args = node.args
+        if args.args or args.posonlyargs or args.kwonlyargs or args.vararg or args.kwarg:
+            return None
+        if node.name.startswith('test'):
+            test_names.append(node.name)
+    return test_names or None
+
+
+def summarize_timings(tests: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """テストごとの所要時間と、遅い順の上位を結果用にまとめる"""
+    tests = [{**test, "duration": round(test["duration"], 6)} for test in tests]
+    slowest = sorted(tests, key=lambda test: test["duration"], reverse=True)
+    return {"tests": tests, "slowest": slowest[:SLOWEST_TEST_COUNT]}
+
+
+def _load_module(name: str, path: str) -> types.ModuleType:
+    """ファイルからモジュールを読み込み sys.modules に登録する"""
+    module = types.ModuleType(name)
+    module.__file__ = path
+    sys.modules[name] = module
+    with open(path, 'r') as f:
+        source = f.read()
+    exec(compile(source, path, 'exec'), module.__dict__)
+    return module
+
+
+def run_fast(directory: str, test_names: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """テスト関数を直接呼び出し、(成功したテストの結果, pytest で実行するテスト名) を返す
+
+    失敗したテストには pytest の詳細なレポートが必要になるため、最初に失敗したテストで止め、
+    そのテストとまだ実行していないテストだけを呼び出し側で pytest に任せる。
+    成功したテストは pytest で実行し直さないので、副作用が 2 回起きることはない。
+    main.py / test_main.py の読み込みに失敗した場合は、全てのテストを pytest に任せる。
+    """
+    tests: List[Dict[str, Any]] = []
+    with isolated_user_modules(directory), contextlib.redirect_stdout(StringIO()):
+        sys.path.insert(0, directory)
+        try:
+            _load_module('main', os.path.join(directory, 'main.py'))
+            test_module = _load_module('test_main', os.path.join(directory, 'test_main.py'))
+        except BaseException:
+            logger.info("Fast path could not load the modules, falling back to pytest")
+            return tests, list(test_names)
+        for index, name in enumerate(test_names):
+            test_start = time.perf_counter()
+            try:
+                getattr(test_module, name)()
+            except BaseException:
+                logger.info(f"Fast path failed at {name}, running the remaining tests with pytest")
+                return tests, test_names[index:]
+            tests.append(
+                {
+                    "name": f"test_main.py::{name}",
+                    "outcome": "passed",
+                    "duration": time.perf_counter() - test_start,
+                }
+            )
+    return tests, []
+
+
+def fast_result(tests: List[Dict[str, Any]], execution_time: float) -> Dict[str, Any]:
+    """fast path だけで全テストが成功したときの結果"""
+    lines = [f"{test['name']} PASSED" for test in tests]
+    lines.append(f"{len(tests)} passed in {execution_time:.2f}s")
+    logger.info(f"Tests passed successfully in {execution_time:.2f} seconds (fast path)")
+    return {
+        "status": "success",
+        "message": "All tests passed!",
+        "exitCode": 0,
+        "output": "\n".join(lines),
+        "error": "",
+        "executionTime": f"{execution_time:.2f}s",
+        "runner": "fast",
+        **summarize_timings(tests),
+    }
+
+
+def run_pytest(
+    test_path: str,
+    test_names: Optional[List[str]] = None,
+    passed: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """pytest でテストを実行する
+
+    test_names を指定した場合はそのテストだけを実行し、fast path で成功済みのテスト (passed) と結果をまとめる。
+    """
+    # fast path だけで済む場合に読み込まずに済むよう、初めて使うときに import する
+    import pytest
+
+    directory = os.path.dirname(test_path)
+    passed = passed or []
+    capture_output = StringIO()
+    stderr_output = StringIO()
+    for test in passed:
+        capture_output.write(f"{test['name']} PASSED (fast path)\n")
+    targets = [f"{test_path}::{name}" for name in test_names] if test_names else [test_path]
+
+    start_time = time.perf_counter()
+    plugin = CaptureManager(capture_output, stderr_output)
+    with isolated_user_modules(directory), contextlib.redirect_stdout(capture_output):
+        result = pytest.main(
+            PYTEST_ARGS + ['--rootdir', directory] + targets, plugins=[plugin]
+        )
+    execution_time = time.perf_counter() - start_time + sum(test["duration"] for test in passed)
+
+    output = capture_output.getvalue()
+    error_output = stderr_output.getvalue()
+
+    if result == 0:
+        status = "success"
+        message = "All tests passed!"
+        logger.info(f"Tests passed successfully in {execution_time:.2f} seconds")
+    else:
+        status = "failure"
+        message = "Some tests failed."
+        logger.warning(f"Tests failed in {execution_time:.2f} seconds")
+        logger.debug(f"Test output: {output}")
+        logger.debug(f"Error output: {error_output}")
+
+    return {
+        "status": status,
+        "message": message,
+        "exitCode": int(result),
+        "output": output,
+        "error": error_output,
+        "executionTime": f"{execution_time:.2f}s",
+        "runner": "pytest",
+        **summarize_timings(passed + list(plugin.tests.values())),
+    }
+
+
+def run_benchmark(directory: str, name: str, repeat: int) -> Dict[str, Any]:
+    """main.py / test_main.py を読み込み、指定された関数のベンチマークを取る"""
+    with isolated_user_modules(directory), contextlib.redirect_stdout(StringIO()):
+        sys.path.insert(0, directory)
+        try:
+            main_module = _load_module('main', os.path.join(directory, 'main.py'))
+            test_module = _load_module('test_main', os.path.join(directory, 'test_main.py'))
+        except Exception as e:
+            return {'function': name, 'error': f"{type(e).__name__}: {str(e)}"}
+        return benchmark([test_module, main_module], name, repeat)
+
+
+def run_tests(
+    test_path: str, test_code: str = "", options: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """テストを実行する。単純な assert のみのテストは pytest を経由しない
+
+    options には profile (cprofile / tracemalloc) と
+    benchmark (関数名), benchmarkRepeat (繰り返し回数) を指定できる。
+    """
+    logger.info(f"Starting test execution: {test_path}")
+    options = options or {}
+    directory = os.path.dirname(test_path)
+    try:
+        with Profiler(options.get('profile'), directory) as profiler:
+            test_names = fast_path_tests(test_code)
+            if test_names:
+                start_time = time.perf_counter()
+                passed, remaining = run_fast(directory, test_names)
+                if remaining:
+                    result = run_pytest(test_path, remaining, passed)
+                else:
+                    result = fast_result(passed, time.perf_counter() - start_time)
+            else:
+                result = run_pytest(test_path)
+        if profiler.kind:
+            result["profile"] = profiler.report()
+
+        if options.get('benchmark'):
+            result["benchmark"] = run_benchmark(
+                directory,
+                options['benchmark'],
+                options.get('benchmarkRepeat') or BENCHMARK_DEFAULT_REPEAT,
+            )
+        return result
+    except Exception as e:
+        logger.error(f"Test execution failed: {str(e)}")
+        logger.error(traceback.format_exc())
+        return {
+            "status": "error",
+            "message": str(e),
+            "exitCode": 1,
+            "output": "",
+            "error": str(e),
+            "executionTime": "0s",
+        }
+
+
+def warm_up() -> None:
+    """コールドスタート時に一度だけ pytest を空回しして内部モジュールを読み込んでおく"""
+    global _warmed_up
+    if _warmed_up:
+        return
+    with tempfile.TemporaryDirectory() as temp_dir:
+        test_path = os.path.join(temp_dir, 'test_main.py')
+        with open(os.path.join(temp_dir, 'main.py'), 'w') as f:
+            f.write('')
+        with open(test_path, 'w') as f:
+            f.write('def test_warm_up():\n    assert True\n')
+        try:
+            run_pytest(test_path)
+        except Exception as e:
+            logger.warning(f"pytest warm up failed: {str(e)}")
+    _warmed_up = True
@@ -0,0 +1,221 @@
+import os
+import time
+import signal
+import resource
+import logging
+import multiprocessing
+from multiprocessing.connection import wait
+from typing import Dict, Any, List, Optional, Tuple
+
+from runner import run_tests, warm_up
+
+logger = logging.getLogger()
+
+# 1 回のテスト実行に許可するリソース
+CPU_TIME_LIMIT = int(os.environ.get('SANDBOX_CPU_SECONDS', '10'))
+WALL_TIME_LIMIT = float(os.environ.get('SANDBOX_WALL_SECONDS', '20'))
+MEMORY_LIMIT_MB = int(os.environ.get('SANDBOX_MEMORY_MB', '128'))
+# 待機させておくワーカープロセス数
+POOL_SIZE = int(os.environ.get('SANDBOX_POOL_SIZE', '1'))
+# コールドスタート時に pytest を読み込んでワーカーを fork しておくか
+PREWARM = os.environ.get('SANDBOX_PREWARM', 'true').lower() == 'true'
+
+_pool = None
+
+
+def _current_address_space() -> Optional[int]:
+    """現在のプロセスの仮想メモリサイズ (bytes) を返す"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmSize:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _apply_limits(limits: Dict[str, Any]) -> None:
+    """ワーカープロセス自身に CPU 時間とメモリの上限を設定する"""
+    cpu_seconds = limits['cpuSeconds']
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+
+    # fork 元から引き継いだアドレス空間に、テスト対象コード用の上限を上乗せする
+    address_space = _current_address_space()
+    if address_space is not None:
+        memory_bytes = address_space + limits['memoryMb'] * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+
+def _worker_main(conn) -> None:
+    """ジョブを 1 件だけ受け取って実行し、結果をパイプで返して終了する"""
+    job = conn.recv()
+    if job is None:
+        return
+    _apply_limits(job['limits'])
+    result = run_tests(job['testPath'], job['testCode'], job.get('options'))
+    conn.send(result)
+    conn.close()
+
+
+class Worker:
+    """fork 済みで pytest を読み込み済みのワーカープロセス"""
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.started_at = None
+        self.finished_at = None
+
+    def submit(self, job: Dict[str, Any]) -> None:
+        self.started_at = time.perf_counter()
+        self.conn.send(job)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def describe_exit(self) -> str:
+        """ワーカーが結果を返さずに終了した理由を返す"""
+        self.process.join()
+        exitcode = self.process.exitcode
+        if exitcode == -signal.SIGXCPU:
+            return f"CPU time limit exceeded ({CPU_TIME_LIMIT}s)."
+        if exitcode == -signal.SIGKILL:
+            return "Test process was killed, most likely by running out of memory."
+        return f"Test process exited unexpectedly with code {exitcode}."
+
+
+class SandboxPool:
+    """テストを分離されたプロセスで実行するためのワーカープール"""
+
+    def __init__(self, size: int = POOL_SIZE):
+        self.size = max(size, 1)
+        self._context = multiprocessing.get_context('fork')
+        self._idle: List[Worker] = []
+
+    def _spawn(self) -> Worker:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main, args=(child_conn,), daemon=True
+        )
+        process.start()
+        child_conn.close()
+        return Worker(process, parent_conn)
+
+    def replenish(self) -> None:
+        """待機中のワーカーをプールサイズまで補充する"""
+        self._idle = [worker for worker in self._idle if worker.process.is_alive()]
+        while len(self._idle) < self.size:
+            self._idle.append(self._spawn())
+
+    def acquire(self) -> Worker:
+        while self._idle:
+            worker = self._idle.pop()
+            if worker.process.is_alive():
+                return worker
+        return self._spawn()
+
+    def collect(self, worker: Worker, timeout: float) -> Dict[str, Any]:
+        """ワーカーの結果を待つ。上限を超えた場合はワーカーを停止してエラー結果を返す"""
+        try:
+            if not worker.conn.poll(timeout):
+                logger.warning(f"Wall-clock time limit exceeded ({WALL_TIME_LIMIT}s)")
+                return limit_result(
+                    f"Wall-clock time limit exceeded ({WALL_TIME_LIMIT}s).",
+                    WALL_TIME_LIMIT,
+                )
+            try:
+                return worker.conn.recv()
+            except EOFError:
+                message = worker.describe_exit()
+                logger.warning(message)
+                return limit_result(
+                    message, time.perf_counter() - worker.started_at
+                )
+        finally:
+            worker.finished_at = time.perf_counter()
+            worker.kill()
+
+    def run(
+        self, test_path: str, test_code: str, options: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """テストをワーカープロセスで実行し、run_tests と同じ形式の結果を返す"""
+        result, _ = self.run_many([build_job(test_path, test_code, options)], 1)[0]
+        return result
+
+    def run_many(
+        self, jobs: List[Dict[str, Any]], parallelism: int
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """複数のジョブを最大 parallelism 個のワーカーで並列に実行する
+
+        ジョブの順序で (結果, 経過秒数) のリストを返す。
+        """
+        results: List[Optional[Tuple[Dict[str, Any], float]]] = [None] * len(jobs)
+        pending = list(enumerate(jobs))
+        running = {}
+        try:
+            while pending or running:
+                while pending and len(running) < max(parallelism, 1):
+                    index, job = pending.pop(0)
+                    worker = self.acquire()
+                    worker.submit(job)
+                    running[worker.conn] = (index, worker)
+
+                # 最も早く上限に達するワーカーの時刻まで待つ
+                deadline = min(
+                    worker.started_at + WALL_TIME_LIMIT
+                    for _, worker in running.values()
+                )
+                ready = wait(list(running), max(deadline - time.perf_counter(), 0))
+
+                now = time.perf_counter()
+                for conn, (index, worker) in list(running.items()):
+                    if conn in ready or now - worker.started_at >= WALL_TIME_LIMIT:
+                        del running[conn]
+                        results[index] = (self.collect(worker, 0), worker.elapsed)
+        finally:
+            for _, worker in running.values():
+                worker.kill()
+            self.replenish()
+        return results
+
+
+def build_job(
+    test_path: str, test_code: str, options: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """ワーカーに渡すジョブを組み立てる"""
+    return {
+        'testPath': test_path,
+        'testCode': test_code,
+        'options': options or {},
+        'limits': {'cpuSeconds': CPU_TIME_LIMIT, 'memoryMb': MEMORY_LIMIT_MB},
+    }
+
+
+def limit_result(message: str, elapsed: float) -> Dict[str, Any]:
+    """リソース上限に達した場合の結果を run_tests と同じ形式で返す"""
+    return {
+        "status": "error",
+        "message": message,
+        "exitCode": 1,
+        "output": "",
+        "error": message,
+        "executionTime": f"{elapsed:.2f}s",
+    }
+
+
+def get_pool() -> SandboxPool:
+    """プールを作成して返す。ワーカーは pytest を読み込んだ後に fork する"""
+    global _pool
+    if _pool is None:
+        warm_up()
+        _pool = SandboxPool()
+        _pool.replenish()
+    return _pool
@@ -4,9 +4,12 @@ import { PromptManager } from './prompts/prompt-manager';
 import { ModelId } from './types/model';
 import { AgentBuilder } from './constructs/agent-builder';
 import { BedrockLogsWatcherConstruct } from './constructs/bedrock-logs-watcher';
-import { ENVIRONMENT_CONFIG, AGENT_CONFIG } from '../parameter';
+import { ENVIRONMENT_CONFIG, AGENT_CONFIG, KNOWLEDGE_BASE_CONFIG } from '../parameter';
 import * as s3 from 'aws-cdk-lib/aws-s3';
 import * as s3deploy from 'aws-cdk-lib/aws-s3-deployment';
+import * as lambda from 'aws-cdk-lib/aws-lambda';
+import * as path from 'path';
+import { execFileSync } from 'child_process';
 
 
 export class AgentPreparationToolkitStack extends cdk.Stack {
@@ -19,6 +22,14 @@ export class AgentPreparationToolkitStack extends cdk.Stack {
 
     const modelId : ModelId = 'anthropic.claude-3-5-sonnet-20241022-v2:0';
 
+    // 分割済みのデータを使う場合は data-source-chunks/ 以下を取り込み、Knowledge Base 側では分割しない
+    const knowledgeBaseDataSource = (dataDir: string) => KNOWLEDGE_BASE_CONFIG.preChunked
+      ? {
+        dataDir: dataDir.replace('./data-source/', './data-source-chunks/'),
+        chunkingStrategy: 'NONE' as const,
+      }
+      : { dataDir: dataDir };
+
     // ----------------- Python Coder Agent の実装例 -----------------
     if (AGENT_CONFIG.pythonCoder.enabled) {
       const PythonCoderName = 'python-coder';
@@ -68,7 +79,7 @@ export class AgentPreparationToolkitStack extends cdk.Stack {
         knowledgeBaseConfig: {
           dataSources: [
             {
-              dataDir: './data-source/hr/',
+              ...knowledgeBaseDataSource('./data-source/hr/'),
               name: hrAgentName,
               description: 'Human resource data source',
             }
@@ -110,7 +121,7 @@ export class AgentPreparationToolkitStack extends cdk.Stack {
         knowledgeBaseConfig: {
           dataSources: [
             {
-              dataDir: './data-source/product-support/',
+              ...knowledgeBaseDataSource('./data-source/product-support/'),
               name: productSupportAgentName,
               description: 'Support data source sample',
             }
@@ -149,6 +160,39 @@ export class AgentPreparationToolkitStack extends cdk.Stack {
         destinationBucket: contractTemplateBucket,
         destinationKeyPrefix: DOC_DATA_PREFIX
       })
+      // /search で使う契約書の転置インデックスはデプロイ時に作って index/ に置き、Lambda は読み込むだけにする
+      const CONTRACT_INDEX_KEY = 'index/contracts.json.gz';
+      const contractIndexScript = path.resolve('./action-groups/contract-searcher/lambda');
+      new s3deploy.BucketDeployment(this,'ContractIndexDeployment',{
+        sources: [s3deploy.Source.asset('./data-source/contract-searcher/templates/', {
+          assetHashType: cdk.AssetHashType.OUTPUT,
+          bundling: {
+            image: lambda.Runtime.PYTHON_3_13.bundlingImage,
+            volumes: [{ hostPath: contractIndexScript, containerPath: '/contract-index' }],
+            command: [
+              'python', '/contract-index/contract_index.py', '/asset-input',
+              `/asset-output/${path.basename(CONTRACT_INDEX_KEY)}`, '--prefix', DOC_DATA_PREFIX,
+            ],
+            local: {
+              tryBundle(outputDir: string) {
+                try {
+                  execFileSync('python3', [
+                    path.join(contractIndexScript, 'contract_index.py'),
+                    path.resolve('./data-source/contract-searcher/templates/'),
+                    path.join(outputDir, path.basename(CONTRACT_INDEX_KEY)),
+                    '--prefix', DOC_DATA_PREFIX,
+                  ], { stdio: 'inherit' });
+                  return true;
+                } catch {
+                  return false;
+                }
+              },
+            },
+          },
+        })],
+        destinationBucket: contractTemplateBucket,
+        destinationKeyPrefix: path.dirname(CONTRACT_INDEX_KEY) + '/',
+      })
       const contractSearcherName = 'contract-searcher';
       new AgentBuilder(this, 'ContractSearcher', {
         prefix: prefix,
@@ -166,7 +210,7 @@ export class AgentPreparationToolkitStack extends cdk.Stack {
         knowledgeBaseConfig: {
           dataSources: [
             {
-              dataDir: './data-source/contract-searcher/docs/',
+              ...knowledgeBaseDataSource('./data-source/contract-searcher/docs/'),
               name: contractSearcherName,
               description: '契約書の種類や内容が説明されている',
             }
@@ -195,7 +239,8 @@ export class AgentPreparationToolkitStack extends cdk.Stack {
             ],
             lambdaEnvironment: {
               CONTRACT_BUCKET: contractTemplateBucket.bucketName,
-              DOC_DATA_PREFIX: DOC_DATA_PREFIX
+              DOC_DATA_PREFIX: DOC_DATA_PREFIX,
+              CONTRACT_INDEX_KEY: CONTRACT_INDEX_KEY
             }
           }
         ],
@@ -211,13 +256,15 @@ export class AgentPreparationToolkitStack extends cdk.Stack {
     if (AGENT_CONFIG.bedrockLogWatcher.enabled) {
       const bedrockLogsBucket = AGENT_CONFIG.bedrockLogWatcher.config.bedrockLogsBucket;
       const bedrockLogsPrefix = AGENT_CONFIG.bedrockLogWatcher.config.bedrockLogsPrefix;
+      const bytesScannedCutoffPerQuery = AGENT_CONFIG.bedrockLogWatcher.config.bytesScannedCutoffPerQuery;
       if (bedrockLogsBucket !== '' && bedrockLogsPrefix !== '') {
         const bedrockLogsWatcher = new BedrockLogsWatcherConstruct(this, 'BedrockLogsWatcherInfra', {
           prefix,
           accountId,
           region,
           bedrockLogsBucket,
-          bedrockLogsPrefix
+          bedrockLogsPrefix,
+          bytesScannedCutoffPerQuery
         });
         
         const BedrockLogsWatcherName = 'bedrock-logs-watcher';
@@ -243,6 +290,8 @@ export class AgentPreparationToolkitStack extends cdk.Stack {
                 ATHENA_WORKGROUP: bedrockLogsWatcher.workGroup.name,
                 DATABASE: bedrockLogsWatcher.database.ref,
                 TABLE: bedrockLogsWatcher.table.ref,
+                BYTES_SCANNED_CUTOFF: String(bytesScannedCutoffPerQuery),
+                PARTITION_COLUMN: bedrockLogsWatcher.partitionColumn,
               }
             }
           ],
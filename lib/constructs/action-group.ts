@@ -3,7 +3,9 @@ import { Construct } from 'constructs';
 import * as s3 from 'aws-cdk-lib/aws-s3';
 import * as iam from 'aws-cdk-lib/aws-iam';
 import * as lambda from 'aws-cdk-lib/aws-lambda';
+import * as fs from 'fs';
 import * as path from 'path';
+import { execFileSync } from 'child_process';
 import { BucketDeployment } from './bucket-deployment';
 import { OpenApiPath, lambdaEnvironment } from '../types';
 
@@ -15,6 +17,13 @@ export interface ActionGroupProps {
   lambdaEnvironment?: lambdaEnvironment;
 }
 
+// 共通レイヤーの依存を、ビルドするマシンによらず Lambda の実行環境向けの wheel で入れる
+const pipInstallArgs = (requirements: string, target: string): string[] => [
+  '-r', requirements, '-t', target,
+  '--platform', 'manylinux2014_x86_64', '--implementation', 'cp', '--python-version', '3.13',
+  '--only-binary=:all:', '--no-cache-dir', '--quiet',
+];
+
 export class ActionGroup extends Construct {
   public readonly actionGroupName : string;
   public readonly actionGroupExecutor : { lambda: string};
@@ -52,6 +61,50 @@ export class ActionGroup extends Construct {
       });
     }
 
+    // 全ての Action Group で共有するモジュール (action-groups/common/python/apt_common) はスタックに 1 つだけ作る
+    const stack = cdk.Stack.of(this);
+    const commonPath = path.join(__dirname, '../../action-groups/common');
+    const commonLayer = (stack.node.tryFindChild('ActionGroupCommonLayer') as lambda.LayerVersion | undefined)
+      ?? new lambda.LayerVersion(stack, 'ActionGroupCommonLayer', {
+        // requirements.txt の依存 (pyyaml) も python/ に入れる。Lambda (x86_64) 向けの wheel だけを使う
+        code: lambda.Code.fromAsset(commonPath, {
+          exclude: ['__pycache__'],
+          bundling: {
+            image: lambda.Runtime.PYTHON_3_13.bundlingImage,
+            command: ['bash', '-c', [
+              'cp -r /asset-input/python /asset-output/',
+              `pip install ${pipInstallArgs('/asset-input/requirements.txt', '/asset-output/python').join(' ')}`,
+            ].join(' && ')],
+            local: {
+              tryBundle(outputDir: string) {
+                try {
+                  fs.cpSync(path.join(commonPath, 'python'), path.join(outputDir, 'python'), {
+                    recursive: true,
+                    filter: (source) => path.basename(source) !== '__pycache__',
+                  });
+                  execFileSync('python3', [
+                    '-m', 'pip', 'install',
+                    ...pipInstallArgs(path.join(commonPath, 'requirements.txt'), path.join(outputDir, 'python')),
+                  ], { stdio: 'inherit' });
+                  return true;
+                } catch {
+                  return false;
+                }
+              },
+            },
+          },
+        }),
+        compatibleRuntimes: [lambda.Runtime.PYTHON_3_13],
+        description: 'Shared modules for action group Lambda functions',
+      });
+
+    // パラメータの検証に使う OpenAPI スキーマを /opt/api-schema.yaml に置く
+    const schemaLayer = new lambda.LayerVersion(this, 'SchemaLayer', {
+      code: lambda.Code.fromAsset(path.dirname(props.openApiSchemaPath)),
+      compatibleRuntimes: [lambda.Runtime.PYTHON_3_13],
+      description: `OpenAPI schema for ${props.actionGroupName}`,
+    });
+
     this.lambdaFunction = new lambda.Function(this, 'Function', {
       runtime: lambda.Runtime.PYTHON_3_13,
       code: lambda.Code.fromAsset(path.join(props.lambdaFunctionPath),{
@@ -61,8 +114,10 @@ export class ActionGroup extends Construct {
       memorySize: 256,
       timeout: cdk.Duration.seconds(30),
       role: this.lambdaRole,
+      layers: [commonLayer, schemaLayer],
       environment: {
-        PYTHONPATH: '/var/task:/var/task/lib',
+        PYTHONPATH: '/var/task:/var/task/lib:/opt/python',
+        API_SCHEMA_PATH: `/opt/${path.basename(props.openApiSchemaPath)}`,
         ...props.lambdaEnvironment
       }
     });
@@ -1,6 +1,6 @@
 import * as cdk from 'aws-cdk-lib';
 import { Construct } from 'constructs';
-import { KnowledgeBase } from './knowledge-base';
+import { KnowledgeBase, ChunkingStrategy } from './knowledge-base';
 import { ActionGroup } from './action-group';
 import { Agent } from './agent';
 import { ModelId } from '../types/model';
@@ -13,6 +13,7 @@ export interface DataSourceConfig {
   dataDir: string;
   name: string;
   description: string;
+  chunkingStrategy?: ChunkingStrategy;
 }
 
 export interface AgentBuilderProps {
@@ -121,6 +122,7 @@ export class AgentBuilder extends Construct {
         ...(this.knowledgeBase && {
           knowledgeBaseId: this.knowledgeBase.knowledgeBaseId,
           DataSourceId: this.knowledgeBase.dataSourceIds,
+          dataDirs: this.knowledgeBase.dataDirs,
         }),
       }),
       exportName: (this.agent.agentName),
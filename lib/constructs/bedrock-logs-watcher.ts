@@ -11,6 +11,7 @@ export interface BedrockLogsWatcherProps {
   region: string;
   bedrockLogsBucket: string;
   bedrockLogsPrefix: string;
+  bytesScannedCutoffPerQuery: number;
 }
 
 export class BedrockLogsWatcherConstruct extends Construct {
@@ -18,6 +19,7 @@ export class BedrockLogsWatcherConstruct extends Construct {
   public readonly workGroup: athena.CfnWorkGroup;
   public readonly database: glue.CfnDatabase;
   public readonly table: glue.CfnTable;
+  public readonly partitionColumn: string;
   public readonly lambdaPolicies: iam.PolicyStatement[];
 
   constructor(scope: Construct, id: string, props: BedrockLogsWatcherProps) {
@@ -58,6 +60,8 @@ export class BedrockLogsWatcherConstruct extends Construct {
         },
         enforceWorkGroupConfiguration: true,
         publishCloudWatchMetricsEnabled: true,
+        // 生成された SQL が大量のデータをスキャンしないように上限を設ける
+        bytesScannedCutoffPerQuery: props.bytesScannedCutoffPerQuery,
         engineVersion: {
           selectedEngineVersion: 'Athena engine version 3'
         }
@@ -72,6 +76,10 @@ export class BedrockLogsWatcherConstruct extends Construct {
       },
     });
 
+    // ログは <prefix>/yyyy/MM/dd/HH/ に出力されるので、日付のパスを partition projection でパーティションにする
+    // (Lambda が長い期間のクエリを分割するときは、この列で各サブクエリのスキャン範囲を絞る)
+    this.partitionColumn = 'dt';
+
     // Glue テーブルの作成
     this.table = new glue.CfnTable(this, 'BedrockLogsTable', {
       catalogId: accountId,
@@ -80,7 +88,14 @@ export class BedrockLogsWatcherConstruct extends Construct {
         name: `${props.prefix}bedrock_model_invocation_logs`,
         tableType: 'EXTERNAL_TABLE',
         parameters: {
-          'classification': 'json'
+          'classification': 'json',
+          'projection.enabled': 'true',
+          [`projection.${this.partitionColumn}.type`]: 'date',
+          [`projection.${this.partitionColumn}.format`]: 'yyyy/MM/dd',
+          [`projection.${this.partitionColumn}.range`]: '2023/01/01,NOW',
+          [`projection.${this.partitionColumn}.interval`]: '1',
+          [`projection.${this.partitionColumn}.interval.unit`]: 'DAYS',
+          'storage.location.template': `${bedrockLogsS3Uri.replace(/\/$/, '')}/\${${this.partitionColumn}}/`,
         },
         storageDescriptor: {
           location: bedrockLogsS3Uri,
@@ -112,7 +127,9 @@ export class BedrockLogsWatcherConstruct extends Construct {
           ],
         },
         retention: 0,
-        partitionKeys: [],
+        partitionKeys: [
+          { name: this.partitionColumn, type: 'string', comment: 'ログが出力された日付 (yyyy/MM/dd)' },
+        ],
       },
     });
 
@@ -139,6 +156,7 @@ export class BedrockLogsWatcherConstruct extends Construct {
           'athena:GetQueryExecution',
           'athena:StartQueryExecution',
           'athena:GetQueryResults',
+          'athena:StopQueryExecution',
           'kms:Decrypt',
         ],
         resources: [
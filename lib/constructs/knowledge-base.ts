@@ -6,10 +6,14 @@ import * as s3 from 'aws-cdk-lib/aws-s3';
 import { BucketDeployment } from './bucket-deployment';
 import { EmbeddingModelId } from '../types';
 
+// NONE はファイルごとに 1 チャンクとして取り込む (tools/prechunk.py で分割済みのデータ向け)
+export type ChunkingStrategy = 'FIXED_SIZE' | 'NONE';
+
 interface DataSource {
   dataDir: string;
   name: string;
   description?: string;
+  chunkingStrategy?: ChunkingStrategy;
 }
 
 interface ExtendedDataSource extends DataSource {
@@ -30,6 +34,8 @@ export class KnowledgeBase extends Construct {
   public readonly knowledgeBaseId: string;
   public readonly knowledgeBaseName: string;
   public readonly dataSourceIds: string[] = [];
+  // dataSourceIds と同じ順のローカルのディレクトリ (tools/upload.py で使う)
+  public readonly dataDirs: string[] = [];
   constructor(scope: Construct, id: string, props: KnowledgeBaseProps) {
     super(scope, id);
     const vectorIndexName = `${props.prefix}bedrock-knowledge-base-default`;
@@ -106,18 +112,21 @@ export class KnowledgeBase extends Construct {
           type: 'S3',
         },
         vectorIngestionConfiguration: {
-          chunkingConfiguration: {
-            chunkingStrategy: 'FIXED_SIZE',
-            fixedSizeChunkingConfiguration: {
-              maxTokens: 1000,
-              overlapPercentage: 20,
+          chunkingConfiguration: dataSource.chunkingStrategy === 'NONE'
+            ? { chunkingStrategy: 'NONE' }
+            : {
+              chunkingStrategy: 'FIXED_SIZE',
+              fixedSizeChunkingConfiguration: {
+                maxTokens: 1000,
+                overlapPercentage: 20,
+              },
             },
-          },
         },
         knowledgeBaseId: knowledgeBase.attrKnowledgeBaseId,
         name: `${props.prefix}${dataSource.name}`,
         description: dataSource.description || ''
       }).attrDataSourceId);
+      this.dataDirs.push(dataSource.dataDir);
     }
 
     this.knowledgeBaseId = knowledgeBase.ref
@@ -113,6 +113,8 @@ ${pythonCoderLambdaFunctionCode}
 あなたは必ず人事規則の情報が格納されている KnowledgeBase を検索し、そのあと Action Group を使い、知識を得てください。
 それでも答えられない場合は、askuser を通じてユーザーに必要な情報を求めてください。
 また、計算を行ったり現在時刻を得る場合は Code Interpreter を使用してください。
+ただし、社員の年休付与日数は Action Group の current_leave_entitlements ビュー (今年度) や employee_leave ビュー (年度ごと) に計算済みのものがあるので、入社日から計算せずにそれを使用してください。
+複数の SQL の結果が必要な場合は、/select を何度も呼び出さずに /batch-select でまとめて実行してください。
 ActionGroup を使って得られる知識、及びKnowledgeBase を検索して得られる知識だけから論理的に導きだせる回答のみを必ず日本語で答えてください。`,
     preProcessing: ``,
     orchestration: `{
@@ -169,6 +171,8 @@ $prompt_session_attributes$
     agentPromptsId: 'product-support-agent',
     instruction: `あなたはプリンターのプロダクトサポートです。
 ユーザーはエラーコードを与えます。KnowledgeBase からエラーコードの詳細を取り、ActionGroup からそのエラーコードのサポート履歴を取得し、ユーザーに何をすべきかを提案してください。
+ユーザーがエラーコードではなく症状や作業内容を与えた場合は、ActionGroup の /search で対応履歴を全文検索してください。
+複数のエラーコードや機器の履歴が必要な場合は、/select を何度も呼び出さずに /batch-select でまとめて取得してください。
 ただし回答は**必ず日本語で**答えてください。`,
     preProcessing: ``,
     orchestration: ``,
@@ -186,6 +190,7 @@ $prompt_session_attributes$
 ユーザーに必要な契約書が一意になるまでユーザーへのヒアリングを繰り返し、一意に定めてください。
 AI が署名付き URL をユーザーに提供するまで AI の仕事は終わらないことに注意してください。
 ただし、契約書のテンプレートは新しいものが正しいです。
+契約書の特定の条項の内容を説明するときは、ActionGroup の /search で契約書の本文を検索し、返ってきた条項 (ファイル名と第N条) を引用してください。
 `,
     preProcessing: `
 {
@@ -14,8 +14,21 @@ export const ENVIRONMENT_CONFIG: EnvironmentConfig = {
 export const BedrockLogsSchema = z.object({
   bedrockLogsBucket: z.string(),
   bedrockLogsPrefix: z.string(),
+  bytesScannedCutoffPerQuery: z.number().int().min(10 * 1024 * 1024),
 });
 
+export const KnowledgeBaseSchema = z.object({
+  preChunked: z.boolean(),
+});
+
+export type KnowledgeBaseConfig = z.infer<typeof KnowledgeBaseSchema>;
+
+// true にすると python tools/prechunk.py で見出しごとに分割した data-source-chunks/ を取り込み、
+// Knowledge Base 側ではチャンク分割しない (chunkingStrategy: NONE)
+export const KNOWLEDGE_BASE_CONFIG: KnowledgeBaseConfig = {
+  preChunked: false,
+};
+
 export type AgentConfig = z.infer<typeof AgentConfigSchema>;
 
 export const AgentConfigSchema = z.object({
@@ -55,6 +68,7 @@ export const AGENT_CONFIG: AgentConfig = {
     config: {
       bedrockLogsBucket: '', // Bedrock のログを保存しているバケット。設定していない場合はマネジメントコンソールから設定すること
       bedrockLogsPrefix: '', //デフォルトだとこちら → /AWSLogs/{ACCOUNT}/BedrockModelInvocationLogs/{REGION}/
+      bytesScannedCutoffPerQuery: 1024 * 1024 * 1024, // 1 クエリでスキャンできる上限 (バイト、10 MB 以上)。超えたクエリは Athena が中止する
     },
   }
 };
\ No newline at end of file
@@ -0,0 +1,255 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+import contextlib
+import tracemalloc
+
+from handlers import (
+    list_action_groups,
+    load_handler,
+    build_event,
+    load_corpus,
+    response_status,
+)
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+EVENTS_DIR = os.path.join(TOOLS_DIR, 'events')
+DEFAULT_BASELINE = os.path.join(TOOLS_DIR, 'bench_baseline.json')
+RESULT_PREFIX = 'BENCH_RESULT '
+
+# 値が大きいほど悪い指標と、小さいほど悪い指標
+HIGHER_IS_WORSE = ('p50Ms', 'p99Ms', 'peakKiB', 'coldInitMs', 'coldFirstCallMs')
+LOWER_IS_WORSE = ('opsPerSec',)
+
+
+def corpus_path(action_group):
+    return os.path.join(EVENTS_DIR, f"{action_group}.jsonl")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def invoke(handler, event):
+    """標準出力を捨てて lambda_handler を呼び、(経過ミリ秒, ステータス) を返す"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        response = handler.lambda_handler(event, None)
+        elapsed = (time.perf_counter() - start) * 1000
+    return elapsed, response_status(response)
+
+
+def run_cold(action_group):
+    """新しいプロセスで初期化と 1 回目の呼び出しにかかった時間を計測する"""
+    payload = load_corpus(corpus_path(action_group))[0]
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        handler = load_handler(action_group)
+    init_ms = (time.perf_counter() - start) * 1000
+    first_call_ms, status = invoke(handler, build_event(action_group, payload))
+    return {'initMs': init_ms, 'firstCallMs': first_call_ms, 'status': status}
+
+
+def run_warm(action_group, iterations):
+    """コーパスの全イベントを iterations 周呼び出し、レイテンシとメモリのピークを計測する"""
+    payloads = load_corpus(corpus_path(action_group))
+    handler = load_handler(action_group)
+
+    # 1 周目は遅延 import などを済ませるためのウォームアップとして捨てる
+    statuses = {}
+    for payload in payloads:
+        _, status = invoke(handler, build_event(action_group, payload))
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for payload in payloads:
+            elapsed, _ = invoke(handler, build_event(action_group, payload))
+            latencies.append(elapsed)
+    total = time.perf_counter() - start
+
+    # tracemalloc は処理を遅くするので、レイテンシとは別の周で計測する
+    tracemalloc.start()
+    for payload in payloads:
+        invoke(handler, build_event(action_group, payload))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'events': len(payloads),
+        'calls': len(latencies),
+        'statuses': statuses,
+        'opsPerSec': len(latencies) / total if total else 0.0,
+        'p50Ms': percentile(latencies, 50),
+        'p99Ms': percentile(latencies, 99),
+        'meanMs': statistics.mean(latencies),
+        'peakKiB': peak / 1024,
+    }
+
+
+def child_env():
+    env = dict(os.environ)
+    # python-coder は結果キャッシュを無効にし、テストの実行そのものを計測する
+    env['RESULT_CACHE_ENABLED'] = 'false'
+    env.setdefault('RESULT_CACHE_DIR', tempfile.mkdtemp(prefix='bench-cache-'))
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    return env
+
+
+def run_child(action_group, mode, iterations):
+    """Action Group ごとに別プロセスで計測し、モジュールや sys.path が混ざらないようにする"""
+    completed = subprocess.run(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            '--child',
+            mode,
+            '--iterations',
+            str(iterations),
+            action_group,
+        ],
+        cwd=TOOLS_DIR,
+        env=child_env(),
+        capture_output=True,
+        text=True,
+    )
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    stderr = completed.stderr.strip().splitlines()
+    raise RuntimeError(stderr[-1] if stderr else f"exit code {completed.returncode}")
+
+
+def measure(action_group, iterations, cold_runs):
+    report = {'actionGroup': action_group, **run_child(action_group, 'warm', iterations)}
+    if cold_runs > 0:
+        colds = [run_child(action_group, 'cold', 1) for _ in range(cold_runs)]
+        report['coldRuns'] = cold_runs
+        report['coldInitMs'] = statistics.median(cold['initMs'] for cold in colds)
+        report['coldFirstCallMs'] = statistics.median(cold['firstCallMs'] for cold in colds)
+    return report
+
+
+def compare(report, baseline, tolerance, min_delta_ms):
+    """ベースラインから tolerance を超えて悪化した指標の一覧を返す
+
+    ミリ秒単位の指標は計測の揺らぎを考慮し、min_delta_ms 未満の差は無視する。
+    """
+    regressions = []
+    for metric in HIGHER_IS_WORSE:
+        if metric not in report or metric not in baseline:
+            continue
+        slack = min_delta_ms if metric.endswith('Ms') else 0.0
+        limit = baseline[metric] * (1 + tolerance) + slack
+        if report[metric] > limit:
+            regressions.append(f"{metric} {report[metric]:.2f} > {limit:.2f} (baseline {baseline[metric]:.2f})")
+    for metric in LOWER_IS_WORSE:
+        if metric not in report or metric not in baseline:
+            continue
+        limit = baseline[metric] / (1 + tolerance)
+        if report[metric] < limit:
+            regressions.append(f"{metric} {report[metric]:.2f} < {limit:.2f} (baseline {baseline[metric]:.2f})")
+    # ステータスの内訳が変わったら性能以前に結果が変わっている
+    if 'statuses' in baseline and report.get('statuses') != baseline['statuses']:
+        regressions.append(f"statuses {report.get('statuses')} != baseline {baseline['statuses']}")
+    return regressions
+
+
+def print_report(report):
+    statuses = ', '.join(f"{status}: {count}" for status, count in sorted(report['statuses'].items()))
+    print(f"\n===== {report['actionGroup']} ({report['events']} events x {report['calls'] // report['events']} iterations) =====")
+    print(
+        f"warm  ops/sec: {report['opsPerSec']:.1f}  p50: {report['p50Ms']:.2f} ms"
+        f"  p99: {report['p99Ms']:.2f} ms  tracemalloc peak: {report['peakKiB']:.1f} KiB"
+    )
+    if 'coldInitMs' in report:
+        print(
+            f"cold  init p50: {report['coldInitMs']:.1f} ms"
+            f"  first call p50: {report['coldFirstCallMs']:.1f} ms  ({report['coldRuns']} runs)"
+        )
+    print(f"statuses  {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay recorded events against each action group lambda_handler'
+    )
+    parser.add_argument(
+        'action_groups',
+        nargs='*',
+        help='Action group names with a corpus in tools/events/ (default: all)',
+    )
+    parser.add_argument('--iterations', '-n', type=int, default=20, help='Warm passes over the corpus')
+    parser.add_argument('--cold-runs', type=int, default=3, help='Number of cold starts (0 to skip)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline JSON file to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative regression (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='Ignore latency differences below this')
+    parser.add_argument('--json', help='Write the full report to this JSON file')
+    parser.add_argument('--child', choices=['warm', 'cold'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        action_group = args.action_groups[0]
+        if args.child == 'warm':
+            result = run_warm(action_group, args.iterations)
+        else:
+            result = run_cold(action_group)
+        print(RESULT_PREFIX + json.dumps(result), flush=True)
+        return 0
+
+    action_groups = args.action_groups or [
+        name for name in list_action_groups() if os.path.isfile(corpus_path(name))
+    ]
+    reports = []
+    for action_group in action_groups:
+        try:
+            report = measure(action_group, args.iterations, args.cold_runs)
+        except RuntimeError as e:
+            print(f"\n===== {action_group} =====\nFailed to run handler: {e}")
+            return 1
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps(reports, indent=2, ensure_ascii=False))
+
+    if args.save_baseline:
+        with open(args.baseline, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps({report['actionGroup']: report for report in reports}, indent=2, ensure_ascii=False))
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.isfile(args.baseline):
+        print(f"\nNo baseline at {args.baseline}. Run with --save-baseline to create one.")
+        return 0
+
+    with open(args.baseline, 'rt', encoding='utf-8') as f:
+        baseline = json.load(f)
+    failed = False
+    print()
+    for report in reports:
+        if report['actionGroup'] not in baseline:
+            continue
+        regressions = compare(report, baseline[report['actionGroup']], args.tolerance, args.min_delta_ms)
+        if regressions:
+            failed = True
+            print(f"REGRESSION {report['actionGroup']}:")
+            for regression in regressions:
+                print(f"  {regression}")
+        else:
+            print(f"OK {report['actionGroup']}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""invoke_agent のイベントストリームを記録・再生するためのヘルパー
+
+1 セッションを 1 ファイル (gzip 圧縮の JSONL) に追記していく。
+各行は以下のいずれか。
+
+    {"type": "request", "agentName": ..., "sessionId": ..., "inputText": ..., "startedAt": ...}
+    {"type": "event", "receivedAt": <epoch 秒>, "elapsed": <リクエストからの秒>, "event": {...}}
+    {"type": "end", "elapsed": <リクエストからの秒>}
+
+同じセッションの次のターンは同じファイルに追記する (gzip のメンバーが増えるだけで、そのまま読める)。
+"""
+import os
+import gzip
+import json
+import time
+import base64
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List
+
+CAPTURE_SUFFIX = '.jsonl.gz'
+
+
+def _default(value: Any) -> Any:
+    # chunk の bytes と trace の eventTime を JSON で表せる形にする
+    if isinstance(value, (bytes, bytearray)):
+        return {'__bytes__': base64.b64encode(bytes(value)).decode('ascii')}
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _object_hook(value: Dict[str, Any]) -> Any:
+    if len(value) == 1:
+        if '__bytes__' in value:
+            return base64.b64decode(value['__bytes__'])
+        if '__datetime__' in value:
+            return datetime.fromisoformat(value['__datetime__'])
+    return value
+
+
+def capture_path(directory: str, agent_name: str, session_id: str) -> str:
+    return os.path.join(directory, f"{agent_name}-{session_id}{CAPTURE_SUFFIX}")
+
+
+class StreamRecorder:
+    """invoke_agent の completion を流しながら、受信したイベントをファイルに追記する"""
+
+    def __init__(self, directory: str, agent_name: str, session_id: str):
+        os.makedirs(directory, exist_ok=True)
+        self.path = capture_path(directory, agent_name, session_id)
+        self.agent_name = agent_name
+        self.session_id = session_id
+
+    def record(self, events: Iterable[Dict[str, Any]], **request: Any) -> Iterator[Dict[str, Any]]:
+        """events をそのまま返しつつ記録する。request はリクエスト行に残す情報"""
+        start = time.perf_counter()
+        with gzip.open(self.path, 'at', encoding='utf-8') as f:
+            self._write(
+                f,
+                {
+                    'type': 'request',
+                    'agentName': self.agent_name,
+                    'sessionId': self.session_id,
+                    'startedAt': time.time(),
+                    **request,
+                },
+            )
+            try:
+                for event in events:
+                    self._write(
+                        f,
+                        {
+                            'type': 'event',
+                            'receivedAt': time.time(),
+                            'elapsed': time.perf_counter() - start,
+                            'event': event,
+                        },
+                    )
+                    yield event
+            finally:
+                self._write(f, {'type': 'end', 'elapsed': time.perf_counter() - start})
+
+    @staticmethod
+    def _write(f, record: Dict[str, Any]) -> None:
+        f.write(json.dumps(record, ensure_ascii=False, default=_default) + '\n')
+
+
+def read_capture(path: str) -> Iterator[Dict[str, Any]]:
+    """記録ファイルの行を順に返す。途中で途切れた最後の行は読み飛ばす"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line, object_hook=_object_hook)
+                except ValueError:
+                    return
+        except EOFError:
+            # 記録中にプロセスが終了した場合など
+            return
+
+
+def capture_files(paths: List[str]) -> List[str]:
+    """ファイルとディレクトリの指定を記録ファイルの一覧に展開する"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                sorted(
+                    os.path.join(path, name)
+                    for name in os.listdir(path)
+                    if name.endswith(CAPTURE_SUFFIX)
+                )
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def split_turns(records: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """記録をターンごとに {'request': ..., 'events': [...], 'end': ...} にまとめる"""
+    turn = None
+    for record in records:
+        if record.get('type') == 'request':
+            if turn is not None:
+                yield turn
+            turn = {'request': record, 'events': [], 'end': None}
+        elif turn is None:
+            continue
+        elif record.get('type') == 'event':
+            turn['events'].append(record)
+        elif record.get('type') == 'end':
+            turn['end'] = record
+    if turn is not None:
+        yield turn
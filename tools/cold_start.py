@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ACTION_GROUPS_DIR = os.path.join(ROOT_DIR, 'action-groups')
+# Lambda レイヤーとして /opt/python に置かれる共有モジュール
+COMMON_DIR = os.path.join(ACTION_GROUPS_DIR, 'common', 'python')
+
+# 子プロセスで index を import し、初期化にかかった時間を出力する
+INIT_SCRIPT = '''
+import time
+start = time.perf_counter()
+import index
+print(time.perf_counter() - start)
+'''
+
+
+def list_action_groups():
+    return sorted(
+        name
+        for name in os.listdir(ACTION_GROUPS_DIR)
+        if os.path.isfile(os.path.join(ACTION_GROUPS_DIR, name, 'lambda', 'index.py'))
+    )
+
+
+def parse_importtime(stderr):
+    """-X importtime の出力から index 配下の import を {モジュール名: (self, cumulative, depth)} で返す
+
+    インタプリタ起動時に読み込まれる site などは除き、index を depth 0 とする。
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+
+    # 出力は後順なので、index の行から遡って depth > 0 の行が index 配下になる
+    modules = {}
+    for position, (name, self_us, cumulative_us, depth) in enumerate(entries):
+        if name == 'index' and depth == 0:
+            modules[name] = (self_us, cumulative_us, 0)
+            for child in reversed(entries[:position]):
+                if child[3] == 0:
+                    break
+                modules[child[0]] = (child[1], child[2], child[3])
+    return modules
+
+
+def measure_once(action_group, python):
+    """新しいインタプリタで index を import し、初期化時間と import 内訳を返す"""
+    lambda_dir = os.path.join(ACTION_GROUPS_DIR, action_group, 'lambda')
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [lambda_dir, os.path.join(lambda_dir, 'lib'), COMMON_DIR, env.get('PYTHONPATH', '')]
+    )
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    # Lambda ではスキーマのレイヤーが /opt/api-schema.yaml に置かれる
+    env['API_SCHEMA_PATH'] = os.path.join(ACTION_GROUPS_DIR, action_group, 'schema', 'api-schema.yaml')
+    completed = subprocess.run(
+        [python, '-X', 'importtime', '-c', INIT_SCRIPT],
+        cwd=lambda_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    init_seconds = float(completed.stdout.strip().splitlines()[-1])
+    return init_seconds, parse_importtime(completed.stderr)
+
+
+def measure(action_group, runs, python):
+    init_times = []
+    imports = {}
+    for _ in range(runs):
+        init_seconds, modules = measure_once(action_group, python)
+        init_times.append(init_seconds * 1000)
+        for name, (self_us, cumulative_us, depth) in modules.items():
+            imports.setdefault(name, []).append((self_us, cumulative_us, depth))
+
+    # 実行ごとのばらつきを抑えるため中央値を使う
+    breakdown = [
+        {
+            'module': name,
+            'selfMs': statistics.median(sample[0] for sample in samples) / 1000,
+            'cumulativeMs': statistics.median(sample[1] for sample in samples) / 1000,
+            'depth': samples[0][2],
+        }
+        for name, samples in imports.items()
+    ]
+    index_ms = next(
+        (entry['cumulativeMs'] for entry in breakdown if entry['module'] == 'index'), 0.0
+    )
+    return {
+        'actionGroup': action_group,
+        'runs': runs,
+        'initMs': {
+            'p50': statistics.median(init_times),
+            'max': max(init_times),
+            'min': min(init_times),
+        },
+        'indexImportMs': index_ms,
+        'breakdown': sorted(breakdown, key=lambda entry: entry['cumulativeMs'], reverse=True),
+    }
+
+
+def print_report(report, top):
+    init = report['initMs']
+    print(f"\n===== {report['actionGroup']} ({report['runs']} runs) =====")
+    print(
+        f"init p50: {init['p50']:.1f} ms  min: {init['min']:.1f} ms  max: {init['max']:.1f} ms"
+        f"  (index import p50: {report['indexImportMs']:.1f} ms)"
+    )
+    print(f"{'cumulative[ms]':>15} {'self[ms]':>10}  module")
+    # index の import 時間に占める割合が大きいものから表示する
+    shown = [entry for entry in report['breakdown'] if entry['module'] != 'index']
+    for entry in shown[:top]:
+        indent = '  ' * (entry['depth'] - 1)
+        print(
+            f"{entry['cumulativeMs']:>15.1f} {entry['selfMs']:>10.1f}  {indent}{entry['module']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure cold start import time of each action group Lambda'
+    )
+    parser.add_argument(
+        'action_groups',
+        nargs='*',
+        help='Action group names under action-groups/ (default: all)',
+    )
+    parser.add_argument('--runs', '-n', type=int, default=5, help='Number of cold starts')
+    parser.add_argument('--top', type=int, default=15, help='Number of modules to show')
+    parser.add_argument('--python', default=sys.executable, help='Python interpreter to use')
+    parser.add_argument('--json', help='Write the full report to this JSON file')
+    args = parser.parse_args()
+
+    reports = []
+    for action_group in args.action_groups or list_action_groups():
+        try:
+            report = measure(action_group, args.runs, args.python)
+        except RuntimeError as e:
+            print(f"\n===== {action_group} =====\nFailed to import index: {e}")
+            continue
+        print_report(report, args.top)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps(reports, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,440 @@
+"""ローカルで全ての Action Group を HTTP で呼び出せるようにするゲートウェイ
+
+action-groups/*/schema/api-schema.yaml を読み込み、Bedrock Agents と同じように
+apiPath と httpMethod で lambda_handler に振り分ける。
+
+    GET  /hr/select?sql=SELECT+*+FROM+employees
+    GET  /python-coder/code/test?code=...&test_code=...
+    POST /<action group><apiPath>  (JSON の本文は requestBody として渡す)
+
+lambda_handler はワーカー (既定ではプロセス) のプールで実行する。
+1 つのワーカーが 1 つの Lambda の実行環境に相当し、最初の呼び出しがコールドスタートになる。
+AWS のクライアントは tools/handlers.py のローカルの代替実装に差し替えるので、認証情報は不要。
+
+ルートごとのレイテンシは GET /_stats で取得でき、終了時にも表示する。
+--replay を付けると tools/events/*.jsonl を並列に送って負荷をかけ、結果を表示して終了する。
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import contextlib
+import concurrent.futures
+import urllib.error
+import urllib.request
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from handlers import (
+    ACTION_GROUPS_DIR,
+    list_action_groups,
+    load_handler,
+    build_event,
+    load_corpus,
+    response_status,
+)
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+EVENTS_DIR = os.path.join(TOOLS_DIR, 'events')
+HTTP_METHODS = ('get', 'post', 'put', 'patch', 'delete')
+# レイテンシを保持する件数の上限 (長時間動かしてもメモリが増え続けないようにする)
+MAX_SAMPLES = 10000
+
+
+def load_routes(action_groups):
+    """{(METHOD, /<action group><apiPath>): {actionGroup, apiPath, httpMethod, parameters}} を作る"""
+    # PyYAML はゲートウェイでしか使わないので、ここで読み込む
+    import yaml
+
+    routes = {}
+    for action_group in action_groups:
+        schema_path = os.path.join(ACTION_GROUPS_DIR, action_group, 'schema', 'api-schema.yaml')
+        if not os.path.isfile(schema_path):
+            continue
+        with open(schema_path, 'rt', encoding='utf-8') as f:
+            schema = yaml.safe_load(f)
+        for api_path, operations in (schema.get('paths') or {}).items():
+            for method, operation in operations.items():
+                if method not in HTTP_METHODS:
+                    continue
+                parameters = {
+                    parameter['name']: parameter.get('schema', {}).get('type', 'string')
+                    for parameter in operation.get('parameters', [])
+                }
+                routes[(method.upper(), f"/{action_group}{api_path}")] = {
+                    'actionGroup': action_group,
+                    'apiPath': api_path,
+                    'httpMethod': method.upper(),
+                    'parameters': parameters,
+                }
+    return routes
+
+
+def build_payload(route, query, body):
+    """HTTP のクエリと本文から build_event に渡す payload を作る"""
+    payload = {
+        'apiPath': route['apiPath'],
+        'httpMethod': route['httpMethod'],
+        'parameters': [
+            {'name': name, 'type': route['parameters'].get(name, 'string'), 'value': value}
+            for name, value in query
+        ],
+    }
+    if body:
+        payload['requestBody'] = {
+            'content': {
+                'application/json': {
+                    'properties': [
+                        {
+                            'name': name,
+                            'type': 'string',
+                            'value': value if isinstance(value, str) else json.dumps(value, ensure_ascii=False),
+                        }
+                        for name, value in body.items()
+                    ]
+                }
+            }
+        }
+    return payload
+
+
+# ---- ワーカー ----
+
+_handlers = {}
+
+
+class QuietStdout:
+    """lambda_handler を実行しているスレッドの print だけを捨てる sys.stdout
+
+    redirect_stdout はプロセス全体の sys.stdout を差し替えるため、スレッドのワーカーが
+    同時に使うと他のスレッドが閉じた devnull を戻してしまう。1 度だけ差し替えて、スレッドごとに切り替える。
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        if getattr(self.local, 'quiet', False):
+            return len(text)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    @contextlib.contextmanager
+    def quiet(self):
+        self.local.quiet = True
+        try:
+            yield
+        finally:
+            self.local.quiet = False
+
+
+def quiet_stdout():
+    if not isinstance(sys.stdout, QuietStdout):
+        sys.stdout = QuietStdout(sys.stdout)
+    return sys.stdout.quiet()
+
+
+def init_worker(action_groups):
+    """ワーカーごとに lambda_handler を読み込む (Lambda の初期化フェーズに相当)"""
+    with quiet_stdout():
+        for action_group in action_groups:
+            _handlers[action_group] = load_handler(action_group)
+
+
+def call_handler(action_group, event, submitted_at):
+    """ワーカーで lambda_handler を呼び、(レスポンス, キュー待ちミリ秒, 実行ミリ秒) を返す"""
+    started_at = time.time()
+    with quiet_stdout():
+        if action_group not in _handlers:
+            _handlers[action_group] = load_handler(action_group)
+        start = time.perf_counter()
+        response = _handlers[action_group].lambda_handler(event, None)
+    elapsed = (time.perf_counter() - start) * 1000
+    return response, (started_at - submitted_at) * 1000, elapsed
+
+
+def create_executor(mode, workers, action_groups):
+    if mode == 'thread':
+        init_worker(action_groups)
+        return concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(action_groups,)
+    )
+
+
+# ---- 計測 ----
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class RouteStats:
+    """ルートごとのリクエスト数、エラー数、レイテンシ"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, status, total_ms, queue_ms, handler_ms):
+        with self.lock:
+            stats = self.routes.setdefault(
+                route, {'count': 0, 'errors': 0, 'totalMs': [], 'queueMs': [], 'handlerMs': [], 'statuses': {}}
+            )
+            stats['count'] += 1
+            if status is None or status >= 400:
+                stats['errors'] += 1
+            stats['statuses'][str(status)] = stats['statuses'].get(str(status), 0) + 1
+            for key, value in (('totalMs', total_ms), ('queueMs', queue_ms), ('handlerMs', handler_ms)):
+                if value is None:
+                    continue
+                stats[key].append(value)
+                if len(stats[key]) > MAX_SAMPLES:
+                    del stats[key][0]
+
+    def reset(self):
+        with self.lock:
+            self.routes = {}
+
+    def report(self):
+        with self.lock:
+            report = {}
+            for route, stats in sorted(self.routes.items()):
+                entry = {'count': stats['count'], 'errors': stats['errors'], 'statuses': dict(stats['statuses'])}
+                for key in ('totalMs', 'queueMs', 'handlerMs'):
+                    values = stats[key]
+                    if values:
+                        entry[key] = {
+                            'p50': round(percentile(values, 50), 2),
+                            'p95': round(percentile(values, 95), 2),
+                            'p99': round(percentile(values, 99), 2),
+                            'max': round(max(values), 2),
+                        }
+                report[route] = entry
+            return report
+
+
+def print_stats(report):
+    print(f"{'route':<42} {'count':>6} {'errors':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'queue p50':>10}")
+    for route, entry in report.items():
+        total = entry.get('totalMs', {})
+        queue = entry.get('queueMs', {})
+        print(
+            f"{route[:42]:<42} {entry['count']:>6} {entry['errors']:>6} "
+            f"{total.get('p50', '-'):>9} {total.get('p95', '-'):>9} {total.get('p99', '-'):>9} "
+            f"{queue.get('p50', '-'):>10}"
+        )
+
+
+# ---- HTTP サーバー ----
+
+
+def encode_response(response):
+    """lambda_handler の戻り値を (HTTP ステータス, Content-Type, 本文) にする"""
+    status = response_status(response) or 200
+    if 'response' in response:
+        content = response['response'].get('responseBody') or {}
+        for content_type, value in content.items():
+            if isinstance(value, dict) and isinstance(value.get('body'), str):
+                return status, content_type, value['body']
+            return status, content_type, json.dumps(value, ensure_ascii=False, default=str)
+    return status, 'application/json', json.dumps(response, ensure_ascii=False, default=str)
+
+
+class Gateway:
+    def __init__(self, routes, executor, timeout):
+        self.routes = routes
+        self.executor = executor
+        self.timeout = timeout
+        self.stats = RouteStats()
+
+    def dispatch(self, method, url, body, session_id):
+        """(HTTP ステータス, Content-Type, 本文) を返す"""
+        parts = urlsplit(url)
+        if parts.path == '/_stats':
+            if method == 'DELETE':
+                self.stats.reset()
+            return 200, 'application/json', json.dumps(self.stats.report(), ensure_ascii=False)
+        if parts.path == '/_routes':
+            routes = [f"{route_method} {path}" for route_method, path in sorted(self.routes)]
+            return 200, 'application/json', json.dumps(routes)
+
+        route = self.routes.get((method, parts.path.rstrip('/') or '/'))
+        if route is None:
+            methods = [route_method for route_method, path in self.routes if path == parts.path]
+            if methods:
+                return 405, 'application/json', json.dumps({'error': f"Allowed methods: {', '.join(methods)}"})
+            return 404, 'application/json', json.dumps({'error': f"No route for {parts.path}"})
+
+        try:
+            payload = build_payload(route, parse_qsl(parts.query, keep_blank_values=True), json.loads(body) if body else None)
+        except ValueError as e:
+            return 400, 'application/json', json.dumps({'error': f"Invalid JSON body: {e}"})
+        event = build_event(route['actionGroup'], payload, session_id)
+
+        route_name = f"{method} {parts.path}"
+        start = time.perf_counter()
+        try:
+            future = self.executor.submit(call_handler, route['actionGroup'], event, time.time())
+            response, queue_ms, handler_ms = future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            self.stats.record(route_name, 504, (time.perf_counter() - start) * 1000, None, None)
+            return 504, 'application/json', json.dumps({'error': f"Handler timed out after {self.timeout}s"})
+        except Exception as e:
+            self.stats.record(route_name, 500, (time.perf_counter() - start) * 1000, None, None)
+            return 500, 'application/json', json.dumps({'error': f"{type(e).__name__}: {e}"})
+
+        status, content_type, text = encode_response(response)
+        self.stats.record(route_name, status, (time.perf_counter() - start) * 1000, queue_ms, handler_ms)
+        return status, content_type, text
+
+
+def create_request_handler(gateway):
+    class RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def handle_method(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length).decode('utf-8') if length else ''
+            status, content_type, text = gateway.dispatch(
+                self.command, self.path, body, self.headers.get('X-Session-Id')
+            )
+            data = text.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', f"{content_type}; charset=utf-8")
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_method
+
+        def log_message(self, format, *args):
+            pass
+
+    return RequestHandler
+
+
+# ---- 負荷をかける ----
+
+
+def replay_requests(action_groups):
+    """tools/events/*.jsonl の各行を (METHOD, URL, 本文) にする"""
+    requests = []
+    for action_group in action_groups:
+        path = os.path.join(EVENTS_DIR, f"{action_group}.jsonl")
+        if not os.path.isfile(path):
+            continue
+        for payload in load_corpus(path):
+            parameters = payload.get('parameters', [])
+            if isinstance(parameters, dict):
+                query = list(parameters.items())
+            else:
+                query = [(parameter['name'], parameter['value']) for parameter in parameters]
+            url = f"/{action_group}{payload['apiPath']}"
+            if query:
+                url += '?' + urlencode(query)
+            requests.append((payload.get('httpMethod', 'GET'), url, None))
+    return requests
+
+
+def replay(base_url, requests, total, clients):
+    """clients 本の接続から合計 total 件のリクエストを送り、1 秒あたりの件数を返す"""
+    counter = iter(range(total))
+    lock = threading.Lock()
+
+    def client():
+        session_id = uuid.uuid4().hex
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            method, url, body = requests[index % len(requests)]
+            request = urllib.request.Request(
+                base_url + url, data=body, method=method, headers={'X-Session-Id': session_id}
+            )
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+            except urllib.error.HTTPError as e:
+                e.read()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve every action group lambda_handler over HTTP, routed by its OpenAPI schema'
+    )
+    parser.add_argument('action_groups', nargs='*', help='Action groups to serve (default: all)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', '-p', type=int, default=8080)
+    parser.add_argument('--workers', '-w', type=int, default=4, help='Number of handler workers')
+    parser.add_argument('--mode', choices=['process', 'thread'], default='process', help='Worker pool type')
+    parser.add_argument('--timeout', type=float, default=30, help='Handler timeout in seconds (Lambda timeout)')
+    parser.add_argument('--replay', action='store_true', help='Replay tools/events/*.jsonl against the gateway and exit')
+    parser.add_argument('--requests', '-n', type=int, default=200, help='Number of requests with --replay')
+    parser.add_argument('--clients', '-c', type=int, default=8, help='Concurrent clients with --replay')
+    parser.add_argument('--json', help='Write the per-route stats to this JSON file on exit')
+    args = parser.parse_args()
+
+    action_groups = args.action_groups or list_action_groups()
+    unknown = set(action_groups) - set(list_action_groups())
+    if unknown:
+        parser.error(f"Unknown action groups: {', '.join(sorted(unknown))}")
+
+    routes = load_routes(action_groups)
+    executor = create_executor(args.mode, args.workers, action_groups)
+    gateway = Gateway(routes, executor, args.timeout)
+    server = ThreadingHTTPServer((args.host, 0 if args.replay else args.port), create_request_handler(gateway))
+    server.daemon_threads = True
+    base_url = f"http://{args.host}:{server.server_address[1]}"
+
+    try:
+        if args.replay:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            requests = replay_requests(action_groups)
+            if not requests:
+                print('No events to replay.')
+                return 1
+            print(f"Replaying {args.requests} requests from {args.clients} clients ({args.workers} {args.mode} workers)")
+            throughput = replay(base_url, requests, args.requests, args.clients)
+            print(f"{throughput:.1f} requests/sec")
+        else:
+            for method, path in sorted(routes):
+                print(f"{method:<6} {base_url}{path}")
+            print(f"Serving {len(routes)} routes with {args.workers} {args.mode} workers (stats: {base_url}/_stats)")
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        executor.shutdown(cancel_futures=True)
+        report = gateway.stats.report()
+        if report:
+            print_stats(report)
+        if args.json:
+            with open(args.json, 'wt', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""ローカルで Action Group の lambda_handler を読み込むためのヘルパー
+
+AWS に接続せずに動かせるよう、S3 / Athena のクライアントを
+ローカルの代替実装 (stand-in) に差し替える。
+"""
+import os
+import sys
+import json
+import uuid
+import hashlib
+import importlib.util
+from datetime import datetime, timezone
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ACTION_GROUPS_DIR = os.path.join(ROOT_DIR, 'action-groups')
+# Lambda レイヤーとして /opt/python に置かれる共有モジュール
+COMMON_DIR = os.path.join(ACTION_GROUPS_DIR, 'common', 'python')
+DATA_SOURCE_DIR = os.path.join(ROOT_DIR, 'data-source')
+
+LOCAL_BUCKET = 'local-bucket'
+LOCAL_DOC_DATA_PREFIX = 'data/'
+
+
+def list_action_groups():
+    return sorted(
+        name
+        for name in os.listdir(ACTION_GROUPS_DIR)
+        if os.path.isfile(os.path.join(ACTION_GROUPS_DIR, name, 'lambda', 'index.py'))
+    )
+
+
+class LocalClientError(Exception):
+    """botocore の ClientError の代わり"""
+
+
+class LocalExceptions:
+    ClientError = LocalClientError
+
+
+class LocalS3Client:
+    """ローカルディレクトリを S3 バケットに見立てたクライアント"""
+
+    exceptions = LocalExceptions
+
+    def __init__(self, objects=None):
+        # {key: bytes}
+        self.objects = dict(objects or {})
+        self.modified = {key: datetime.now(timezone.utc) for key in self.objects}
+
+    @classmethod
+    def from_directory(cls, directory, prefix):
+        objects = {}
+        for current, _, files in os.walk(directory):
+            for file_name in files:
+                path = os.path.join(current, file_name)
+                key = prefix + os.path.relpath(path, directory).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    objects[key] = f.read()
+        return cls(objects)
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        contents = [
+            {
+                'Key': key,
+                'LastModified': self.modified[key],
+                'Size': len(body),
+                'ETag': f'"{uuid.uuid5(uuid.NAMESPACE_URL, key).hex}"',
+            }
+            for key, body in sorted(self.objects.items())
+            if key.startswith(Prefix or '')
+        ]
+        response = {'KeyCount': len(contents), 'IsTruncated': False}
+        if contents:
+            response['Contents'] = contents
+        return response
+
+    def get_object(self, Bucket, Key, **kwargs):
+        if Key not in self.objects:
+            raise LocalClientError(f"NoSuchKey: {Key}")
+        return {'Body': _Body(self.objects[Key]), 'LastModified': self.modified[Key]}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        if Key not in self.objects:
+            raise LocalClientError(f"NoSuchKey: {Key}")
+        return {'ETag': f'"{hashlib.md5(self.objects[Key]).hexdigest()}"', 'LastModified': self.modified[Key]}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body if isinstance(Body, bytes) else Body.encode('utf-8')
+        self.modified[Key] = datetime.now(timezone.utc)
+        return {}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        return f"https://{Params['Bucket']}.s3.local/{Params['Key']}?X-Amz-Expires={ExpiresIn}"
+
+
+class _Body:
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return self._data
+
+
+class LocalAthenaClient:
+    """固定の結果を返す Athena クライアント
+
+    クエリは即座に SUCCEEDED になり、rows 行の結果セットを返す。
+    """
+
+    exceptions = LocalExceptions
+
+    def __init__(self, rows=100, scanned_bytes=10 * 1024 * 1024):
+        self.rows = rows
+        self.scanned_bytes = scanned_bytes
+        self.queries = {}
+
+    def start_query_execution(self, QueryString, **kwargs):
+        query_execution_id = str(uuid.uuid4())
+        self.queries[query_execution_id] = QueryString
+        return {'QueryExecutionId': query_execution_id}
+
+    def get_query_execution(self, QueryExecutionId):
+        return {
+            'QueryExecution': {
+                'QueryExecutionId': QueryExecutionId,
+                'Query': self.queries.get(QueryExecutionId, ''),
+                'Status': {'State': 'SUCCEEDED'},
+                'Statistics': {
+                    'DataScannedInBytes': self.scanned_bytes,
+                    'EngineExecutionTimeInMillis': 0,
+                    'QueryQueueTimeInMillis': 0,
+                    'TotalExecutionTimeInMillis': 0,
+                },
+            }
+        }
+
+    def get_query_results(self, QueryExecutionId, **kwargs):
+        columns = ['identity', 'modelid', 'input_tokens', 'output_tokens']
+        header = {'Data': [{'VarCharValue': column} for column in columns]}
+        rows = [
+            {
+                'Data': [
+                    {'VarCharValue': f'arn:aws:iam::123456789012:role/user-{i % 7}'},
+                    {'VarCharValue': 'anthropic.claude-3-5-sonnet-20241022-v2:0'},
+                    {'VarCharValue': str(1000 + i)},
+                    {'VarCharValue': str(200 + i)},
+                ]
+            }
+            for i in range(self.rows)
+        ]
+        return {
+            'ResultSet': {
+                'Rows': [header] + rows,
+                'ResultSetMetadata': {
+                    'ColumnInfo': [{'Label': column, 'Name': column} for column in columns]
+                },
+            }
+        }
+
+    def stop_query_execution(self, QueryExecutionId):
+        return {}
+
+
+def handler_path(action_group):
+    return os.path.join(ACTION_GROUPS_DIR, action_group, 'lambda')
+
+
+def load_handler(action_group):
+    """action-groups/<action_group>/lambda/index.py を読み込み、AWS クライアントを差し替える
+
+    index.py はどの Action Group も同じ名前なので、モジュール名を Action Group ごとに分ける。
+    """
+    lambda_dir = handler_path(action_group)
+    for path in (COMMON_DIR, os.path.join(lambda_dir, 'lib'), lambda_dir):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    # contract-searcher は import 時に環境変数を読むため、先に設定しておく
+    os.environ.setdefault('CONTRACT_BUCKET', LOCAL_BUCKET)
+    os.environ.setdefault('DOC_DATA_PREFIX', LOCAL_DOC_DATA_PREFIX)
+    # EMF のメトリクスは標準出力に書かず、メモリに残す (apt_common.get_sink() で参照できる)
+    os.environ.setdefault('METRICS_SINK', 'memory')
+    # bedrock-logs-watcher のテーブルの日付パーティション (lib/constructs/bedrock-logs-watcher.ts)
+    os.environ.setdefault('PARTITION_COLUMN', 'dt')
+    # パラメータの検証に使うスキーマ (Lambda ではレイヤーの /opt/api-schema.yaml)。import 時に読まれる
+    os.environ['API_SCHEMA_PATH'] = os.path.join(ACTION_GROUPS_DIR, action_group, 'schema', 'api-schema.yaml')
+
+    module_name = f"{action_group.replace('-', '_')}_index"
+    spec = importlib.util.spec_from_file_location(
+        module_name, os.path.join(lambda_dir, 'index.py')
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    install_stand_ins(module)
+    return module
+
+
+def install_stand_ins(module):
+    """モジュールの AWS クライアント取得関数をローカルの代替実装に差し替える"""
+    if hasattr(module, 'get_s3_client'):
+        s3_client = LocalS3Client.from_directory(
+            os.path.join(DATA_SOURCE_DIR, 'contract-searcher', 'templates'),
+            os.environ['DOC_DATA_PREFIX'],
+        )
+        module.get_s3_client = lambda: s3_client
+        if hasattr(module, 'contract_index'):
+            # /search のインデックスは cdk deploy の時に作られるので、同じものをローカルのバケットに置く
+            index = module.contract_index.build_from_directory(
+                os.path.join(DATA_SOURCE_DIR, 'contract-searcher', 'templates'),
+                os.environ['DOC_DATA_PREFIX'],
+            )
+            s3_client.put_object(
+                Bucket=LOCAL_BUCKET,
+                Key=module.contract_index.CONTRACT_INDEX_KEY,
+                Body=module.contract_index.dump_index(index),
+            )
+    if hasattr(module, 'get_athena_client'):
+        athena_client = LocalAthenaClient()
+        module.get_athena_client = lambda: athena_client
+
+
+def build_event(action_group, payload, session_id=None):
+    """コーパスの apiPath / parameters から Bedrock Agents 形式のイベントを組み立てる"""
+    parameters = payload.get('parameters', [])
+    if isinstance(parameters, dict):
+        parameters = [
+            {'name': name, 'type': 'string', 'value': value}
+            for name, value in parameters.items()
+        ]
+    event = {
+        'messageVersion': '1.0',
+        'parameters': parameters,
+        'inputText': payload.get('inputText', ''),
+        'apiPath': payload['apiPath'],
+        'httpMethod': payload.get('httpMethod', 'GET'),
+        'sessionId': session_id or payload.get('sessionId') or uuid.uuid4().hex,
+        'agent': {
+            'name': action_group,
+            'version': 'DRAFT',
+            'id': 'LOCALAGENT',
+            'alias': 'TSTALIASID',
+        },
+        'actionGroup': payload.get('actionGroup', action_group),
+        'sessionAttributes': {},
+        'promptSessionAttributes': {},
+    }
+    if 'requestBody' in payload:
+        event['requestBody'] = payload['requestBody']
+    return event
+
+
+def load_corpus(path):
+    """1 行 1 イベントの JSONL を読み込む"""
+    payloads = []
+    with open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                payloads.append(json.loads(line))
+    return payloads
+
+
+def response_status(response):
+    """lambda_handler の戻り値から HTTP ステータスを取り出す"""
+    if 'response' in response:
+        return response['response'].get('httpStatusCode')
+    return response.get('statusCode')
@@ -0,0 +1,329 @@
+"""data-source/ の Markdown を見出しと条項の区切りでチャンクに分割する
+
+Knowledge Base の固定長チャンク分割に任せると条項の途中で切れてしまうため、
+見出しごとのセクションを基本単位にして、その中の条項 (「第N条」) は 1 条ずつのチャンクにする。
+大きすぎるものは段落・行・文で分け、小さすぎるもの (条項以外) は同じ親見出しの中でまとめる。
+各チャンクには Knowledge Base のメタデータ (<チャンク>.metadata.json) を付ける。
+
+変更のあったファイルだけを並列に処理し、結果は data-source-chunks/ 以下に出力する。
+"""
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_SOURCE_DIR = os.path.join(ROOT_DIR, 'data-source')
+DEFAULT_OUTPUT_DIR = os.path.join(ROOT_DIR, 'data-source-chunks')
+# Knowledge Base のデータソースになっているディレクトリ (lib/agents-preparation-toolkit-stack.ts)
+DEFAULT_SOURCES = ['hr', 'product-support', 'contract-searcher/docs']
+# ディレクトリごとのドキュメントの種類 (メタデータの type)
+DOCUMENT_TYPES = {
+    'hr': 'policy',
+    'product-support': 'error-code',
+    'contract-searcher/docs': 'contract',
+}
+
+# チャンク分割の方法を変えたときに全ファイルを作り直すためのバージョン
+CHUNKER_VERSION = 2
+METADATA_SUFFIX = '.metadata.json'
+TEXT_EXTENSIONS = ('.md', '.txt')
+
+HEADING = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+SENTENCE_END = re.compile(r'(?<=[。．！？!?])')
+# 契約書の条項の見出し (action-groups/contract-searcher/lambda/contract_index.py と同じ規則)
+CLAUSE_HEADING = re.compile(r'^第[0-9０-９一二三四五六七八九十百]+条', re.MULTILINE)
+
+
+def parse_sections(text):
+    """Markdown を [(見出しのパス [(level, title)], 本文)] に分ける"""
+    sections = []
+    path = []
+    lines = []
+
+    def flush():
+        body = '\n'.join(lines).strip()
+        if body:
+            sections.append((list(path), body))
+        lines.clear()
+
+    in_code = False
+    for line in text.splitlines():
+        if line.lstrip().startswith('```'):
+            in_code = not in_code
+        match = None if in_code else HEADING.match(line)
+        if match:
+            flush()
+            level = len(match.group(1))
+            path = [heading for heading in path if heading[0] < level] + [(level, match.group(2))]
+        else:
+            lines.append(line)
+    flush()
+    return sections
+
+
+def split_block(block, max_chars):
+    """max_chars を超える塊を行、文、文字数の順で分ける"""
+    if len(block) <= max_chars:
+        return [block]
+    for pattern in ('\n', SENTENCE_END):
+        parts = [part for part in re.split(pattern, block) if part.strip()]
+        if len(parts) > 1:
+            return [piece for part in parts for piece in split_block(part.strip(), max_chars)]
+    return [block[i:i + max_chars] for i in range(0, len(block), max_chars)]
+
+
+def split_clauses(body):
+    """セクションの本文を条項の見出しで分ける。条項がなければ本文をそのまま返す"""
+    starts = [match.start() for match in CLAUSE_HEADING.finditer(body)]
+    if not starts:
+        return [body]
+    if starts[0] > 0:
+        starts.insert(0, 0)
+    return [
+        body[start:end].strip()
+        for start, end in zip(starts, starts[1:] + [len(body)])
+        if body[start:end].strip()
+    ]
+
+
+def pack(blocks, max_chars, separator):
+    """塊を順に詰めて max_chars 以下のチャンクにする"""
+    chunks = []
+    current = ''
+    for block in blocks:
+        if current and len(current) + len(separator) + len(block) > max_chars:
+            chunks.append(current)
+            current = block
+        else:
+            current = f"{current}{separator}{block}" if current else block
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def chunk_sections(sections, max_chars, min_chars):
+    """セクションをチャンク [(見出しのパス, 本文)] にする"""
+    chunks = []
+    for path, body in sections:
+        for unit in split_clauses(body):
+            is_clause = bool(CLAUSE_HEADING.match(unit))
+            if is_clause and len(unit) <= max_chars:
+                # 収まる条項は途中で切らず、前後の条項とも混ぜない
+                chunks.append((path, unit, True))
+                continue
+            paragraphs = [paragraph.strip() for paragraph in re.split(r'\n\s*\n', unit) if paragraph.strip()]
+            blocks = [piece for paragraph in paragraphs for piece in split_block(paragraph, max_chars)]
+            # 段落に収まる行の並びは行単位で詰める
+            for text in pack(blocks, max_chars, '\n\n'):
+                chunks.append((path, text, is_clause))
+
+    # 小さいチャンクは同じ親見出しの次のチャンクとまとめる (条項はまとめない)
+    # grouped のチャンクは path が共通の親見出しで、本文に子の見出しを含む
+    merged = []
+    for path, text, is_clause in chunks:
+        if merged and not is_clause and not merged[-1][3]:
+            previous_path, previous_text, grouped, _ = merged[-1]
+            if grouped or (len(path) > len(previous_path) and path[: len(previous_path)] == previous_path):
+                parent = previous_path
+            else:
+                parent = previous_path[:-1]
+            if parent and path[: len(parent)] == parent and len(previous_text) < min_chars:
+                previous_body = previous_text if grouped else section_heading(previous_path, len(parent)) + previous_text
+                combined = f"{previous_body}\n\n{section_heading(path, len(parent))}{text}".strip()
+                if len(combined) <= max_chars:
+                    merged[-1] = (parent, combined, True, False)
+                    continue
+        merged.append((path, text, False, is_clause))
+    return [(path, text) for path, text, _, _ in merged]
+
+
+def section_heading(path, depth):
+    """まとめたチャンクの中で、子の見出しを残すための行"""
+    return ''.join(f"{'#' * level} {title}\n" for level, title in path[depth:])
+
+
+def render_chunk(document, path, text):
+    """チャンクの先頭に見出しのパスを付け、単体で読んでも文脈がわかるようにする"""
+    lines = [f"{'#' * level} {title}" for level, title in path]
+    if not path:
+        lines = [f"# {os.path.splitext(document)[0]}"]
+    return '\n'.join(lines) + '\n\n' + text.strip() + '\n'
+
+
+def chunk_file(source_path, relative_path, document_type, max_chars, min_chars):
+    """1 ファイルを分割し、[(出力の相対パス, 本文, メタデータ)] を返す"""
+    with open(source_path, 'rt', encoding='utf-8') as f:
+        text = f.read()
+    document = os.path.basename(relative_path)
+    chunks = chunk_sections(parse_sections(text), max_chars, min_chars)
+    stem, extension = os.path.splitext(relative_path)
+    outputs = []
+    for index, (path, body) in enumerate(chunks, 1):
+        section = ' / '.join(title for _, title in path) or os.path.splitext(document)[0]
+        metadata = {
+            'metadataAttributes': {
+                'document': document,
+                'section': section,
+                'type': document_type,
+                'chunk': index,
+                'chunkCount': len(chunks),
+            }
+        }
+        outputs.append(
+            (f"{stem}__{index:03d}{extension}", render_chunk(document, path, body), metadata)
+        )
+    return outputs
+
+
+def process_file(job):
+    """ワーカープロセスで 1 ファイルを分割して書き出し、出力したファイルの一覧を返す"""
+    source_path, relative_path, output_dir, document_type, max_chars, min_chars = job
+    if not relative_path.endswith(TEXT_EXTENSIONS):
+        # テキスト以外はそのまま渡す
+        destination = os.path.join(output_dir, relative_path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(source_path, destination)
+        return relative_path, [relative_path]
+
+    written = []
+    for chunk_path, body, metadata in chunk_file(
+        source_path, relative_path, document_type, max_chars, min_chars
+    ):
+        destination = os.path.join(output_dir, chunk_path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        with open(destination, 'wt', encoding='utf-8') as f:
+            f.write(body)
+        with open(destination + METADATA_SUFFIX, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps(metadata, ensure_ascii=False, indent=2))
+        written.extend([chunk_path, chunk_path + METADATA_SUFFIX])
+    return relative_path, written
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_path(output_root, source):
+    # マニフェストはデータソースとしてアップロードされないよう、出力ディレクトリの外に置く
+    return os.path.join(output_root, f".manifest-{source.replace('/', '-')}.json")
+
+
+def load_manifest(path, settings):
+    try:
+        with open(path, 'rt', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {'settings': settings, 'files': {}}
+    if manifest.get('settings') != settings:
+        # 分割の設定が変わったら全ファイルを作り直す
+        return {'settings': settings, 'files': manifest.get('files', {}), 'stale': True}
+    return manifest
+
+
+def remove_outputs(output_dir, outputs):
+    for relative_path in outputs:
+        try:
+            os.remove(os.path.join(output_dir, relative_path))
+        except FileNotFoundError:
+            pass
+
+
+def prechunk(source, output_root, max_chars, min_chars, jobs, force=False):
+    """source (data-source/ からの相対パス) を output_root/source に分割する"""
+    source_dir = os.path.join(DATA_SOURCE_DIR, source)
+    output_dir = os.path.join(output_root, source)
+    os.makedirs(output_dir, exist_ok=True)
+    settings = {'version': CHUNKER_VERSION, 'maxChars': max_chars, 'minChars': min_chars}
+    manifest = load_manifest(manifest_path(output_root, source), settings)
+    previous = manifest['files']
+    rebuild = force or manifest.get('stale', False)
+
+    current = {}
+    for directory, _, files in os.walk(source_dir):
+        for file_name in sorted(files):
+            if file_name.endswith(METADATA_SUFFIX):
+                continue
+            path = os.path.join(directory, file_name)
+            current[os.path.relpath(path, source_dir).replace(os.sep, '/')] = file_digest(path)
+
+    changed = [
+        relative_path
+        for relative_path, digest in current.items()
+        if rebuild or previous.get(relative_path, {}).get('sha256') != digest
+    ]
+    removed = [relative_path for relative_path in previous if relative_path not in current]
+
+    for relative_path in changed + removed:
+        remove_outputs(output_dir, previous.get(relative_path, {}).get('outputs', []))
+
+    document_type = DOCUMENT_TYPES.get(source, 'document')
+    work = [
+        (
+            os.path.join(source_dir, relative_path),
+            relative_path,
+            output_dir,
+            document_type,
+            max_chars,
+            min_chars,
+        )
+        for relative_path in changed
+    ]
+    files = {
+        relative_path: entry for relative_path, entry in previous.items() if relative_path in current
+    }
+    if work:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for relative_path, outputs in executor.map(process_file, work):
+                files[relative_path] = {'sha256': current[relative_path], 'outputs': outputs}
+
+    with open(manifest_path(output_root, source), 'wt', encoding='utf-8') as f:
+        f.write(json.dumps({'settings': settings, 'files': files}, ensure_ascii=False, indent=2))
+
+    chunk_count = sum(
+        1
+        for entry in files.values()
+        for output in entry['outputs']
+        if not output.endswith(METADATA_SUFFIX)
+    )
+    print(
+        f"{source}: {len(changed)} changed, {len(removed)} removed, "
+        f"{len(current) - len(changed)} unchanged -> {chunk_count} chunks in {os.path.relpath(output_dir, ROOT_DIR)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Split data-source documents on headings and clauses with metadata sidecars'
+    )
+    parser.add_argument(
+        'sources',
+        nargs='*',
+        default=DEFAULT_SOURCES,
+        help='Directories relative to data-source/ (default: all knowledge base data sources)',
+    )
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_DIR, help='Output root directory')
+    parser.add_argument('--max-chars', type=int, default=1200, help='Maximum characters per chunk')
+    parser.add_argument('--min-chars', type=int, default=300, help='Merge chunks smaller than this')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    parser.add_argument('--force', action='store_true', help='Reprocess every file')
+    args = parser.parse_args()
+
+    for source in args.sources:
+        if not os.path.isdir(os.path.join(DATA_SOURCE_DIR, source)):
+            print(f"{source}: not found under data-source/")
+            return 1
+        prechunk(source, args.output, args.max_chars, args.min_chars, args.jobs, args.force)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
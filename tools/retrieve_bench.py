@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_QUERIES = os.path.join(TOOLS_DIR, 'retrieve_queries.json')
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def load_knowledge_bases(session, region, stack_name):
+    """{agentName: knowledgeBaseId} を CloudFormation の出力もしくは agent_ids.json から取得する"""
+    if stack_name:
+        cfn = session.client('cloudformation', region_name=region)
+        outputs = cfn.describe_stacks(StackName=stack_name)['Stacks'][0]['Outputs']
+        ids = [json.loads(output['OutputValue']) for output in outputs if 'agentId' in output['OutputValue']]
+    else:
+        with open('agent_ids.json', 'rt', encoding='utf-8') as f:
+            ids = json.load(f)
+    return {
+        id_info['agentName']: id_info['knowledgeBaseId']
+        for id_info in ids
+        if id_info.get('knowledgeBaseId')
+    }
+
+
+def find_queries(query_sets, agent_name):
+    """接頭辞 (parameter.ts の ENVIRONMENT_CONFIG.prefix) を除いた Agent 名をキーにしたクエリセットから、
+    Agent 名の末尾に一致する最も長いキーのクエリを返す
+    """
+    keys = [key for key in query_sets if agent_name.endswith(key)]
+    return query_sets[max(keys, key=len)] if keys else None
+
+
+def source_uri(result):
+    location = result.get('location', {})
+    uri = (location.get('s3Location') or {}).get('uri', '')
+    # tools/prechunk.py で分割したチャンクは、メタデータの document が元のファイル名
+    document = (result.get('metadata') or {}).get('document')
+    return f"{uri.rsplit('/', 1)[0]}/{document}" if document else uri
+
+
+def recall_at_k(expected, uris):
+    """期待するドキュメントのうち、取得結果に含まれたものの割合"""
+    if not expected:
+        return None
+    found = sum(1 for name in expected if any(uri.endswith('/' + name) for uri in uris))
+    return found / len(expected)
+
+
+class RetrieveBenchmark:
+    def __init__(self, client, knowledge_base_id, k, search_type=None):
+        self.client = client
+        self.knowledge_base_id = knowledge_base_id
+        self.k = k
+        self.search_type = search_type
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = []
+
+    def retrieve(self, query):
+        vector_configuration = {'numberOfResults': self.k}
+        if self.search_type:
+            vector_configuration['overrideSearchType'] = self.search_type
+        start = time.perf_counter()
+        try:
+            response = self.client.retrieve(
+                knowledgeBaseId=self.knowledge_base_id,
+                retrievalQuery={'text': query},
+                retrievalConfiguration={'vectorSearchConfiguration': vector_configuration},
+            )
+        except Exception as e:
+            with self.lock:
+                self.errors.append(str(e))
+            return None
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies.append(elapsed * 1000)
+        return [source_uri(result) for result in response.get('retrievalResults', [])]
+
+    def run(self, queries, repeat, concurrency):
+        """全クエリを repeat 回、concurrency 並列で投げ、レイテンシと recall@k を集計する"""
+        jobs = [query for _ in range(repeat) for query in queries]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda query: self.retrieve(query['query']), jobs))
+        wall = time.perf_counter() - start
+
+        # 検索結果は繰り返しても同じなので、recall は 1 周目の結果で計算する
+        recalls = []
+        details = []
+        for query, uris in zip(queries, results[: len(queries)]):
+            recall = recall_at_k(query.get('expected', []), uris or [])
+            if recall is not None and uris is not None:
+                recalls.append(recall)
+            details.append({'query': query['query'], 'recall': recall, 'sources': uris})
+
+        return {
+            'k': self.k,
+            'calls': len(jobs),
+            'errors': len(self.errors),
+            'p50Ms': percentile(self.latencies, 50) if self.latencies else None,
+            'p95Ms': percentile(self.latencies, 95) if self.latencies else None,
+            'throughput': len(self.latencies) / wall if wall else 0.0,
+            'recallAtK': sum(recalls) / len(recalls) if recalls else None,
+            'queries': details,
+        }
+
+
+def print_report(agent_name, report, verbose):
+    p50 = f"{report['p50Ms']:.0f}" if report['p50Ms'] is not None else '-'
+    p95 = f"{report['p95Ms']:.0f}" if report['p95Ms'] is not None else '-'
+    recall = f"{report['recallAtK']:.2f}" if report['recallAtK'] is not None else '-'
+    print(
+        f"{agent_name:<32} k={report['k']:<3} p50: {p50:>5} ms  p95: {p95:>5} ms"
+        f"  throughput: {report['throughput']:.1f} req/s  recall@{report['k']}: {recall}"
+        f"  errors: {report['errors']}/{report['calls']}"
+    )
+    if verbose:
+        for detail in report['queries']:
+            recall = f"{detail['recall']:.2f}" if detail['recall'] is not None else '-'
+            sources = ', '.join(os.path.basename(uri) for uri in detail['sources'] or [])
+            print(f"    [{recall}] {detail['query']} -> {sources}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark knowledge base retrieval latency and recall with the retrieve API'
+    )
+    parser.add_argument('--region', '-r', required=True, help='region')
+    parser.add_argument(
+        '--stack-name', '-s', help='Cfn Stack Name (default: read knowledgeBaseId from agent_ids.json)'
+    )
+    parser.add_argument('--queries', default=DEFAULT_QUERIES, help='Query set JSON keyed by agent name without the environment prefix')
+    parser.add_argument(
+        '-k', '--number-of-results', type=int, nargs='+', default=[5], help='numberOfResults to compare'
+    )
+    parser.add_argument('--concurrency', '-c', type=int, default=4, help='Concurrent retrieve calls')
+    parser.add_argument('--repeat', type=int, default=3, help='Passes over the query set')
+    parser.add_argument('--search-type', choices=['HYBRID', 'SEMANTIC'], help='overrideSearchType')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Print recall and sources per query')
+    parser.add_argument('--json', help='Write the full report to this JSON file')
+    args = parser.parse_args()
+
+    import boto3
+    from botocore.config import Config
+
+    session = boto3.Session()
+    knowledge_bases = load_knowledge_bases(session, args.region, args.stack_name)
+    if not knowledge_bases:
+        print('No knowledge bases found. Run 1_sync.py first or pass --stack-name.')
+        return 1
+    with open(args.queries, 'rt', encoding='utf-8') as f:
+        query_sets = json.load(f)
+
+    client = session.client(
+        'bedrock-agent-runtime',
+        region_name=args.region,
+        # 並列数ぶんの接続を使い回せるようにする
+        config=Config(max_pool_connections=max(args.concurrency, 10)),
+    )
+    reports = []
+    for agent_name, knowledge_base_id in knowledge_bases.items():
+        queries = find_queries(query_sets, agent_name)
+        if not queries:
+            print(f"{agent_name:<32} no queries in {args.queries}, skipped")
+            continue
+        for k in args.number_of_results:
+            benchmark = RetrieveBenchmark(client, knowledge_base_id, k, args.search_type)
+            report = benchmark.run(queries, args.repeat, args.concurrency)
+            print_report(agent_name, report, args.verbose)
+            reports.append({'agentName': agent_name, 'knowledgeBaseId': knowledge_base_id, **report})
+
+    if args.json:
+        with open(args.json, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps(reports, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
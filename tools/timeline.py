@@ -0,0 +1,293 @@
+"""invoke_agent のトレースと Action Group の Lambda の区間を sessionId で突き合わせ、タイムラインにする
+
+2_invoke.py --capture で記録したイベントストリームから、ターンごとのモデル呼び出しと
+Action Group / Knowledge Base の呼び出しの区間を取り出す。
+Lambda 側は apt_common.metrics が出力するログの行 (sessionId と spans を含む) を、
+ファイル (--spans) もしくは CloudWatch Logs (--log-group) から読む。
+
+結果は Chrome のトレースイベント形式の JSON (chrome://tracing や Perfetto で開ける) に書き出し、
+ターンごとにモデル・Action Group・Lambda の時間の内訳を表示する。
+"""
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+
+from capture import read_capture, capture_files, split_turns
+
+# タイムライン上の行
+LANES = {
+    'turn': (1, 'agent turn'),
+    'model': (2, 'model'),
+    'invocation': (3, 'action group / knowledge base'),
+    'handler': (4, 'lambda handler'),
+    'lambda': (5, 'lambda spans'),
+}
+TRACE_PHASES = ['preProcessingTrace', 'orchestrationTrace', 'postProcessingTrace']
+# Lambda のログを探すときに、ターンの前後に広げる時間 (秒)
+LOG_SEARCH_MARGIN = 60
+
+
+def event_time(record):
+    """トレースの eventTime (サーバー側の時刻) を優先し、なければ受信時刻を使う"""
+    trace = record['event'].get('trace', {})
+    value = trace.get('eventTime')
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return record['receivedAt']
+
+
+def invocation_name(invocation_input):
+    action_group = invocation_input.get('actionGroupInvocationInput')
+    if action_group:
+        return f"{action_group.get('actionGroupName')} {action_group.get('apiPath') or action_group.get('function') or ''}".strip()
+    if invocation_input.get('knowledgeBaseLookupInput'):
+        return f"knowledge base {invocation_input['knowledgeBaseLookupInput'].get('knowledgeBaseId', '')}".strip()
+    return invocation_input.get('invocationType', 'invocation')
+
+
+def trace_spans(turn):
+    """1 ターンの記録から [{'lane', 'name', 'start', 'end', 'args'}] を作る"""
+    request = turn['request']
+    start = request['startedAt']
+    if turn['end']:
+        end = start + turn['end']['elapsed']
+    else:
+        # 記録が途中で終わっている場合は最後のイベントまでとする
+        end = turn['events'][-1]['receivedAt'] if turn['events'] else start
+    spans = [
+        {
+            'lane': 'turn',
+            'name': request.get('inputText', '')[:60] or 'turn',
+            'start': start,
+            'end': end,
+            'args': {'inputText': request.get('inputText')},
+        }
+    ]
+
+    opened = {}
+    for record in turn['events']:
+        at = event_time(record)
+        event = record['event']
+        if 'chunk' in event:
+            spans.append({'lane': 'turn', 'name': 'chunk', 'start': record['receivedAt'], 'end': None, 'args': {}})
+            continue
+        details = event.get('trace', {}).get('trace', {})
+        for phase in TRACE_PHASES:
+            part = details.get(phase)
+            if not part:
+                continue
+            if 'modelInvocationInput' in part:
+                trace_id = part['modelInvocationInput'].get('traceId')
+                opened[('model', trace_id)] = (at, phase.replace('Trace', ''))
+            if 'modelInvocationOutput' in part:
+                output = part['modelInvocationOutput']
+                begin, name = opened.pop(('model', output.get('traceId')), (None, phase))
+                if begin is not None:
+                    usage = output.get('metadata', {}).get('usage', {})
+                    spans.append({'lane': 'model', 'name': name, 'start': begin, 'end': at, 'args': usage})
+            if 'invocationInput' in part:
+                invocation_input = part['invocationInput']
+                opened[('invocation', invocation_input.get('traceId'))] = (at, invocation_name(invocation_input))
+            if 'observation' in part:
+                observation = part['observation']
+                begin, name = opened.pop(('invocation', observation.get('traceId')), (None, None))
+                if begin is not None:
+                    spans.append(
+                        {'lane': 'invocation', 'name': name, 'start': begin, 'end': at, 'args': {'type': observation.get('type')}}
+                    )
+
+    # 出力が記録されていない区間は開始時点だけを残す
+    for (kind, _), (begin, name) in opened.items():
+        spans.append({'lane': kind, 'name': f"{name} (no output)", 'start': begin, 'end': None, 'args': {}})
+    return spans
+
+
+def parse_log_line(line):
+    """apt_common.metrics が出力した行を dict にする。タイムスタンプなどの前置きは読み飛ばす"""
+    position = line.find('{')
+    if position < 0:
+        return None
+    try:
+        document = json.loads(line[position:])
+    except ValueError:
+        return None
+    if isinstance(document, dict) and document.get('sessionId') and document.get('spans'):
+        return document
+    return None
+
+
+def load_span_files(paths):
+    """JSON Lines のログ、もしくは filter-log-events の出力 ({"events": [{"message": ...}]}) を読む"""
+    documents = []
+    for path in paths:
+        with open(path, 'rt', encoding='utf-8') as f:
+            text = f.read()
+        try:
+            exported = json.loads(text)
+        except ValueError:
+            exported = None
+        if isinstance(exported, dict) and 'events' in exported:
+            lines = [event.get('message', '') for event in exported['events']]
+        else:
+            lines = text.splitlines()
+        documents.extend(document for document in map(parse_log_line, lines) if document)
+    return documents
+
+
+def fetch_log_spans(session, region, log_groups, session_id, start, end):
+    """CloudWatch Logs から sessionId の行を取得する"""
+    logs = session.client('logs', region_name=region)
+    documents = []
+    for log_group in log_groups:
+        paginator = logs.get_paginator('filter_log_events')
+        pages = paginator.paginate(
+            logGroupName=log_group,
+            filterPattern=f'{{ $.sessionId = "{session_id}" }}',
+            startTime=int((start - LOG_SEARCH_MARGIN) * 1000),
+            endTime=int((end + LOG_SEARCH_MARGIN) * 1000),
+        )
+        for page in pages:
+            documents.extend(
+                document for document in map(parse_log_line, (event['message'] for event in page['events'])) if document
+            )
+    return documents
+
+
+def lambda_spans(documents, start, end):
+    """ターンの時間内に始まった Lambda の区間を取り出す"""
+    spans = []
+    for document in documents:
+        for span in document['spans']:
+            if not start - 1 <= span['start'] <= end + 1:
+                continue
+            spans.append(
+                {
+                    'lane': 'handler' if span['name'] == 'handler' else 'lambda',
+                    'name': f"{document.get('ActionGroup')} {document.get('ApiPath')}"
+                    if span['name'] == 'handler'
+                    else span['name'],
+                    'start': span['start'],
+                    'end': span['start'] + span['durationMs'] / 1000,
+                    'args': {
+                        key: document.get(key)
+                        for key in ('ColdStart', 'ResponseBytes', 'RowsReturned', 'httpStatusCode')
+                        if key in document
+                    },
+                }
+            )
+    return spans
+
+
+def total_ms(spans, lane):
+    return sum(
+        ((span['end'] - span['start']) * 1000 for span in spans if span['lane'] == lane and span['end'] is not None),
+        0.0,
+    )
+
+
+def summarize(spans):
+    """ターンの時間をモデル、Lambda の中、Lambda の外 (Action Group 呼び出しの残り)、その他に分ける"""
+    turn = next(span for span in spans if span['lane'] == 'turn' and span['end'] is not None)
+    total = (turn['end'] - turn['start']) * 1000
+    model = total_ms(spans, 'model')
+    invocation = total_ms(spans, 'invocation')
+    handler = total_ms(spans, 'handler')
+    return {
+        'totalMs': round(total, 1),
+        'modelMs': round(model, 1),
+        'invocationMs': round(invocation, 1),
+        'lambdaMs': round(handler, 1),
+        'invocationOverheadMs': round(max(invocation - handler, 0.0), 1),
+        'otherMs': round(max(total - model - invocation, 0.0), 1),
+    }
+
+
+def chrome_trace(sessions):
+    """[(プロセス名, [spans])] を Chrome のトレースイベント形式にする"""
+    starts = [span['start'] for _, spans in sessions for span in spans]
+    origin = min(starts) if starts else 0.0
+    events = []
+    for pid, (name, spans) in enumerate(sessions, 1):
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': name}})
+        for tid, label in LANES.values():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': label}})
+        for span in spans:
+            event = {
+                'name': span['name'],
+                'cat': span['lane'],
+                'pid': pid,
+                'tid': LANES[span['lane']][0],
+                'ts': round((span['start'] - origin) * 1_000_000),
+                'args': span['args'],
+            }
+            if span['end'] is None:
+                event.update({'ph': 'i', 's': 't'})
+            else:
+                event.update({'ph': 'X', 'dur': round((span['end'] - span['start']) * 1_000_000)})
+            events.append(event)
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Merge captured agent traces with action group Lambda spans into a Chrome trace'
+    )
+    parser.add_argument('captures', nargs='+', help='Capture files or directories (2_invoke.py --capture)')
+    parser.add_argument('--spans', nargs='*', default=[], help='Lambda log files containing apt_common metrics lines')
+    parser.add_argument('--log-group', nargs='*', default=[], help='CloudWatch Logs groups of the action group Lambdas')
+    parser.add_argument('--region', '-r', help='region (required with --log-group)')
+    parser.add_argument('--output', '-o', default='timeline.json', help='Chrome trace output file')
+    args = parser.parse_args()
+
+    files = capture_files(args.captures)
+    if not files:
+        print('No capture files found.')
+        return 1
+    if args.log_group and not args.region:
+        parser.error('--region is required with --log-group')
+
+    documents = load_span_files(args.spans)
+    aws_session = None
+    if args.log_group:
+        import boto3
+
+        aws_session = boto3.Session()
+
+    sessions = []
+    print(
+        f"{'session':<40} {'turn':>4} {'total':>9} {'model':>9} {'invoke':>9} {'lambda':>9} {'overhead':>9} {'other':>9}"
+    )
+    for path in files:
+        turns = list(split_turns(read_capture(path)))
+        if not turns:
+            continue
+        request = turns[0]['request']
+        session_id = request.get('sessionId')
+        session_spans = []
+        for number, turn in enumerate(turns, 1):
+            spans = trace_spans(turn)
+            start, end = spans[0]['start'], spans[0]['end']
+            turn_documents = [document for document in documents if document['sessionId'] == session_id]
+            if aws_session:
+                turn_documents += fetch_log_spans(aws_session, args.region, args.log_group, session_id, start, end)
+            spans += lambda_spans(turn_documents, start, end)
+            session_spans.extend(spans)
+
+            summary = summarize(spans)
+            print(
+                f"{os.path.basename(path)[:40]:<40} {number:>4} {summary['totalMs']:>9} {summary['modelMs']:>9} "
+                f"{summary['invocationMs']:>9} {summary['lambdaMs']:>9} {summary['invocationOverheadMs']:>9} "
+                f"{summary['otherMs']:>9}"
+            )
+        sessions.append((f"{request.get('agentName')} {session_id}", session_spans))
+
+    with open(args.output, 'wt', encoding='utf-8') as f:
+        json.dump(chrome_trace(sessions), f, ensure_ascii=False)
+    print(f"Wrote {args.output} (open with chrome://tracing or https://ui.perfetto.dev)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
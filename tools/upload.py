@@ -0,0 +1,207 @@
+"""data-source/ のファイルを Knowledge Base のバケットへ差分だけアップロードする
+
+ローカルのファイルの MD5 (マルチパートの場合はパートごとの MD5 から計算した値) を
+S3 の ETag と比べ、新規・変更のあったファイルだけを並列にアップロードし、
+ローカルから消えたファイルは S3 からも削除する。
+cdk deploy をせずにドキュメントだけを更新したいときに使う (1_sync.py --upload)。
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# BucketDeployment (aws s3 sync) と同じ既定値にして、ETag を比較できるようにする
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+DELETE_BATCH_SIZE = 1000
+# BucketDeployment がデータソースを置くプレフィックス (lib/constructs/knowledge-base.ts)。
+# 同じバケットにはアクセスログ (AccessLogs/) もあるので、削除はこの下だけにする
+DATA_SOURCE_PREFIX = 'data-source/'
+
+
+def local_etag(path, size):
+    """S3 が付ける ETag と同じ方法でローカルのファイルのハッシュを計算する"""
+    if size < MULTIPART_THRESHOLD:
+        digest = hashlib.md5()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 16), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    part_digests = []
+    with open(path, 'rb') as f:
+        for part in iter(lambda: f.read(MULTIPART_CHUNKSIZE), b''):
+            part_digests.append(hashlib.md5(part).digest())
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+def bucket_name(bucket_arn):
+    return bucket_arn.split(':::', 1)[-1]
+
+
+class DataSourceUploader:
+    def __init__(self, s3, bucket, prefix, local_dir, max_workers=8):
+        if not prefix.startswith(DATA_SOURCE_PREFIX):
+            raise ValueError(f"prefix must be under {DATA_SOURCE_PREFIX}: {prefix!r}")
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.local_dir = local_dir
+        self.max_workers = max_workers
+
+    def local_files(self):
+        """{S3 のキー: (ローカルのパス, サイズ)}"""
+        files = {}
+        for directory, _, names in os.walk(self.local_dir):
+            for name in names:
+                path = os.path.join(directory, name)
+                relative_path = os.path.relpath(path, self.local_dir).replace(os.sep, '/')
+                files[self.prefix + relative_path] = (path, os.path.getsize(path))
+        return files
+
+    def remote_objects(self):
+        """{S3 のキー: (ETag, サイズ)}"""
+        objects = {}
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', []):
+                objects[item['Key']] = (item['ETag'].strip('"'), item['Size'])
+        return objects
+
+    def plan(self):
+        """アップロードするキーと削除するキーを決める"""
+        local = self.local_files()
+        remote = self.remote_objects()
+
+        def needs_upload(key):
+            path, size = local[key]
+            if key not in remote:
+                return 'new'
+            etag, remote_size = remote[key]
+            if size != remote_size or local_etag(path, size) != etag:
+                return 'changed'
+            return None
+
+        # ハッシュの計算もファイル数が多いと時間がかかるので並列にする
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            reasons = dict(zip(local, executor.map(needs_upload, local)))
+        uploads = [(key, local[key][0], reason) for key, reason in reasons.items() if reason]
+        deletes = [key for key in remote if key not in local and key.startswith(DATA_SOURCE_PREFIX)]
+        return {
+            'upload': sorted(uploads),
+            'delete': sorted(deletes),
+            'unchanged': len(local) - len(uploads),
+        }
+
+    def apply(self, plan):
+        from boto3.s3.transfer import TransferConfig
+
+        config = TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD,
+            multipart_chunksize=MULTIPART_CHUNKSIZE,
+        )
+
+        def upload(item):
+            key, path, _ = item
+            self.s3.upload_file(path, self.bucket, key, Config=config)
+            return key
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(upload, plan['upload']))
+
+        for i in range(0, len(plan['delete']), DELETE_BATCH_SIZE):
+            batch = plan['delete'][i:i + DELETE_BATCH_SIZE]
+            response = self.s3.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True},
+            )
+            for error in response.get('Errors', []):
+                print(f"  failed to delete {error['Key']}: {error['Message']}")
+
+
+def upload_data_sources(session, region, ids, max_workers=8, dry_run=False):
+    """CloudFormation の出力の各データソースを差分アップロードし、変更のあった dataSourceId を返す"""
+    from botocore.config import Config
+
+    bra = session.client('bedrock-agent', region_name=region)
+    s3 = session.client(
+        's3',
+        region_name=region,
+        config=Config(max_pool_connections=max(max_workers, 10)),
+    )
+    changed = set()
+    for id_info in ids:
+        data_source_ids = id_info.get('DataSourceId', [])
+        data_dirs = id_info.get('dataDirs', [])
+        if not data_source_ids:
+            continue
+        if len(data_dirs) != len(data_source_ids):
+            # dataDirs を出力する前のスタックではローカルのディレクトリがわからない
+            print(f"{id_info['agentName']}: dataDirs not found in stack outputs, skipped (run cdk deploy)")
+            changed.update(data_source_ids)
+            continue
+
+        for data_source_id, data_dir in zip(data_source_ids, data_dirs):
+            data_source = bra.get_data_source(
+                knowledgeBaseId=id_info['knowledgeBaseId'],
+                dataSourceId=data_source_id,
+            )['dataSource']
+            s3_configuration = data_source['dataSourceConfiguration']['s3Configuration']
+            prefix = (s3_configuration.get('inclusionPrefixes') or [''])[0]
+            if not prefix.startswith(DATA_SOURCE_PREFIX):
+                # プレフィックスがないとバケット全体が対象になり、データソース以外のオブジェクトまで削除してしまう
+                print(
+                    f"{id_info['agentName']}: inclusion prefix {prefix!r} is not under {DATA_SOURCE_PREFIX}, "
+                    "skipped (run cdk deploy)"
+                )
+                continue
+            uploader = DataSourceUploader(
+                s3,
+                bucket_name(s3_configuration['bucketArn']),
+                prefix,
+                os.path.join(ROOT_DIR, data_dir),
+                max_workers,
+            )
+            plan = uploader.plan()
+            print(
+                f"{id_info['agentName']}: {len(plan['upload'])} to upload, "
+                f"{len(plan['delete'])} to delete, {plan['unchanged']} unchanged"
+            )
+            for key, _, reason in plan['upload']:
+                print(f"  {reason:<8} {key}")
+            for key in plan['delete']:
+                print(f"  {'deleted':<8} {key}")
+            if not plan['upload'] and not plan['delete']:
+                continue
+            changed.add(data_source_id)
+            if not dry_run:
+                uploader.apply(plan)
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Upload only new or changed data-source files to the knowledge base buckets'
+    )
+    parser.add_argument('--stack-name', '-s', required=True, help='Cfn Stack Name')
+    parser.add_argument('--region', '-r', required=True, help='region')
+    parser.add_argument('--max-workers', type=int, default=8, help='Parallel uploads')
+    parser.add_argument('--dry-run', action='store_true', help='Only print the changes')
+    args = parser.parse_args()
+
+    import boto3
+
+    session = boto3.Session()
+    cfn = session.client('cloudformation', region_name=args.region)
+    outputs = cfn.describe_stacks(StackName=args.stack_name)['Stacks'][0]['Outputs']
+    ids = [json.loads(output['OutputValue']) for output in outputs if 'agentId' in output['OutputValue']]
+    upload_data_sources(session, args.region, ids, args.max_workers, args.dry_run)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())